@@ -7,17 +7,38 @@ better than lower.
 
 The scope will bre relatively limited to a few languages but this could
 be expanded.
+
+Evaluations can run in parallel, see run_evaluations, and every check is limited in
+time, see check_evaluation_component. Checks that run generated code do so in
+sandbox processes with CPU time, memory and wall clock limits, see SandboxPool.
 """
 
+import atexit
+import contextlib
+import math
+import multiprocessing
+import os
+import shutil
+import signal
 import subprocess
+import sys
+import threading
+import time
 
+from dataclasses import dataclass
 from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
 
 import yaml
 
 from tabulate import tabulate
 
 EVAL_LIST_NAME = "evaluations"  # the top level list in the YAML file
+CHECK_TIMEOUT = 60.0  # seconds a check may take, unless its test case sets "timeout"
+CHECK_CPU_SECONDS = 30  # CPU seconds of generated code, unless set by "cpu_seconds"
+CHECK_MEMORY_MB = 1024  # memory of generated code, unless set by "memory_mb"
+SANDBOX_WORKERS = 2  # sandbox processes kept forked ahead of the checks
 
 
 def check_language(eval_d: dict) -> None:
@@ -67,19 +88,27 @@ def run_code_eval_function(eval_d: dict) -> bool:
     return function_ref() == eval_d["expected_value"]
 
 
-def run_executable(eval_d: dict) -> subprocess.Popen:
+# Checks that execute generated code, which runs in a sandbox process
+SANDBOXED_CHECKS = {
+    "run_code_class_has_property": run_code_class_has_property,
+    "run_code_class_has_property_w_value": run_code_class_has_property_w_value,
+    "run_code_eval_function": run_code_eval_function,
+}
+
+
+def run_executable(eval_d: dict) -> subprocess.CompletedProcess:
+    """Runs an executable, killing it after the timeout of the test case."""
     code_dir = eval_d["project_root"] / "workspace"
     process_args = eval_d["executable_name"].split(" ") + eval_d[
         "executable_arguments"
     ].split(" ")
-    process = subprocess.Popen(
+    # Reading the output while waiting, a full pipe can't block the executable
+    return subprocess.run(
         process_args,
-        bufsize=0,
         cwd=code_dir.absolute(),
         stdout=subprocess.PIPE,
+        timeout=eval_d.get("timeout", CHECK_TIMEOUT),
     )
-    process.wait()
-    return process
 
 
 def check_executable_exits_normally(eval_d: dict) -> bool:
@@ -96,24 +125,219 @@ def check_executable_satisfies_function(eval_d: dict) -> bool:
     output_satisfies: "tf = lambda a : len(a) == 10"
     """
     process = run_executable(eval_d=eval_d)
-    process_output = str(process.communicate()[0].strip(), "utf-8")
+    process_output = str(process.stdout.strip(), "utf-8")
 
     exec(eval_d["output_satisfies"])
     checking_function_ref = locals().get("tf")
     return checking_function_ref(process_output)
 
 
+@dataclass
+class CheckResult:
+    """The outcome of a check run in a sandbox.
+    status is one of passed, failed, error, timeout, cpu_limit, memory_limit or
+    crashed, and detail tells the error, if any."""
+
+    passed: bool
+    status: str
+    detail: str = ""
+    seconds: float = 0.0
+
+
+def _address_space() -> Optional[int]:
+    # The virtual memory of this process in bytes, which RLIMIT_AS applies to
+    with contextlib.suppress(OSError):
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmSize:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def _run_check(conn, check: Callable[[dict], bool], eval_d: dict) -> None:
+    # Runs in a sandbox process, under the limits of the test case
+    import resource
+
+    cpu_seconds = math.ceil(eval_d.get("cpu_seconds", CHECK_CPU_SECONDS))
+    address_space = _address_space()
+    # Limits above the hard limits of the harness can't be set, and are left
+    with contextlib.suppress(ValueError, OSError):
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    with contextlib.suppress(ValueError, OSError):
+        if address_space is not None:
+            # The forked harness is part of the address space, and is not counted
+            limit = address_space + eval_d.get("memory_mb", CHECK_MEMORY_MB) * 2**20
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    start = time.perf_counter()
+    try:
+        passed = bool(check(eval_d))
+        result = CheckResult(passed, "passed" if passed else "failed")
+    except MemoryError:
+        result = CheckResult(False, "memory_limit", "MemoryError")
+    except (Exception, SystemExit) as e:
+        result = CheckResult(False, "error", f"{type(e).__name__}: {e}")
+    result.seconds = time.perf_counter() - start
+    conn.send(result)
+
+
+_sandbox_processes: set["SandboxProcess"] = set()
+
+
+class SandboxProcess:
+    """A forked process that waits for a check, runs it and exits."""
+
+    def __init__(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        # Unflushed output would be written again by the process
+        with contextlib.suppress(Exception):
+            sys.stdout.flush()
+        self.pid = os.fork()
+        if self.pid == 0:
+            self.conn.close()
+            code = 0
+            try:
+                _run_check(child_conn, *child_conn.recv())
+            except BaseException:
+                code = 1
+            finally:
+                with contextlib.suppress(Exception):
+                    sys.stdout.flush()
+                os._exit(code)
+        child_conn.close()
+        _sandbox_processes.add(self)
+
+    def run(self, check: Callable[[dict], bool], eval_d: dict) -> CheckResult:
+        timeout = eval_d.get("timeout", CHECK_TIMEOUT)
+        start = time.perf_counter()
+        result = None
+        try:
+            self.conn.send((check, eval_d))
+            if self.conn.poll(timeout):
+                result = self.conn.recv()
+        except (EOFError, OSError):
+            pass  # The process died, see its exit status
+        if result is None and time.perf_counter() - start >= timeout:
+            os.kill(self.pid, signal.SIGKILL)
+            result = CheckResult(False, "timeout", f"timed out after {timeout}s")
+        _, status, usage = os.wait4(self.pid, 0)
+        self.conn.close()
+        _sandbox_processes.discard(self)
+        if result is None:
+            # The CPU limit sends SIGXCPU, and SIGKILL at the hard limit. The usage is
+            # measured in clock ticks, and may be a little short of the limit
+            cpu_seconds = math.ceil(eval_d.get("cpu_seconds", CHECK_CPU_SECONDS))
+            signum = os.WTERMSIG(status) if os.WIFSIGNALED(status) else None
+            used = usage.ru_utime + usage.ru_stime
+            if signum == signal.SIGXCPU or (
+                signum == signal.SIGKILL and used >= 0.9 * cpu_seconds
+            ):
+                result = CheckResult(False, "cpu_limit", f"used {cpu_seconds}s of CPU")
+            elif signum is not None:
+                result = CheckResult(False, "crashed", f"killed by signal {signum}")
+            else:
+                result = CheckResult(
+                    False, "crashed", f"exited with code {os.WEXITSTATUS(status)}"
+                )
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def close(self) -> None:
+        # The process exits when its pipe closes
+        self.conn.close()
+        _sandbox_processes.discard(self)
+        with contextlib.suppress(ChildProcessError):
+            os.waitpid(self.pid, 0)
+
+
+class SandboxPool:
+    """Sandbox processes, forked ahead so that checks don't wait for them.
+
+    Every check runs in a fresh process, so that generated code can't affect the
+    harness or later checks, limited to the "cpu_seconds" (CHECK_CPU_SECONDS),
+    "memory_mb" (CHECK_MEMORY_MB) and wall clock "timeout" (CHECK_TIMEOUT) of its
+    test case. Without fork(), checks run in this process, without limits.
+    """
+
+    def __init__(self, size: int = SANDBOX_WORKERS):
+        self.size = size
+        self._idle: list[SandboxProcess] = []
+        self._lock = threading.Lock()
+        self._fill()
+
+    def _fill(self) -> None:
+        with self._lock:
+            while len(self._idle) < self.size:
+                self._idle.append(SandboxProcess())
+
+    def run(self, check: Callable[[dict], bool], eval_d: dict) -> CheckResult:
+        """Runs a check in a sandbox process and returns its result."""
+        with self._lock:
+            process = self._idle.pop() if self._idle else None
+        if process is None:
+            process = SandboxProcess()
+        try:
+            return process.run(check, eval_d)
+        finally:
+            self._fill()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for process in idle:
+            process.close()
+
+
+_sandbox_pool: Optional[SandboxPool] = None
+
+
+def _forget_sandboxes() -> None:
+    # Sandbox processes exit when their pipe closes, so forked processes must not
+    # hold the pipes, and start a pool of their own
+    global _sandbox_pool
+    for process in _sandbox_processes:
+        process.conn.close()
+    _sandbox_processes.clear()
+    _sandbox_pool = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_sandboxes)
+
+
+def run_sandboxed(check: Callable[[dict], bool], eval_d: dict) -> CheckResult:
+    """Runs a check that executes generated code in the sandbox pool of this process."""
+    global _sandbox_pool
+    if not hasattr(os, "fork"):
+        passed = check(eval_d)
+        return CheckResult(passed, "passed" if passed else "failed")
+    if _sandbox_pool is None:
+        _sandbox_pool = SandboxPool()
+        atexit.register(_sandbox_pool.close)
+    # Sandbox processes are forked ahead, possibly in another working directory
+    eval_d = dict(eval_d, project_root=Path(eval_d["project_root"]).absolute())
+    return _sandbox_pool.run(check, eval_d)
+
+
 def check_evaluation_component(eval_d: dict) -> bool:
+    """Runs an evaluation component, which fails if it takes longer than the
+    "timeout" of its test case, CHECK_TIMEOUT seconds by default."""
+    test_type = eval_d.get("type")
+    if test_type in SANDBOXED_CHECKS:
+        result = run_sandboxed(SANDBOXED_CHECKS[test_type], eval_d)
+        if result.status not in ("passed", "failed"):
+            print(f"{test_type} {result.status}: {result.detail}")
+        return result.passed
+    try:
+        return _check_evaluation_component(eval_d)
+    except subprocess.TimeoutExpired:
+        print(f"{test_type} timed out after {eval_d.get('timeout', CHECK_TIMEOUT)}s")
+        return False
+
+
+def _check_evaluation_component(eval_d: dict) -> bool:
     """Switch on evaluation components"""
     test_type = eval_d.get("type")
     if test_type == "assert_exists_in_source_code":
         return assert_exists_in_source_code(eval_d)
-    elif test_type == "run_code_class_has_property":
-        return run_code_class_has_property(eval_d)
-    elif test_type == "run_code_class_has_property_w_value":
-        return run_code_class_has_property_w_value(eval_d)
-    elif test_type == "run_code_eval_function":
-        return run_code_eval_function(eval_d)
     # The following are for new code
     elif test_type == "check_executable_exits_normally":
         return check_executable_exits_normally(eval_d)
@@ -136,6 +360,66 @@ def load_evaluations_from_file(file_path):
         print(f"File not found: {file_path}")
 
 
+def _evaluate_in_directory(
+    task: tuple[int, Callable[[dict], list[bool]], dict, Path]
+) -> tuple[int, list[bool]]:
+    # Runs in a process of its own, whose working directory and output are the eval's
+    i, evaluate, eval_ob, directory = task
+    directory.mkdir(parents=True, exist_ok=True)
+    consent_file = Path(".gpte_consent")
+    if consent_file.exists():
+        shutil.copy(consent_file, directory / consent_file)
+    # gpt-engineer stays importable for the processes the evaluation starts
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])
+    )
+    os.chdir(directory)
+    with open("eval_log.txt", "w") as log_file, contextlib.redirect_stdout(log_file):
+        return i, evaluate(eval_ob)
+
+
+def run_evaluations(
+    evals: list[dict],
+    evaluate: Callable[[dict], list[bool]],
+    workers: int = 1,
+    work_dir: str = "evals/runs",
+) -> list[list[bool]]:
+    """Runs the evaluations and returns their results, in the order of the evaluations.
+
+    With a single worker, the evaluations run one by one in the working directory.
+    Otherwise they run in a pool of `workers` processes, each evaluation in a fresh
+    process and its own directory, `work_dir`/<index>_<name>, that project roots are
+    relative to, so that evaluations of the same project don't overwrite each other.
+    The output of an evaluation goes to eval_log.txt in its directory.
+
+    Relative paths in the evaluations other than project roots must be made absolute
+    first. `evaluate` must be picklable, e.g. a function of a module.
+    """
+    if workers <= 1:
+        return [evaluate(eval_ob) for eval_ob in evals]
+
+    tasks = []
+    for i, eval_ob in enumerate(evals):
+        directory = Path(work_dir).absolute() / f"{i}_{eval_ob['name']}"
+        shutil.rmtree(directory, ignore_errors=True)
+        print(f"tail -f {directory / 'eval_log.txt'}")
+        tasks.append((i, evaluate, eval_ob, directory))
+    print()
+
+    results: list[list[bool]] = [[] for _ in evals]
+    # One evaluation per process, so that the code run by checks can't leak into others
+    with multiprocessing.Pool(min(workers, len(evals)), maxtasksperchild=1) as pool:
+        for done, (i, result) in enumerate(
+            pool.imap_unordered(_evaluate_in_directory, tasks), 1
+        ):
+            results[i] = result
+            print(
+                f"[{done}/{len(evals)}] {evals[i]['name']}: "
+                f"{sum(result)}/{len(result)} tests pass"
+            )
+    return results
+
+
 def to_emoji(value: bool) -> str:
     return "\U00002705" if value else "\U0000274C"
 
@@ -1,23 +1,32 @@
+import contextlib
+import functools
 import os
 import subprocess
+import traceback
 
 from pathlib import Path
 
 import typer
 
 from eval_tools import (
+    CHECK_TIMEOUT,
     check_evaluation_component,
     generate_report,
     load_evaluations_from_file,
+    run_evaluations,
 )
 
 from gpt_engineer.core.chat_to_files import parse_chat
+from gpt_engineer.cli.main import run_project
 from gpt_engineer.core.db import DB
+from gpt_engineer.core.steps import Config as StepsConfig
 
 app = typer.Typer()  # creates a CLI app
 
 
-def single_evaluate(eval_ob: dict) -> list[bool]:
+def single_evaluate(
+    eval_ob: dict, in_process: bool = False, check_timeout: float = CHECK_TIMEOUT
+) -> list[bool]:
     """Evaluates a single prompt."""
     print(f"running evaluation: {eval_ob['name']}")
 
@@ -48,25 +57,36 @@ def single_evaluate(eval_ob: dict) -> list[bool]:
     print(f"Modifying code for {eval_ob['project_root']}")
 
     log_path = code_base_abs / "log.txt"
-    log_file = open(log_path, "w")
-    process = subprocess.Popen(
-        [
-            "python",
-            "-u",  # Unbuffered output
-            "-m",
-            "gpt_engineer.cli.main",
-            eval_ob["project_root"],
-            "--steps",
-            "eval_improve_code",
-            "--temperature",
-            "0",
-        ],
-        stdout=log_file,
-        stderr=log_file,
-        bufsize=0,
-    )
-    print(f"waiting for {eval_ob['name']} to finish.")
-    process.wait()  # we want to wait until it finishes.
+    if in_process:
+        # Reuses the imports and the warm AI client of this process
+        print(f"waiting for {eval_ob['name']} to finish.")
+        with open(log_path, "w") as log_file, contextlib.redirect_stdout(log_file):
+            try:
+                run_project(
+                    eval_ob["project_root"], StepsConfig.EVAL_IMPROVE_CODE, temperature=0
+                )
+            except Exception:
+                traceback.print_exc(file=log_file)
+    else:
+        log_file = open(log_path, "w")
+        process = subprocess.Popen(
+            [
+                "python",
+                "-u",  # Unbuffered output
+                "-m",
+                "gpt_engineer.cli.main",
+                eval_ob["project_root"],
+                "--steps",
+                "eval_improve_code",
+                "--temperature",
+                "0",
+            ],
+            stdout=log_file,
+            stderr=log_file,
+            bufsize=0,
+        )
+        print(f"waiting for {eval_ob['name']} to finish.")
+        process.wait()  # we want to wait until it finishes.
 
     # Step 3. Run test of modified code, tests
     print("running tests on modified code")
@@ -74,15 +94,28 @@ def single_evaluate(eval_ob: dict) -> list[bool]:
     for test_case in eval_ob["expected_results"]:
         print(f"checking: {test_case['type']}")
         test_case["project_root"] = Path(eval_ob["project_root"])
+        test_case.setdefault("timeout", check_timeout)
         evaluation_results.append(check_evaluation_component(test_case))
 
     return evaluation_results
 
 
-def run_all_evaluations(eval_list: list[dict]) -> None:
-    results = []
+def run_all_evaluations(
+    eval_list: list[dict],
+    in_process: bool = False,
+    workers: int = 1,
+    check_timeout: float = CHECK_TIMEOUT,
+) -> None:
+    # Parallel evaluations run in directories of their own
     for eval_ob in eval_list:
-        results.append(single_evaluate(eval_ob))
+        eval_ob["code_blob"] = str(Path(eval_ob["code_blob"]).absolute())
+    results = run_evaluations(
+        eval_list,
+        functools.partial(
+            single_evaluate, in_process=in_process, check_timeout=check_timeout
+        ),
+        workers,
+    )
 
     # Step 4. Generate Report
     generate_report(eval_list, results, "evals/IMPROVE_CODE_RESULTS.md")
@@ -91,12 +124,21 @@ def run_all_evaluations(eval_list: list[dict]) -> None:
 @app.command()
 def main(
     test_file_path: str = typer.Argument("evals/existing_code_eval.yaml", help="path"),
+    in_process: bool = typer.Option(
+        False, "--in-process", help="Run gpt-engineer in this process."
+    ),
+    workers: int = typer.Option(
+        4, "--workers", help="Evaluations to run at once, each in its own directory."
+    ),
+    check_timeout: float = typer.Option(
+        CHECK_TIMEOUT, "--check-timeout", help="Seconds a test case may take."
+    ),
 ):
     if not os.path.isfile(test_file_path):
         raise Exception(f"sorry the file: {test_file_path} does not exist.")
 
     eval_list = load_evaluations_from_file(test_file_path)
-    run_all_evaluations(eval_list)
+    run_all_evaluations(eval_list, in_process, workers, check_timeout)
 
 
 if __name__ == "__main__":
@@ -1,22 +1,31 @@
+import contextlib
+import functools
 import os
 import subprocess
+import traceback
 
 from pathlib import Path
 
 import typer
 
 from eval_tools import (
+    CHECK_TIMEOUT,
     check_evaluation_component,
     generate_report,
     load_evaluations_from_file,
+    run_evaluations,
 )
 
+from gpt_engineer.cli.main import run_project
 from gpt_engineer.core.db import DB
+from gpt_engineer.core.steps import Config as StepsConfig
 
 app = typer.Typer()  # creates a CLI app
 
 
-def single_evaluate(eval_ob: dict) -> list[bool]:
+def single_evaluate(
+    eval_ob: dict, in_process: bool = False, check_timeout: float = CHECK_TIMEOUT
+) -> list[bool]:
     """Evaluates a single prompt for creating a new project."""
     print(f"running evaluation: {eval_ob['name']}")
 
@@ -37,25 +46,36 @@ def single_evaluate(eval_ob: dict) -> list[bool]:
 
     # Step 2. Run gpt-engineer
     log_path = code_base_abs / "log.txt"
-    log_file = open(log_path, "w")
-    process = subprocess.Popen(
-        [
-            "python",
-            "-u",  # Unbuffered output
-            "-m",
-            "gpt_engineer.cli.main",
-            eval_ob["project_root"],
-            "--steps",
-            "eval_new_code",
-            "--temperature",
-            "0",
-        ],
-        stdout=log_file,
-        stderr=log_file,
-        bufsize=0,
-    )
-    print(f"waiting for {eval_ob['name']} to finish.")
-    process.wait()  # we want to wait until it finishes.
+    if in_process:
+        # Reuses the imports and the warm AI client of this process
+        print(f"waiting for {eval_ob['name']} to finish.")
+        with open(log_path, "w") as log_file, contextlib.redirect_stdout(log_file):
+            try:
+                run_project(
+                    eval_ob["project_root"], StepsConfig.EVAL_NEW_CODE, temperature=0
+                )
+            except Exception:
+                traceback.print_exc(file=log_file)
+    else:
+        log_file = open(log_path, "w")
+        process = subprocess.Popen(
+            [
+                "python",
+                "-u",  # Unbuffered output
+                "-m",
+                "gpt_engineer.cli.main",
+                eval_ob["project_root"],
+                "--steps",
+                "eval_new_code",
+                "--temperature",
+                "0",
+            ],
+            stdout=log_file,
+            stderr=log_file,
+            bufsize=0,
+        )
+        print(f"waiting for {eval_ob['name']} to finish.")
+        process.wait()  # we want to wait until it finishes.
 
     print("running tests on the newly generated code")
     # test the code with the executable name in the config file
@@ -63,15 +83,25 @@ def single_evaluate(eval_ob: dict) -> list[bool]:
     for test_case in eval_ob["expected_results"]:
         print(f"checking: {test_case['type']}")
         test_case["project_root"] = Path(eval_ob["project_root"])
+        test_case.setdefault("timeout", check_timeout)
         evaluation_results.append(check_evaluation_component(test_case))
 
     return evaluation_results
 
 
-def run_all_evaluations(eval_list: list[dict]) -> None:
-    results = []
-    for eval_ob in eval_list:
-        results.append(single_evaluate(eval_ob))
+def run_all_evaluations(
+    eval_list: list[dict],
+    in_process: bool = False,
+    workers: int = 1,
+    check_timeout: float = CHECK_TIMEOUT,
+) -> None:
+    results = run_evaluations(
+        eval_list,
+        functools.partial(
+            single_evaluate, in_process=in_process, check_timeout=check_timeout
+        ),
+        workers,
+    )
 
     # Step 4. Generate Report
     generate_report(eval_list, results, "evals/EVAL_NEW_CODE_RESULTS.md")
@@ -80,12 +110,21 @@ def run_all_evaluations(eval_list: list[dict]) -> None:
 @app.command()
 def main(
     test_file_path: str = typer.Argument("evals/new_code_eval.yaml", help="path"),
+    in_process: bool = typer.Option(
+        False, "--in-process", help="Run gpt-engineer in this process."
+    ),
+    workers: int = typer.Option(
+        4, "--workers", help="Evaluations to run at once, each in its own directory."
+    ),
+    check_timeout: float = typer.Option(
+        CHECK_TIMEOUT, "--check-timeout", help="Seconds a test case may take."
+    ),
 ):
     if not os.path.isfile(test_file_path):
         raise Exception(f"sorry the file: {test_file_path} does not exist.")
 
     eval_list = load_evaluations_from_file(test_file_path)
-    run_all_evaluations(eval_list)
+    run_all_evaluations(eval_list, in_process, workers, check_timeout)
 
 
 if __name__ == "__main__":
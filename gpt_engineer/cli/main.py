@@ -16,6 +16,8 @@ Main Functionality:
   - Azure endpoint for Azure OpenAI services
   - Using project's preprompts or default ones
   - Verbosity level for logging
+  - Resuming a failed run from the checkpoints of its steps
+- Run projects in-process with `run_project`, for runners of many projects.
 - Interact with AI, databases, and archive processes based on the user-defined parameters.
 
 Notes:
@@ -25,17 +27,27 @@ Notes:
 
 """
 
+import asyncio
 import logging
 import os
 from pathlib import Path
+from typing import List, Optional, Tuple, Union
 
 import openai
 import typer
 from dotenv import load_dotenv
 
 from gpt_engineer.core.ai import AI
-from gpt_engineer.core.db import DB, DBs, archive
-from gpt_engineer.core.steps import STEPS, Config as StepsConfig
+from gpt_engineer.core.ai_pool import default_pool
+from gpt_engineer.core.checkpoint import Checkpoints
+from gpt_engineer.core.db import DB, DBs, archive, backends_from_env
+from gpt_engineer.core.domain import Step
+from gpt_engineer.core.materialize import stop_write_behind, write_behind_from_env
+from gpt_engineer.core.rate_limit import rate_limiter_from_env
+from gpt_engineer.core.response_cache import response_cache_from_env
+from gpt_engineer.core.scheduler import arun_dag, run_dag
+from gpt_engineer.core.steps import ASYNC_STEPS, STEP_IO, STEPS, Config as StepsConfig
+from gpt_engineer.core.tracing import get_tracer, span
 from gpt_engineer.cli.collect import collect_learnings
 from gpt_engineer.cli.learning import collect_consent
 
@@ -66,44 +78,90 @@ def preprompts_path(use_custom_preprompts: bool, input_path: Path = None) -> Pat
     return custom_preprompts_path
 
 
-@app.command()
-def main(
-    project_path: str = typer.Argument("projects/example", help="path"),
-    model: str = typer.Argument("gpt-4", help="model id string"),
+def project_dbs(
+    project_path: Union[str, Path],
+    use_custom_preprompts: bool = False,
+    improve_mode: bool = False,
+) -> DBs:
+    """
+    Open the databases of a project directory.
+
+    The prompt is read from the project directory, the code is generated into its
+    `workspace` subdirectory (or the project itself, when improving its code), and
+    memory, logs and archives are kept in `.gpteng`.
+
+    Parameters
+    ----------
+    project_path : Union[str, Path]
+        The project directory.
+    use_custom_preprompts : bool, optional
+        Whether to use the project's own preprompts, by default False.
+    improve_mode : bool, optional
+        Whether the code of the project itself is improved, by default False.
+
+    Returns
+    -------
+    DBs
+        The databases of the project.
+    """
+    input_path = Path(project_path).absolute()
+    workspace_path = input_path if improve_mode else input_path / "workspace"
+    project_metadata_path = input_path / ".gpteng"
+    memory_path = project_metadata_path / "memory"
+    return DBs(
+        memory=DB(memory_path),
+        logs=DB(memory_path / "logs"),
+        input=DB(input_path),
+        workspace=DB(workspace_path),
+        preprompts=DB(preprompts_path(use_custom_preprompts, input_path)),
+        archive=DB(project_metadata_path / "archive"),
+        project_metadata=DB(project_metadata_path),
+    )
+
+
+def prepare_run(
+    steps_config: StepsConfig = StepsConfig.DEFAULT,
+    improve_mode: bool = False,
+    lite_mode: bool = False,
     temperature: float = 0.1,
-    steps_config: StepsConfig = typer.Option(
-        StepsConfig.DEFAULT, "--steps", "-s", help="decide which steps to run"
-    ),
-    improve_mode: bool = typer.Option(
-        False,
-        "--improve",
-        "-i",
-        help="Improve code from existing project.",
-    ),
-    lite_mode: bool = typer.Option(
-        False,
-        "--lite",
-        "-l",
-        help="Lite mode - run only the main prompt.",
-    ),
-    azure_endpoint: str = typer.Option(
-        "",
-        "--azure",
-        "-a",
-        help="""Endpoint for your Azure OpenAI Service (https://xx.openai.azure.com).
-            In that case, the given model is the deployment name chosen in the Azure AI Studio.""",
-    ),
-    use_custom_preprompts: bool = typer.Option(
-        False,
-        "--use-custom-preprompts",
-        help="""Use your project's custom preprompts instead of the default ones.
-          Copies all original preprompts to the project's workspace if they don't exist there.""",
-    ),
-    verbose: bool = typer.Option(False, "--verbose", "-v"),
-    body = []
-):
+    verbose: bool = False,
+    body: dict = None,
+    resume: bool = False,
+    dbs: Optional[DBs] = None,
+) -> Tuple[AI, DBs, List[Step]]:
+    """
+    Resolve the step configuration and set up the AI and databases for a run.
+
+    Parameters
+    ----------
+    steps_config : StepsConfig, optional
+        The step configuration to run, by default StepsConfig.DEFAULT.
+    improve_mode : bool, optional
+        Whether to improve existing code, by default False.
+    lite_mode : bool, optional
+        Whether to only run the main prompt, by default False.
+    temperature : float, optional
+        The temperature to use for the model, by default 0.1.
+    verbose : bool, optional
+        Whether to log at debug level, by default False.
+    body : dict, optional
+        The request body backing the databases.
+    resume : bool, optional
+        Whether the run resumes an earlier one, which keeps the memory and workspace
+        instead of archiving them, by default False.
+    dbs : Optional[DBs], optional
+        The databases of the run, e.g. from `project_dbs`, instead of databases in
+        the request body.
+
+    Returns
+    -------
+    Tuple[AI, DBs, List[Step]]
+        The AI, the databases and the steps to run.
+    """
     logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
 
+    body = {} if body is None else body
+
     if lite_mode:
         assert not improve_mode, "Lite mode cannot improve code"
         if steps_config == StepsConfig.DEFAULT:
@@ -118,11 +176,14 @@ def main(
     load_env_if_needed()
 
     azure_endpoint = os.getenv("OPENAI_API_BASE")
-    ai = AI(
+    # Reuse a warm client across calls; the fork has its own token usage log
+    ai = default_pool().get(
         model_name=os.getenv("OPENAI_API_DEPLOYMENT"),
         temperature=temperature,
         azure_endpoint=azure_endpoint,
     )
+    ai.response_cache = response_cache_from_env()
+    ai.rate_limiter = rate_limiter_from_env()
 
     # input_path = Path(project_path).absolute()
     # print("Running gpt-engineer in", input_path, "\n")
@@ -132,14 +193,23 @@ def main(
     # memory_path = project_metadata_path / "memory"
     # archive_path = project_metadata_path / "archive"
 
-    dbs = DBs(
-        memory=DB(data=body, identifier='memory'),
-        logs=DB(data=body, identifier='logs'),
-        preprompts=DB(data=body, identifier='preprompts'),
-        input=DB(data=body, identifier='input_prompt'),
-        workspace=DB(data=body, identifier='workspace'),
-        archive=DB(data=body, identifier='archive'),
-        project_metadata=DB(data=body, identifier='.gpteng'),
+    # Databases live in the request body unless GPTE_DB_BACKENDS selects a backend;
+    # GPTE_WORKSPACE_DIR additionally flushes the workspace to disk in the background
+    backends = backends_from_env()
+    dbs = dbs or DBs(
+        memory=DB(data=body, identifier='memory', backend=backends.get('memory')),
+        logs=DB(data=body, identifier='logs', backend=backends.get('logs')),
+        preprompts=DB(
+            data=body, identifier='preprompts', backend=backends.get('preprompts')
+        ),
+        input=DB(data=body, identifier='input_prompt', backend=backends.get('input')),
+        workspace=write_behind_from_env(
+            DB(data=body, identifier='workspace', backend=backends.get('workspace'))
+        ),
+        archive=DB(data=body, identifier='archive', backend=backends.get('archive')),
+        project_metadata=DB(
+            data=body, identifier='.gpteng', backend=backends.get('project_metadata')
+        ),
         # memory=DB(memory_path),
         # logs=DB(memory_path / "logs"),
         # input=DB(input_path),
@@ -155,25 +225,262 @@ def main(
         StepsConfig.EVALUATE,
         # StepsConfig.IMPROVE_CODE,
     ]:
-        archive(dbs)
+        if not resume:
+            archive(dbs)
 
         if not dbs.input.get("prompt"):
             dbs.input["prompt"] = input(
                 "\nWhat application do you want gpt-engineer to generate?\n"
             )
 
-    steps = STEPS[steps_config]
-    for step in steps:
-        messages = step(ai, dbs)
-        dbs.logs[step.__name__] = AI.serialize_messages(messages)
+    return ai, dbs, STEPS[steps_config]
+
+
+def run_steps(ai: AI, dbs: DBs, steps: List[Step], resume: bool = False) -> None:
+    """
+    Run steps, storing the messages of each step in the logs database.
+
+    Steps that do not depend on each other according to `STEP_IO` run concurrently;
+    the timings of the steps and the critical path are stored as `step_trace`. The
+    outputs of every step are checkpointed in the memory database, and when resuming,
+    steps whose inputs did not change since their checkpoint are restored instead.
+    The run is traced as a "run" span, see `gpt_engineer.core.tracing`.
+
+    Parameters
+    ----------
+    ai : AI
+        The AI to run the steps with.
+    dbs : DBs
+        The databases of the run.
+    steps : List[Step]
+        The steps to run.
+    resume : bool, optional
+        Whether to restore steps from their checkpoints, by default False.
+    """
+    checkpoints = Checkpoints(dbs.memory, STEP_IO, resume=resume)
+    try:
+        with span("run", **_run_attributes(ai, steps)) as run_span:
+            trace = run_dag(ai, dbs, steps, STEP_IO, checkpoints=checkpoints)
+            dbs.logs["step_trace"] = trace.to_json()
+            dbs.logs["token_usage"] = ai.format_token_usage_log()
+            with span("db.flush"):
+                dbs.workspace.flush()
+            _record_run_usage(run_span, ai)
+    finally:
+        # The flush thread of a write-behind workspace would outlive the run
+        stop_write_behind(dbs.workspace)
+    get_tracer().flush()
+
+
+async def arun_steps(ai: AI, dbs: DBs, steps: List[Step], resume: bool = False) -> None:
+    """
+    Asynchronous variant of `run_steps`.
+
+    Steps with an entry in `ASYNC_STEPS` are awaited; all other steps run in the
+    event loop's default executor so that they do not block other runs.
+
+    Parameters
+    ----------
+    ai : AI
+        The AI to run the steps with.
+    dbs : DBs
+        The databases of the run.
+    steps : List[Step]
+        The steps to run.
+    resume : bool, optional
+        Whether to restore steps from their checkpoints, by default False.
+    """
+    loop = asyncio.get_running_loop()
+    checkpoints = Checkpoints(dbs.memory, STEP_IO, resume=resume)
+    try:
+        with span("run", **_run_attributes(ai, steps)) as run_span:
+            trace = await arun_dag(
+                ai, dbs, steps, STEP_IO, ASYNC_STEPS, checkpoints=checkpoints
+            )
+            dbs.logs["step_trace"] = trace.to_json()
+            dbs.logs["token_usage"] = ai.format_token_usage_log()
+            with span("db.flush"):
+                await loop.run_in_executor(None, dbs.workspace.flush)
+            _record_run_usage(run_span, ai)
+    finally:
+        await loop.run_in_executor(None, stop_write_behind, dbs.workspace)
+    await loop.run_in_executor(None, get_tracer().flush)
+
+
+def _run_attributes(ai: AI, steps: List[Step]) -> dict:
+    return {
+        "llm.model": ai.model_name,
+        "steps": ",".join(step.__name__ for step in steps),
+    }
+
+
+def _record_run_usage(run_span, ai: AI) -> None:
+    run_span.set_attributes(
+        **{
+            "llm.prompt_tokens": ai.cumulative_prompt_tokens,
+            "llm.completion_tokens": ai.cumulative_completion_tokens,
+        }
+    )
+
+
+async def amain(
+    body: dict,
+    steps_config: StepsConfig = StepsConfig.DEFAULT,
+    temperature: float = 0.1,
+    improve_mode: bool = False,
+    lite_mode: bool = False,
+    verbose: bool = False,
+    resume: bool = False,
+) -> None:
+    """
+    Asynchronous library entry point, equivalent to calling `main` with a `body`.
+
+    Many `amain` calls can run concurrently on one event loop.
+
+    Parameters
+    ----------
+    body : dict
+        The request body backing the databases.
+    steps_config : StepsConfig, optional
+        The step configuration to run, by default StepsConfig.DEFAULT.
+    temperature : float, optional
+        The temperature to use for the model, by default 0.1.
+    improve_mode : bool, optional
+        Whether to improve existing code, by default False.
+    lite_mode : bool, optional
+        Whether to only run the main prompt, by default False.
+    verbose : bool, optional
+        Whether to log at debug level, by default False.
+    resume : bool, optional
+        Whether to resume an earlier run on the same body, skipping the steps whose
+        inputs did not change, by default False.
+    """
+    ai, dbs, steps = prepare_run(
+        steps_config=steps_config,
+        improve_mode=improve_mode,
+        lite_mode=lite_mode,
+        temperature=temperature,
+        verbose=verbose,
+        body=body,
+        resume=resume,
+    )
+    await arun_steps(ai, dbs, steps, resume=resume)
+
+
+def run_project(
+    project_path: Union[str, Path],
+    steps_config: StepsConfig = StepsConfig.DEFAULT,
+    temperature: float = 0.1,
+    improve_mode: bool = False,
+    lite_mode: bool = False,
+    use_custom_preprompts: bool = False,
+    resume: bool = False,
+) -> DBs:
+    """
+    Run the steps on a project directory in this process.
+
+    This is what `python -m gpt_engineer.cli.main <project_path>` does, without
+    starting an interpreter: runners of many projects, like the benchmarks and evals,
+    import langchain, openai and tiktoken once and reuse the warm AI client of the
+    pool (see `gpt_engineer.core.ai_pool`) and its model catalog for all projects.
+
+    Parameters
+    ----------
+    project_path : Union[str, Path]
+        The project directory, see `project_dbs`.
+    steps_config : StepsConfig, optional
+        The step configuration to run, by default StepsConfig.DEFAULT.
+    temperature : float, optional
+        The temperature to use for the model, by default 0.1.
+    improve_mode : bool, optional
+        Whether to improve existing code, by default False.
+    lite_mode : bool, optional
+        Whether to only run the main prompt, by default False.
+    use_custom_preprompts : bool, optional
+        Whether to use the project's own preprompts, by default False.
+    resume : bool, optional
+        Whether to resume an earlier run on the project, by default False.
+
+    Returns
+    -------
+    DBs
+        The databases of the project.
+    """
+    dbs = project_dbs(
+        project_path,
+        use_custom_preprompts=use_custom_preprompts,
+        improve_mode=improve_mode or steps_config == StepsConfig.EVAL_IMPROVE_CODE,
+    )
+    ai, dbs, steps = prepare_run(
+        steps_config=steps_config,
+        improve_mode=improve_mode,
+        lite_mode=lite_mode,
+        temperature=temperature,
+        dbs=dbs,
+        resume=resume,
+    )
+    run_steps(ai, dbs, steps, resume=resume)
+    return dbs
+
+
+@app.command()
+def main(
+    project_path: str = typer.Argument("projects/example", help="path"),
+    model: str = typer.Argument("gpt-4", help="model id string"),
+    temperature: float = 0.1,
+    steps_config: StepsConfig = typer.Option(
+        StepsConfig.DEFAULT, "--steps", "-s", help="decide which steps to run"
+    ),
+    improve_mode: bool = typer.Option(
+        False,
+        "--improve",
+        "-i",
+        help="Improve code from existing project.",
+    ),
+    lite_mode: bool = typer.Option(
+        False,
+        "--lite",
+        "-l",
+        help="Lite mode - run only the main prompt.",
+    ),
+    azure_endpoint: str = typer.Option(
+        "",
+        "--azure",
+        "-a",
+        help="""Endpoint for your Azure OpenAI Service (https://xx.openai.azure.com).
+            In that case, the given model is the deployment name chosen in the Azure AI Studio.""",
+    ),
+    use_custom_preprompts: bool = typer.Option(
+        False,
+        "--use-custom-preprompts",
+        help="""Use your project's custom preprompts instead of the default ones.
+          Copies all original preprompts to the project's workspace if they don't exist there.""",
+    ),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        "-r",
+        help="Resume a failed run, skipping steps whose inputs did not change.",
+    ),
+    verbose: bool = typer.Option(False, "--verbose", "-v"),
+    body = []
+):
+    ai, dbs, steps = prepare_run(
+        steps_config=steps_config,
+        improve_mode=improve_mode,
+        lite_mode=lite_mode,
+        temperature=temperature,
+        verbose=verbose,
+        body=body,
+        resume=resume,
+    )
+    run_steps(ai, dbs, steps, resume=resume)
 
     # print("Total api cost: $ ", ai.usage_cost())
 
     # if collect_consent():
     #     collect_learnings(model, temperature, steps, dbs)
 
-    dbs.logs["token_usage"] = ai.format_token_usage_log()
-
 
 if __name__ == "__main__":
     app()
@@ -7,18 +7,54 @@ and functionalities that form the foundation of the application.
 
 Modules:
     - ai: Contains interfaces to the OpenAI GPT models.
+    - ai_pool: Pool of warm AI instances for repeated, service-style invocations.
+    - response_cache: Opt-in on-disk cache replaying identical chat completions.
+    - model_catalog: Process-wide cache of the models available to the OpenAI account.
+    - rate_limit: Token bucket rate limiting of requests, shareable between processes.
     - domain: Contains type annotations related to the steps workflow in GPT Engineer.
     - chat_to_files: Provides utilities for converting chat model outputs to files.
     - steps: Primary workflow definition & configuration for GPT Engineer.
+    - sharding: Splitting of improve requests into shards and merging of their edits.
+    - context_packing: Packing of the files of a request into the context window.
+    - scheduler: Runs steps as a dependency graph, concurrently where independent.
+    - checkpoint: Checkpoints of step outputs for resuming failed runs.
+    - tracing: Spans per step, completion and database operation, exported as JSON
+      lines or OTLP.
     - db: Provides file system operations for GPT Engineer projects.
+    - db_backends: Storage backends of the databases (dict, directory, SQLite, pack).
+    - materialize: Bulk and write-behind flushing of databases to directories.
+    - spill: Spilling of large database values to disk under a memory budget.
+
+Submodules are imported lazily on first attribute access, so that e.g. using `DB` or
+`parse_chat` does not pull in langchain, openai and tiktoken.
 
 For more specific details, refer to the docstrings within each module.
 """
 
-from gpt_engineer.core import (
-    ai,
-    domain,
-    chat_to_files,
-    steps,
-    db,
-)
+import importlib
+
+__all__ = [
+    "ai",
+    "ai_pool",
+    "model_catalog",
+    "response_cache",
+    "rate_limit",
+    "domain",
+    "chat_to_files",
+    "steps",
+    "sharding",
+    "context_packing",
+    "scheduler",
+    "checkpoint",
+    "tracing",
+    "db",
+    "db_backends",
+    "materialize",
+    "spill",
+]
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -5,12 +5,24 @@ The AI class encapsulates the chat functionalities, allowing to start, advance,
 
 Key Features:
 - Integration with Azure-based OpenAI instances through the LangChain AzureChatOpenAI class.
-- Token usage logging to monitor the number of tokens consumed during a conversation.
+- Token usage logging to monitor the number of tokens consumed during a conversation, using the
+  usage reported by the provider and counting locally only when none is reported.
+- Blocking and asyncio variants of the inference calls.
+- Tracing spans per completion with the network time, retries, first-token latency,
+  token counts and cost (see `gpt_engineer.core.tracing`).
+- Opt-in replay of identical requests from an on-disk response cache.
+- Opt-in token bucket rate limiting of requests, shareable between processes.
 - Seamless fallback to default models in case the desired model is unavailable.
+- Process-wide caching of the model catalog, so warm constructions make no API calls.
 - Serialization and deserialization of chat messages for easier transmission and storage.
 
 Classes:
 - AI: Main class providing chat functionalities.
+- TokenCounter: Token counting with a bounded cache of per-text counts.
+- TokenStreamCallbackHandler: Forwards streamed tokens to a consumer as they arrive.
+- FirstTokenCallbackHandler: Records the latency of the first streamed token on a span.
+- UsageCallbackHandler: Captures the token usage reported by the provider.
+- UsageReportingChatCompletion: openai.ChatCompletion wrapper capturing usage of streamed responses.
 - TokenUsage: Data class for logging token usage details.
 
 Dependencies:
@@ -26,16 +38,26 @@ For more specific details, refer to the docstrings within each class and functio
 
 from __future__ import annotations
 
+import copy
+import csv
+import hashlib
+import io
 import json
 import logging
+import os
+import threading
+import time
 
+from collections import OrderedDict
+from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import List, Optional, Union
+from typing import Any, Callable, List, Mapping, Optional, Tuple, Union
 
 import backoff
 import openai
 import tiktoken
 
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.callbacks.openai_info import MODEL_COST_PER_1K_TOKENS
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
@@ -43,11 +65,17 @@ from langchain.chat_models.base import BaseChatModel
 from langchain.schema import (
     AIMessage,
     HumanMessage,
+    LLMResult,
     SystemMessage,
     messages_from_dict,
     messages_to_dict,
 )
 
+from gpt_engineer.core import tracing
+from gpt_engineer.core.model_catalog import ModelCatalog, default_catalog
+from gpt_engineer.core.rate_limit import TokenBucket
+from gpt_engineer.core.response_cache import CachedResponse, ResponseCache
+
 # Type hint for a chat message
 Message = Union[AIMessage, HumanMessage, SystemMessage]
 
@@ -64,6 +92,279 @@ class TokenUsage:
     total_prompt_tokens: int
     total_completion_tokens: int
     total_tokens: int
+    in_step_cached_prefix_tokens: int = 0
+    total_cached_prefix_tokens: int = 0
+
+
+class TokenCounter:
+    """
+    Count tokens with a tokenizer, remembering the counts of recently seen texts.
+
+    Conversation histories are re-counted on every call to `AI.next`, so without a
+    cache every message is re-encoded once per turn. Counts are cached in a bounded
+    LRU keyed by a digest of the text, so only new messages are encoded and large
+    payloads are not kept alive by the cache.
+
+    The tokenizer can be given directly or, by passing a model name instead, is looked
+    up on the first count. Loading BPE tables is expensive and many runs never read
+    their token accounting, so `AI` always uses the lazy form.
+
+    Attributes
+    ----------
+    tokenizer : Any
+        The tokenizer used to encode texts that are not cached.
+    maxsize : int
+        The maximum number of cached counts.
+    hits : int
+        The number of counts served from the cache.
+    misses : int
+        The number of texts that had to be encoded.
+    """
+
+    def __init__(self, tokenizer: Any = None, maxsize: int = 4096, model: str = ""):
+        self._tokenizer = tokenizer
+        self._model = model
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._prefixes: "OrderedDict[bytes, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self) -> Any:
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    self._tokenizer = get_tokenizer(self._model)
+        return self._tokenizer
+
+    def __call__(self, txt: str) -> int:
+        """
+        Get the number of tokens in a text.
+
+        Parameters
+        ----------
+        txt : str
+            The text to count the tokens in.
+
+        Returns
+        -------
+        int
+            The number of tokens in the text.
+        """
+        key = hashlib.blake2b(txt.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self.hits += 1
+                self._counts.move_to_end(key)
+                return count
+
+        count = len(self.tokenizer.encode(txt))
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = count
+            if len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+        return count
+
+    def reused_prefix(self, txt: str) -> int:
+        """
+        Get the number of tokens in a prompt prefix that has been sent before.
+
+        Providers cache the longest previously seen prefix of a prompt, so a system
+        prompt that was already sent by this counter's AI (or any fork of it) is not
+        processed again.
+
+        Parameters
+        ----------
+        txt : str
+            The prompt prefix, usually the content of the system message.
+
+        Returns
+        -------
+        int
+            The number of tokens in the prefix if it was sent before, otherwise 0.
+        """
+        key = hashlib.blake2b(txt.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            seen = key in self._prefixes
+            self._prefixes[key] = None
+            self._prefixes.move_to_end(key)
+            if len(self._prefixes) > self.maxsize:
+                self._prefixes.popitem(last=False)
+        return self(txt) if seen else 0
+
+
+class TokenStreamCallbackHandler(BaseCallbackHandler):
+    """
+    Forward the tokens of a streamed completion to a consumer as they arrive.
+
+    Attributes
+    ----------
+    on_token : Callable[[str], None]
+        Called with every new token.
+    on_start : Optional[Callable[[], None]]
+        Called when a request starts, so the consumer can drop the partial output of a
+        request that is being retried.
+    """
+
+    def __init__(
+        self,
+        on_token: Callable[[str], None],
+        on_start: Optional[Callable[[], None]] = None,
+    ):
+        self.on_token = on_token
+        self.on_start = on_start
+
+    def on_llm_start(self, serialized: Any, prompts: Any, **kwargs: Any) -> None:
+        if self.on_start is not None:
+            self.on_start()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.on_token(token)
+
+
+class FirstTokenCallbackHandler(BaseCallbackHandler):
+    """
+    Record the latency of the first streamed token of a completion on a span.
+
+    The clock restarts with every request, so for a retried completion the latency is
+    that of the request that succeeded.
+
+    Attributes
+    ----------
+    span : tracing.Span
+        The span the latency is recorded on, as `llm.time_to_first_token_ms`.
+    """
+
+    def __init__(self, span: tracing.Span):
+        self.span = span
+        self._start = time.perf_counter()
+        self._seen = False
+
+    def on_llm_start(self, serialized: Any, prompts: Any, **kwargs: Any) -> None:
+        self._start = time.perf_counter()
+        self._seen = False
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if not self._seen:
+            self._seen = True
+            latency = (time.perf_counter() - self._start) * 1000
+            self.span.set_attribute("llm.time_to_first_token_ms", latency)
+            self.span.add_event("first_token")
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    Capture the token usage the provider reports for a single completion.
+
+    Non-streamed responses carry the usage in the LLM output, which is picked up in
+    `on_llm_end`. Streamed responses only report it in a final chunk that LangChain
+    drops, so `UsageReportingChatCompletion` records it through `record` instead.
+
+    Attributes
+    ----------
+    prompt_tokens : Optional[int]
+        The reported number of prompt tokens, if any.
+    completion_tokens : Optional[int]
+        The reported number of completion tokens, if any.
+    """
+
+    def __init__(self):
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+
+    @property
+    def usage(self) -> Optional[Tuple[int, int]]:
+        """
+        The reported (prompt, completion) token counts, or None if nothing was reported.
+        """
+        if self.prompt_tokens is None or self.completion_tokens is None:
+            return None
+        return self.prompt_tokens, self.completion_tokens
+
+    def record(self, token_usage: Mapping[str, Any]) -> None:
+        """
+        Record a usage mapping as returned by the OpenAI API.
+
+        Parameters
+        ----------
+        token_usage : Mapping[str, Any]
+            The usage, with "prompt_tokens" and "completion_tokens" keys.
+        """
+        if "prompt_tokens" in token_usage and "completion_tokens" in token_usage:
+            self.prompt_tokens = token_usage["prompt_tokens"]
+            self.completion_tokens = token_usage["completion_tokens"]
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        token_usage = (response.llm_output or {}).get("token_usage")
+        if token_usage:
+            self.record(token_usage)
+
+
+# The handler of the completion currently in flight in this thread or task
+_usage_recorder: ContextVar[Optional[UsageCallbackHandler]] = ContextVar(
+    "usage_recorder", default=None
+)
+
+
+class UsageReportingChatCompletion:
+    """
+    A drop-in for `openai.ChatCompletion` that captures usage from streamed responses.
+
+    Streamed requests ask the API to append a usage chunk (`stream_options`), and the
+    usage found in that chunk is recorded on the `UsageCallbackHandler` of the
+    completion in flight. Everything else is passed through unchanged.
+
+    Attributes
+    ----------
+    include_stream_usage : bool
+        Whether to ask for usage in streamed responses. Endpoints that reject
+        `stream_options`, such as older Azure API versions, need this disabled.
+    """
+
+    def __init__(self, include_stream_usage: bool = True):
+        self.include_stream_usage = include_stream_usage
+
+    def _prepare(self, kwargs: dict) -> dict:
+        if kwargs.get("stream") and self.include_stream_usage:
+            kwargs = {"stream_options": {"include_usage": True}, **kwargs}
+        return kwargs
+
+    def create(self, **kwargs: Any) -> Any:
+        response = openai.ChatCompletion.create(**self._prepare(kwargs))
+        if not kwargs.get("stream"):
+            return response
+        return self._record_stream(response, _usage_recorder.get())
+
+    async def acreate(self, **kwargs: Any) -> Any:
+        response = await openai.ChatCompletion.acreate(**self._prepare(kwargs))
+        if not kwargs.get("stream"):
+            return response
+        return self._arecord_stream(response, _usage_recorder.get())
+
+    @staticmethod
+    def _record_stream(chunks, recorder):
+        for chunk in chunks:
+            if recorder is not None and chunk.get("usage"):
+                recorder.record(chunk["usage"])
+            yield chunk
+
+    @staticmethod
+    async def _arecord_stream(chunks, recorder):
+        async for chunk in chunks:
+            if recorder is not None and chunk.get("usage"):
+                recorder.record(chunk["usage"])
+            yield chunk
+
+
+def _record_retry(details: Mapping[str, Any]) -> None:
+    # Called by backoff before waiting to retry a rate limited request
+    tracing.current_span().add_event(
+        "llm.retry", tries=details["tries"], wait_seconds=details["wait"]
+    )
 
 
 class AI:
@@ -87,6 +388,12 @@ class AI:
         The chat model instance.
     tokenizer : Any
         The tokenizer associated with the model.
+    token_counter : TokenCounter
+        Counts tokens with the tokenizer, caching the counts of seen messages.
+    response_cache : Optional[ResponseCache]
+        The cache identical requests are replayed from, if caching is enabled.
+    rate_limiter : Optional[TokenBucket]
+        The bucket every request takes a token from, if rate limiting is enabled.
     cumulative_prompt_tokens : int
         The running count of prompt tokens used.
     cumulative_completion_tokens : int
@@ -98,6 +405,10 @@ class AI:
 
     Methods
     -------
+    reset_token_usage() -> None:
+        Reset the cumulative token counters and the token usage log.
+    fork() -> AI:
+        Create a copy sharing the chat model but with its own token usage log.
     start(system, user, step_name) -> List[Message]:
         Start the conversation with a system and user message.
     fsystem(msg) -> SystemMessage:
@@ -110,6 +421,12 @@ class AI:
         Advance the conversation by interacting with the language model.
     backoff_inference(messages, callbacks) -> Any:
         Interact with the model using an exponential backoff strategy in case of rate limits.
+    astart(system, user, step_name) -> List[Message]:
+        Asynchronous variant of `start`.
+    anext(messages, prompt, step_name) -> List[Message]:
+        Asynchronous variant of `next`.
+    abackoff_inference(messages, callbacks) -> Any:
+        Asynchronous variant of `backoff_inference`.
     serialize_messages(messages) -> str:
         Serialize a list of messages to a JSON string.
     deserialize_messages(jsondictstr) -> List[Message]:
@@ -126,7 +443,16 @@ class AI:
         Count the total number of tokens in a list of messages.
     """
 
-    def __init__(self, model_name="gpt-4", temperature=0.1, azure_endpoint=""):
+    response_cache: Optional[ResponseCache] = None
+    rate_limiter: Optional[TokenBucket] = None
+
+    def __init__(
+        self,
+        model_name="gpt-4",
+        temperature=0.1,
+        azure_endpoint="",
+        response_cache: Optional[ResponseCache] = None,
+    ):
         """
         Initialize the AI class.
 
@@ -136,23 +462,65 @@ class AI:
             The name of the model to use, by default "gpt-4".
         temperature : float, optional
             The temperature to use for the model, by default 0.1.
+        response_cache : Optional[ResponseCache], optional
+            The cache to replay identical requests from, by default None (no caching).
         """
         self.temperature = temperature
+        self.response_cache = response_cache
         self.azure_endpoint = azure_endpoint
         self.model_name = (
             fallback_model(model_name) if azure_endpoint == "" else model_name
         )
         self.llm = create_chat_model(self, self.model_name, self.temperature)
-        self.tokenizer = get_tokenizer(self.model_name)
+        # The tokenizer is loaded on the first token count, see TokenCounter
+        self.token_counter = TokenCounter(model=self.model_name)
         logger.debug(f"Using model {self.model_name} with llm {self.llm}")
 
-        # initialize token usage log
+        self.reset_token_usage()
+
+    @property
+    def tokenizer(self) -> Any:
+        """
+        The tokenizer associated with the model, loaded on first use.
+        """
+        return self.token_counter.tokenizer
+
+    def reset_token_usage(self) -> None:
+        """
+        Reset the cumulative token counters and the token usage log.
+        """
         self.cumulative_prompt_tokens = 0
         self.cumulative_completion_tokens = 0
         self.cumulative_total_tokens = 0
+        self.cumulative_cached_prefix_tokens = 0
         self.token_usage_log = []
+        # Guards the counters above when several calls are in flight at once
+        self._usage_lock = threading.Lock()
+
+    def fork(self) -> AI:
+        """
+        Create a copy of this AI with its own, empty token usage log.
 
-    def start(self, system: str, user: str, step_name: str) -> List[Message]:
+        The copy shares the chat model, and with it the tokenizer and HTTP client, with
+        this instance, so it is cheap to create. Token accounting of the copy is
+        isolated from the original and from other copies.
+
+        Returns
+        -------
+        AI
+            The forked AI instance.
+        """
+        forked = copy.copy(self)
+        forked.reset_token_usage()
+        return forked
+
+    def start(
+        self,
+        system: str,
+        user: str,
+        step_name: str,
+        callbacks: Optional[List[BaseCallbackHandler]] = None,
+    ) -> List[Message]:
         """
         Start the conversation with a system message and a user message.
 
@@ -164,6 +532,8 @@ class AI:
             The content of the user message.
         step_name : str
             The name of the step.
+        callbacks : Optional[List[BaseCallbackHandler]], optional
+            Additional callback handlers for the completion, see `next`.
 
         Returns
         -------
@@ -174,7 +544,39 @@ class AI:
             SystemMessage(content=system),
             HumanMessage(content=user),
         ]
-        return self.next(messages, step_name=step_name)
+        return self.next(messages, step_name=step_name, callbacks=callbacks)
+
+    async def astart(
+        self,
+        system: str,
+        user: str,
+        step_name: str,
+        callbacks: Optional[List[BaseCallbackHandler]] = None,
+    ) -> List[Message]:
+        """
+        Asynchronously start the conversation with a system message and a user message.
+
+        Parameters
+        ----------
+        system : str
+            The content of the system message.
+        user : str
+            The content of the user message.
+        step_name : str
+            The name of the step.
+        callbacks : Optional[List[BaseCallbackHandler]], optional
+            Additional callback handlers for the completion, see `next`.
+
+        Returns
+        -------
+        List[Message]
+            The list of messages in the conversation.
+        """
+        messages: List[Message] = [
+            SystemMessage(content=system),
+            HumanMessage(content=user),
+        ]
+        return await self.anext(messages, step_name=step_name, callbacks=callbacks)
 
     def fsystem(self, msg: str) -> SystemMessage:
         """
@@ -230,6 +632,7 @@ class AI:
         prompt: Optional[str] = None,
         *,
         step_name: str,
+        callbacks: Optional[List[BaseCallbackHandler]] = None,
     ) -> List[Message]:
         """
         Advances the conversation by sending message history
@@ -243,6 +646,9 @@ class AI:
             The prompt to use, by default None.
         step_name : str
             The name of the step.
+        callbacks : Optional[List[BaseCallbackHandler]], optional
+            Additional callback handlers for the completion, e.g. to consume the tokens
+            while they stream in. They are not called for replayed cached completions.
 
         Returns
         -------
@@ -258,19 +664,113 @@ class AI:
 
         logger.debug(f"Creating a new chat completion: {messages}")
 
-        callbacks = [StreamingStdOutCallbackHandler()]
-        response = self.backoff_inference(messages, callbacks)
-
-        self.update_token_usage_log(
-            messages=messages, answer=response.content, step_name=step_name
-        )
+        with self._chat_span(step_name) as chat_span:
+            cache_key, cached = self._cached_response(messages)
+            if cached is not None:
+                response, reported_usage = cached
+            else:
+                usage = UsageCallbackHandler()
+                handlers = self._handlers(usage, callbacks, chat_span)
+                recorder = _usage_recorder.set(usage)
+                try:
+                    with tracing.span("llm.request", **{"span.kind": "client"}):
+                        response = self.backoff_inference(messages, handlers)
+                finally:
+                    _usage_recorder.reset(recorder)
+                reported_usage = usage.usage
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, response, reported_usage)
+
+            token_usage = self.update_token_usage_log(
+                messages=messages,
+                answer=response.content,
+                step_name=step_name,
+                usage=reported_usage,
+            )
+            self._record_usage(chat_span, token_usage, cached=cached is not None)
         messages.append(response)
         logger.debug(f"Chat completion finished: {messages}")
 
         return messages
 
+    def _chat_span(self, step_name: str):
+        return tracing.span(
+            "llm.chat", **{"llm.model": self.model_name, "step.name": step_name}
+        )
+
+    @staticmethod
+    def _handlers(
+        usage: UsageCallbackHandler,
+        callbacks: Optional[List[BaseCallbackHandler]],
+        chat_span: Any,
+    ) -> List[BaseCallbackHandler]:
+        handlers = [StreamingStdOutCallbackHandler(), usage, *(callbacks or [])]
+        if chat_span.recording:
+            handlers.append(FirstTokenCallbackHandler(chat_span))
+        return handlers
+
+    def _record_usage(
+        self, chat_span: Any, token_usage: TokenUsage, cached: bool
+    ) -> None:
+        if not chat_span.recording:
+            return
+        chat_span.set_attributes(
+            **{
+                "llm.cached": cached,
+                "llm.prompt_tokens": token_usage.in_step_prompt_tokens,
+                "llm.completion_tokens": token_usage.in_step_completion_tokens,
+                "llm.cached_prefix_tokens": token_usage.in_step_cached_prefix_tokens,
+            }
+        )
+        prompt_price = MODEL_COST_PER_1K_TOKENS.get(self.model_name)
+        completion_price = MODEL_COST_PER_1K_TOKENS.get(self.model_name + "-completion")
+        if prompt_price is not None and completion_price is not None and not cached:
+            chat_span.set_attribute(
+                "llm.cost_usd",
+                token_usage.in_step_prompt_tokens / 1000 * prompt_price
+                + token_usage.in_step_completion_tokens / 1000 * completion_price,
+            )
+
+    def _cached_response(
+        self, messages: List[Message]
+    ) -> Tuple[Optional[str], Optional[CachedResponse]]:
+        """
+        Look up a completion of the messages in the response cache, if one is configured.
+
+        Parameters
+        ----------
+        messages : List[Message]
+            The messages about to be sent to the model.
+
+        Returns
+        -------
+        Tuple[Optional[str], Optional[CachedResponse]]
+            The cache key (None without a cache) and the cached completion, if any.
+        """
+        if self.response_cache is None:
+            return None, None
+        # Responses of different servers, e.g. a local stub and the API, differ
+        endpoint = (
+            self.azure_endpoint
+            or getattr(self.llm, "openai_api_base", None)
+            or openai.api_base
+        )
+        key = self.response_cache.key(
+            self.model_name, self.temperature, messages, endpoint
+        )
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            logger.debug(f"Replaying cached chat completion {key}")
+            # Stand in for the streamed output of a real completion
+            print(cached[0].content)
+        return key, cached
+
     @backoff.on_exception(
-        backoff.expo, openai.error.RateLimitError, max_tries=7, max_time=45
+        backoff.expo,
+        openai.error.RateLimitError,
+        max_tries=7,
+        max_time=45,
+        on_backoff=_record_retry,
     )
     def backoff_inference(self, messages, callbacks):
         """
@@ -306,8 +806,111 @@ class AI:
         >>> callbacks = [some_logging_callback]
         >>> response = backoff_inference(messages, callbacks)
         """
+        if self.rate_limiter is not None:
+            waited = self.rate_limiter.acquire()
+            tracing.current_span().add("llm.rate_limit_wait_seconds", waited)
         return self.llm(messages, callbacks=callbacks)  # type: ignore
 
+    async def anext(
+        self,
+        messages: List[Message],
+        prompt: Optional[str] = None,
+        *,
+        step_name: str,
+        callbacks: Optional[List[BaseCallbackHandler]] = None,
+    ) -> List[Message]:
+        """
+        Asynchronously advances the conversation, see `next`.
+
+        Many calls can be in flight on the same instance at once; token usage is
+        recorded in the order the completions finish.
+
+        Parameters
+        ----------
+        messages : List[Message]
+            The list of messages in the conversation.
+        prompt : Optional[str], optional
+            The prompt to use, by default None.
+        step_name : str
+            The name of the step.
+        callbacks : Optional[List[BaseCallbackHandler]], optional
+            Additional callback handlers for the completion.
+
+        Returns
+        -------
+        List[Message]
+            The updated list of messages in the conversation.
+        """
+        if prompt:
+            messages.append(self.fuser(prompt))
+
+        logger.debug(f"Creating a new async chat completion: {messages}")
+
+        with self._chat_span(step_name) as chat_span:
+            cache_key, cached = self._cached_response(messages)
+            if cached is not None:
+                response, reported_usage = cached
+            else:
+                usage = UsageCallbackHandler()
+                handlers = self._handlers(usage, callbacks, chat_span)
+                recorder = _usage_recorder.set(usage)
+                try:
+                    with tracing.span("llm.request", **{"span.kind": "client"}):
+                        response = await self.abackoff_inference(messages, handlers)
+                finally:
+                    _usage_recorder.reset(recorder)
+                reported_usage = usage.usage
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, response, reported_usage)
+
+            token_usage = self.update_token_usage_log(
+                messages=messages,
+                answer=response.content,
+                step_name=step_name,
+                usage=reported_usage,
+            )
+            self._record_usage(chat_span, token_usage, cached=cached is not None)
+        messages.append(response)
+        logger.debug(f"Async chat completion finished: {messages}")
+
+        return messages
+
+    @backoff.on_exception(
+        backoff.expo,
+        openai.error.RateLimitError,
+        max_tries=7,
+        max_time=45,
+        on_backoff=_record_retry,
+    )
+    async def abackoff_inference(self, messages, callbacks):
+        """
+        Asynchronously perform inference with the same retry policy as `backoff_inference`.
+
+        Waiting between retries uses `asyncio.sleep`, so other calls on the event loop
+        keep making progress while this one backs off.
+
+        Parameters
+        ----------
+        messages : List[Message]
+            A list of chat messages which will be passed to the language model for processing.
+        callbacks : List[Callable]
+            A list of callback functions that are triggered during inference.
+
+        Returns
+        -------
+        Any
+            The output from the language model after processing the provided messages.
+
+        Raises
+        ------
+        openai.error.RateLimitError
+            If the rate limit persists beyond the allotted retries or time.
+        """
+        if self.rate_limiter is not None:
+            waited = await self.rate_limiter.aacquire()
+            tracing.current_span().add("llm.rate_limit_wait_seconds", waited)
+        return await self.llm.apredict_messages(messages, callbacks=callbacks)
+
     @staticmethod
     def serialize_messages(messages: List[Message]) -> str:
         """
@@ -349,8 +952,12 @@ class AI:
         return list(messages_from_dict(prevalidated_data))  # type: ignore
 
     def update_token_usage_log(
-        self, messages: List[Message], answer: str, step_name: str
-    ) -> None:
+        self,
+        messages: List[Message],
+        answer: str,
+        step_name: str,
+        usage: Optional[Tuple[int, int]] = None,
+    ) -> TokenUsage:
         """
         Update the token usage log with the number of tokens used in the current step.
 
@@ -362,17 +969,32 @@ class AI:
             The answer from the AI.
         step_name : str
             The name of the step.
+        usage : Optional[Tuple[int, int]], optional
+            The (prompt, completion) token counts reported by the provider. The counts
+            are computed locally with the tokenizer when not given.
+
+        Returns
+        -------
+        TokenUsage
+            The entry added to the log.
         """
-        prompt_tokens = self.num_tokens_from_messages(messages)
-        completion_tokens = self.num_tokens(answer)
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage
+        else:
+            prompt_tokens = self.num_tokens_from_messages(messages)
+            completion_tokens = self.num_tokens(answer)
         total_tokens = prompt_tokens + completion_tokens
+        cached_prefix_tokens = 0
+        if messages and isinstance(messages[0], SystemMessage):
+            cached_prefix_tokens = self.token_counter.reused_prefix(messages[0].content)
 
-        self.cumulative_prompt_tokens += prompt_tokens
-        self.cumulative_completion_tokens += completion_tokens
-        self.cumulative_total_tokens += total_tokens
+        with self._usage_lock:
+            self.cumulative_prompt_tokens += prompt_tokens
+            self.cumulative_completion_tokens += completion_tokens
+            self.cumulative_total_tokens += total_tokens
+            self.cumulative_cached_prefix_tokens += cached_prefix_tokens
 
-        self.token_usage_log.append(
-            TokenUsage(
+            token_usage = TokenUsage(
                 step_name=step_name,
                 in_step_prompt_tokens=prompt_tokens,
                 in_step_completion_tokens=completion_tokens,
@@ -380,30 +1002,54 @@ class AI:
                 total_prompt_tokens=self.cumulative_prompt_tokens,
                 total_completion_tokens=self.cumulative_completion_tokens,
                 total_tokens=self.cumulative_total_tokens,
+                in_step_cached_prefix_tokens=cached_prefix_tokens,
+                total_cached_prefix_tokens=self.cumulative_cached_prefix_tokens,
             )
-        )
+            self.token_usage_log.append(token_usage)
+        return token_usage
 
     def format_token_usage_log(self) -> str:
         """
         Format the token usage log as a CSV string.
 
+        The cached prefix columns count prompt tokens of system prompts that had
+        already been sent, which providers serve from their prompt cache.
+
         Returns
         -------
         str
             The token usage log formatted as a CSV string.
         """
-        result = "step_name,"
-        result += "prompt_tokens_in_step,completion_tokens_in_step,total_tokens_in_step"
-        result += ",total_prompt_tokens,total_completion_tokens,total_tokens\n"
-        for log in self.token_usage_log:
-            result += log.step_name + ","
-            result += str(log.in_step_prompt_tokens) + ","
-            result += str(log.in_step_completion_tokens) + ","
-            result += str(log.in_step_total_tokens) + ","
-            result += str(log.total_prompt_tokens) + ","
-            result += str(log.total_completion_tokens) + ","
-            result += str(log.total_tokens) + "\n"
-        return result
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(
+            [
+                "step_name",
+                "prompt_tokens_in_step",
+                "completion_tokens_in_step",
+                "total_tokens_in_step",
+                "total_prompt_tokens",
+                "total_completion_tokens",
+                "total_tokens",
+                "cached_prefix_tokens_in_step",
+                "total_cached_prefix_tokens",
+            ]
+        )
+        writer.writerows(
+            [
+                log.step_name,
+                log.in_step_prompt_tokens,
+                log.in_step_completion_tokens,
+                log.in_step_total_tokens,
+                log.total_prompt_tokens,
+                log.total_completion_tokens,
+                log.total_tokens,
+                log.in_step_cached_prefix_tokens,
+                log.total_cached_prefix_tokens,
+            ]
+            for log in self.token_usage_log
+        )
+        return out.getvalue()
 
     def usage_cost(self) -> float:
         """
@@ -419,8 +1065,8 @@ class AI:
 
         result = 0
         for log in self.token_usage_log:
-            result += log.total_prompt_tokens / 1000 * prompt_price
-            result += log.total_completion_tokens / 1000 * completion_price
+            result += log.in_step_prompt_tokens / 1000 * prompt_price
+            result += log.in_step_completion_tokens / 1000 * completion_price
         return result
 
     def num_tokens(self, txt: str) -> int:
@@ -437,7 +1083,7 @@ class AI:
         int
             The number of tokens in the text.
         """
-        return len(self.tokenizer.encode(txt))
+        return self.token_counter(txt)
 
     def num_tokens_from_messages(self, messages: List[Message]) -> int:
         """
@@ -464,24 +1110,29 @@ class AI:
         return n_tokens
 
 
-def fallback_model(model: str) -> str:
+def fallback_model(model: str, catalog: Optional[ModelCatalog] = None) -> str:
     """
     Retrieve the specified model, or fallback to "gpt-3.5-turbo" if the model is not available.
 
+    Availability is looked up in the process-wide model catalog, so this only hits the
+    API when the catalog is cold or expired.
+
     Parameters
     ----------
     model : str
         The name of the model to retrieve.
+    catalog : Optional[ModelCatalog], optional
+        The catalog to consult, by default the process-wide catalog.
 
     Returns
     -------
     str
         The name of the retrieved model, or "gpt-3.5-turbo" if the specified model is not available.
     """
-    try:
-        openai.Model.retrieve(model)
+    catalog = catalog or default_catalog()
+    if catalog.is_available(model):
         return model
-    except openai.InvalidRequestError:
+    else:
         print(
             f"Model {model} not available for provided API key. Reverting "
             "to gpt-3.5-turbo. Sign up for the GPT-4 wait list here: "
@@ -507,25 +1158,32 @@ def create_chat_model(self, model: str, temperature) -> BaseChatModel:
         The created chat model.
     """
     if self.azure_endpoint:
-        return AzureChatOpenAI(
+        chat_model = AzureChatOpenAI(
             openai_api_base=self.azure_endpoint,
             openai_api_version="2023-05-15",  # might need to be flexible in the future
             deployment_name=model,
             openai_api_type="azure",
             streaming=True,
         )
-    # Fetch available models from OpenAI API
-    supported = [model["id"] for model in openai.Model.list()["data"]]
+        # This API version does not accept stream_options
+        chat_model.client = UsageReportingChatCompletion(include_stream_usage=False)
+        return chat_model
+    # Available models are cached process-wide, see gpt_engineer.core.model_catalog
+    supported = default_catalog().models()
     if model not in supported:
         raise ValueError(
             f"Model {model} is not supported, supported models are: {supported}"
         )
-    return ChatOpenAI(
+    chat_model = ChatOpenAI(
         model=model,
         temperature=temperature,
         streaming=True,
-        client=openai.ChatCompletion,
     )
+    # Set after construction, the model's validator always installs openai.ChatCompletion
+    chat_model.client = UsageReportingChatCompletion(
+        include_stream_usage=os.getenv("GPTE_STREAM_USAGE", "1") != "0"
+    )
+    return chat_model
 
 
 def get_tokenizer(model: str):
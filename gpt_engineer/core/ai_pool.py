@@ -0,0 +1,177 @@
+"""
+This module provides a pool of warm `AI` instances for service-style use of gpt-engineer.
+
+When `gpt_engineer.cli.main.main` is called as a library function once per request,
+building a fresh `AI` each time re-creates the LangChain chat model and looks up the
+tokenizer. The pool keeps one warm template per (model, endpoint, temperature) and hands
+out forks of it: forks share the chat model, tokenizer and HTTP client, but keep their
+own token usage log, so concurrent requests never see each other's accounting.
+
+Classes:
+- PoolMetrics: Snapshot of the pool's size, hits and misses.
+- AIPool: Keyed, bounded pool of warm AI templates.
+
+Functions:
+- default_pool: Returns the process-wide pool.
+"""
+
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from gpt_engineer.core.ai import AI
+
+PoolKey = Tuple[str, Optional[str], float]
+
+
+@dataclass
+class PoolMetrics:
+    size: int
+    hits: int
+    misses: int
+
+
+class AIPool:
+    """
+    A thread-safe pool of warm `AI` templates, keyed by model, endpoint and temperature.
+
+    The least recently used template is dropped once more than `max_size` distinct
+    configurations are in use.
+
+    Attributes
+    ----------
+    max_size : int
+        The maximum number of templates kept warm.
+
+    Methods
+    -------
+    get(model_name, temperature, azure_endpoint) -> AI:
+        Return an AI with an empty token usage log for the given configuration.
+    metrics() -> PoolMetrics:
+        Return the current size, hit and miss counts.
+    clear() -> None:
+        Drop all templates and reset the metrics.
+    """
+
+    def __init__(self, max_size: int = 8, factory: Callable[..., AI] = AI):
+        """
+        Initialize the AIPool class.
+
+        Parameters
+        ----------
+        max_size : int, optional
+            The maximum number of templates kept warm, by default 8.
+        factory : Callable[..., AI], optional
+            The constructor used on a miss, by default `AI`.
+        """
+        self.max_size = max_size
+        self._factory = factory
+        self._templates: "OrderedDict[PoolKey, AI]" = OrderedDict()
+        self._pending: "Dict[PoolKey, Future[AI]]" = {}
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        model_name: str = "gpt-4",
+        temperature: float = 0.1,
+        azure_endpoint: Optional[str] = "",
+    ) -> AI:
+        """
+        Return an AI for the given configuration, constructing it only on a miss.
+
+        Parameters
+        ----------
+        model_name : str, optional
+            The name of the model, by default "gpt-4".
+        temperature : float, optional
+            The temperature to use for the model, by default 0.1.
+        azure_endpoint : Optional[str], optional
+            The Azure endpoint URL, by default "" (OpenAI). It is passed to `AI` as is,
+            so None, like "", uses OpenAI, but without falling back to another model.
+
+        Returns
+        -------
+        AI
+            A fork of the pooled template with an empty token usage log.
+        """
+        key = (model_name, azure_endpoint, float(temperature))
+        constructing = False
+        with self._lock:
+            template = self._templates.get(key)
+            pending = self._pending.get(key)
+            if template is not None:
+                self._hits += 1
+                self._templates.move_to_end(key)
+            elif pending is not None:
+                # Another thread is constructing the template, wait for it
+                self._hits += 1
+            else:
+                self._misses += 1
+                pending = self._pending[key] = Future()
+                constructing = True
+        if template is None and not constructing:
+            template = pending.result()
+        elif template is None:
+            # Constructed outside the lock, as it may look up the models of the
+            # endpoint, so that hits on other keys are not held up
+            try:
+                template = self._factory(
+                    model_name=model_name,
+                    temperature=temperature,
+                    azure_endpoint=azure_endpoint,
+                )
+            except BaseException as e:
+                with self._lock:
+                    del self._pending[key]
+                pending.set_exception(e)
+                raise
+            with self._lock:
+                del self._pending[key]
+                self._templates[key] = template
+                if len(self._templates) > self.max_size:
+                    self._templates.popitem(last=False)
+            pending.set_result(template)
+        return template.fork()
+
+    def metrics(self) -> PoolMetrics:
+        """
+        Return the current pool metrics.
+
+        Returns
+        -------
+        PoolMetrics
+            The number of templates, hits and misses.
+        """
+        with self._lock:
+            return PoolMetrics(
+                size=len(self._templates), hits=self._hits, misses=self._misses
+            )
+
+    def clear(self) -> None:
+        """
+        Drop all templates and reset the metrics.
+        """
+        with self._lock:
+            self._templates.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+_default_pool = AIPool()
+
+
+def default_pool() -> AIPool:
+    """
+    Return the process-wide AI pool.
+
+    Returns
+    -------
+    AIPool
+        The pool shared by every `main` invocation in the process.
+    """
+    return _default_pool
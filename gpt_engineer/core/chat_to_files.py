@@ -6,34 +6,47 @@ new chat messages. Moreover, it aids in formatting and reading file content for
 
 Key Features:
 - Parse and extract code blocks from chat messages.
+- Write files while the chat is still being streamed.
 - Store and overwrite files within a workspace based on chat content.
 - Format files to be used as inputs for AI agents.
 - Retrieve files and their content based on a provided list.
 
 Dependencies:
 - `os` and `pathlib`: For handling OS-level operations and path manipulations.
-- `re`: For regex-based parsing of chat content.
 - `gpt_engineer.core.db`: Database handling functionalities for the workspace.
 - `gpt_engineer.cli.file_selector`: Constants related to file selection.
 
+Classes:
+- ChatParser: Single-pass parser of file names and fenced code blocks in a chat.
+- ChatFileStream: Writes files to a workspace as their code blocks finish streaming.
+
 Functions:
 - parse_chat: Extracts code blocks from chat messages.
+- clean_file_name: Strips the decorations around a file name preceding a code block.
 - to_files: Parses a chat and adds the extracted files to a workspace.
 - overwrite_files: Parses a chat and overwrites files in the workspace.
+- apply_file_edits: Overwrites existing workspace files with edited versions.
 - get_code_strings: Reads a file list and returns filenames and their content.
 - format_file_to_input: Formats a file's content for input to an AI agent.
 """
 
 import os
 from pathlib import Path
-import re
 
-from typing import List, Tuple
+from typing import Callable, Collection, Dict, List, Optional, Tuple
 
 from gpt_engineer.core.db import DB, DBs
+from gpt_engineer.core.db_backends import DirectoryBackend
+from gpt_engineer.core.tracing import span
 from gpt_engineer.cli.file_selector import FILE_LIST_NAME
 
 
+FENCE = "```"
+
+# Characters that are not allowed in file names
+_FILE_NAME_DELETE = str.maketrans("", "", ':<>"|?*')
+
+
 def parse_chat(chat) -> List[Tuple[str, str]]:
     """
     Extracts all code blocks from a chat and returns them
@@ -48,37 +61,207 @@ def parse_chat(chat) -> List[Tuple[str, str]]:
     -------
     List[Tuple[str, str]]
         A list of tuples, where each tuple contains a filename and a code block.
+        The last tuple is the README, all the text before the first code block.
     """
-    # Get all ``` blocks and preceding filenames
-    regex = r"(\S+)\n\s*```[^\n]*\n(.+?)```"
-    matches = re.finditer(regex, chat, re.DOTALL)
+    parser = ChatParser()
+    files = parser.feed(chat) + parser.close()
+    files.append(("README.md", parser.readme))
+    return files
 
-    files = []
-    for match in matches:
-        # Strip the filename of any non-allowed characters and convert / to \
-        path = re.sub(r'[\:<>"|?*]', "", match.group(1))
 
-        # Remove leading and trailing brackets
-        path = re.sub(r"^\[(.*)\]$", r"\1", path)
+def clean_file_name(name: str) -> str:
+    """
+    Strip the decorations models put around file names preceding a code block.
 
-        # Remove leading and trailing backticks
-        path = re.sub(r"^`(.*)`$", r"\1", path)
+    Parameters
+    ----------
+    name : str
+        The file name as written in the chat.
 
-        # Remove trailing ]
-        path = re.sub(r"[\]\:]$", "", path)
+    Returns
+    -------
+    str
+        The file name without non-allowed characters, brackets and backticks.
+    """
+    # Strip the filename of any non-allowed characters
+    path = name.translate(_FILE_NAME_DELETE)
 
-        # Get the code
-        code = match.group(2)
+    # Remove leading and trailing brackets or backticks
+    for left, right in ["[]", "``"]:
+        if len(path) >= 2 and path[0] == left and path[-1] == right:
+            path = path[1:-1]
 
-        # Add the file to the list
-        files.append((path, code))
+    # Remove trailing ]
+    if path.endswith("]"):
+        path = path[:-1]
 
-    # Get all the text before the first ``` block
-    readme = chat.split("```")[0]
-    files.append(("README.md", readme))
+    return path
 
-    # Return the files
-    return files
+
+class ChatParser:
+    """
+    Single-pass parser for chats made of file names, each followed by a fenced code block.
+
+    The chat is scanned once from start to end, either in one piece or as it streams
+    in, by jumping from one run of backticks to the next. A fence is a line starting
+    with three or more backticks. A code block is closed by a line of only backticks,
+    at least as many as its opening fence, so a block opened with four backticks can
+    contain three-backtick fences. Such backticks also close a block at the end of a
+    line of code, which is then its last line, without a newline; a block still open
+    at the end of the chat ends with it. Inside a block, fences with an info string
+    (like the ```bash of a README written by the model) open nested blocks, whose
+    closing fences do not end the file. The file name is the last word of the last
+    non-blank line before the opening fence; blocks after another block without any
+    text in between have no file name and are skipped.
+
+    Attributes
+    ----------
+    readme : Optional[str]
+        The text before the first fence, or the whole chat if there is none, once known.
+
+    Methods
+    -------
+    feed(text) -> List[Tuple[str, str]]:
+        Add the next piece of the chat and return the files it completes.
+    close() -> List[Tuple[str, str]]:
+        Mark the end of the chat and return the files completed by its last line.
+    """
+
+    def __init__(self):
+        self.readme: Optional[str] = None
+        # Text still needed after the last scan, and the pieces fed since then
+        self._buffer = ""
+        self._pieces: List[str] = []
+        self._pos = 0
+        # Whether the last scan stopped at a fence whose line had not ended yet
+        self._waiting = False
+        # Length of the opening fence of the current block, 0 outside of blocks
+        self._fence = 0
+        # Number of nested blocks open inside the current block
+        self._depth = 0
+        self._name: Optional[str] = None
+        self._code: List[str] = []
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """
+        Add the next piece of the chat.
+
+        Parameters
+        ----------
+        text : str
+            The next piece of the chat.
+
+        Returns
+        -------
+        List[Tuple[str, str]]
+            The (filename, codeblock) tuples of the code blocks closed by this piece.
+        """
+        self._pieces.append(text)
+        if "`" in text or (self._waiting and "\n" in text):
+            return self._scan(final=False)
+        # Nothing that could start or complete a fence line
+        return []
+
+    def close(self) -> List[Tuple[str, str]]:
+        """
+        Mark the end of the chat. A code block that was never closed ends with it.
+
+        Returns
+        -------
+        List[Tuple[str, str]]
+            The (filename, codeblock) tuples of the code blocks closed by the last line,
+            or left open.
+        """
+        files = self._scan(final=True)
+        if self.readme is None:
+            self.readme = self._buffer
+        elif self._fence and self._name is not None:
+            files.append((self._name, "".join(self._code) + self._buffer))
+        self._buffer = ""
+        self._pos = 0
+        self._fence = 0
+        return files
+
+    def _scan(self, final: bool) -> List[Tuple[str, str]]:
+        text = self._buffer + "".join(self._pieces)
+        self._pieces = []
+        self._waiting = False
+        files = []
+        pos = self._pos
+        # Start of the text still needed: the code of the current block, or the text
+        # since the last block, which holds the file name of the next one
+        start = 0
+        while True:
+            i = text.find(FENCE, pos)
+            if i < 0:
+                # A fence may be split across pieces
+                pos = max(pos, len(text) - len(FENCE) + 1)
+                break
+            ticks = _backtick_run(text, i)
+            line_start = text.rfind("\n", 0, i) + 1
+            inline = bool(text[line_start:i].strip())
+            if inline and (not self._fence or self._depth or ticks < self._fence):
+                # Backticks inside a line are not a fence
+                pos = i + ticks
+                continue
+            line_end = text.find("\n", i)
+            if line_end < 0:
+                if not final:
+                    pos = i
+                    self._waiting = True
+                    break
+                line_end = len(text)
+            has_info = bool(text[i + ticks : line_end].strip())
+
+            if inline:
+                if not has_info:
+                    # A fence at the end of the last line of code closes the block
+                    files.extend(self._end_block(text[start:i]))
+                    start = line_end + 1
+            elif not self._fence:
+                if self.readme is None:
+                    self.readme = text[:i]
+                name_line = text[start:line_start].rstrip()
+                words = name_line[name_line.rfind("\n") + 1 :].split()
+                self._name = clean_file_name(words[-1]) if words else None
+                self._fence = ticks
+                self._depth = 0
+                self._code = []
+                start = line_end + 1
+            elif ticks >= self._fence:
+                if has_info:
+                    self._depth += 1
+                elif self._depth:
+                    self._depth -= 1
+                else:
+                    files.extend(self._end_block(text[start:line_start]))
+                    start = line_end + 1
+            pos = line_end + 1
+
+        start = min(start, len(text))
+        if self._fence and pos - start > 4096:
+            # Keep only the unscanned lines of long blocks in the buffer
+            scanned = max(start, text.rfind("\n", start, pos) + 1)
+            self._code.append(text[start:scanned])
+            start = scanned
+        self._buffer = text[start:]
+        self._pos = max(pos - start, 0)
+        return files
+
+    def _end_block(self, code: str) -> List[Tuple[str, str]]:
+        # Closes the current block, whose code ends with `code`
+        self._code.append(code)
+        files = [(self._name, "".join(self._code))] if self._name is not None else []
+        self._fence = 0
+        self._code = []
+        return files
+
+
+def _backtick_run(text: str, i: int) -> int:
+    j = i
+    while j < len(text) and text[j] == "`":
+        j += 1
+    return j - i
 
 
 def to_files(chat: str, workspace: DB):
@@ -92,14 +275,93 @@ def to_files(chat: str, workspace: DB):
     workspace : DB
         The workspace to add the files to.
     """
-    workspace["all_output.txt"] = chat  # TODO store this in memory db instead
+    with span("to_files", **{"chat.chars": len(chat)}) as parse_span:
+        workspace["all_output.txt"] = chat  # TODO store this in memory db instead
 
-    files = parse_chat(chat)
-    for file_name, file_content in files:
-        workspace[file_name] = file_content
+        files = parse_chat(chat)
+        for file_name, file_content in files:
+            workspace[file_name] = file_content
+        parse_span.set_attribute("files", len(files))
+
+
+class ChatFileStream:
+    """
+    Extract files from a chat while it is still being generated.
 
+    Tokens are fed in as the model streams them to the same `ChatParser` that
+    `parse_chat` uses. As soon as the line closing a code block has arrived, the file
+    is written to the workspace, so consumers can start on it before the completion
+    ends. `finish` then writes what can only be known at the end (the README and the
+    full output) and any file the stream did not produce, e.g. when the completion was
+    replayed from a cache without streaming.
 
-def overwrite_files(chat: str, dbs: DBs) -> None:
+    Attributes
+    ----------
+    workspace : DB
+        The workspace the files are written to.
+    on_file : Optional[Callable[[str, str], None]]
+        Called with the name and content of every file written while streaming.
+    written : Dict[str, str]
+        The files written while streaming, by name.
+    """
+
+    def __init__(
+        self, workspace: DB, on_file: Optional[Callable[[str, str], None]] = None
+    ):
+        self.workspace = workspace
+        self.on_file = on_file
+        self.written: Dict[str, str] = {}
+        self._parser = ChatParser()
+
+    def feed(self, token: str) -> List[str]:
+        """
+        Add a streamed token and write the files whose code blocks it completes.
+
+        Parameters
+        ----------
+        token : str
+            The next piece of the completion.
+
+        Returns
+        -------
+        List[str]
+            The names of the files written.
+        """
+        names = []
+        for file_name, file_content in self._parser.feed(token):
+            self.workspace[file_name] = file_content
+            self.written[file_name] = file_content
+            if self.on_file is not None:
+                self.on_file(file_name, file_content)
+            names.append(file_name)
+        return names
+
+    def reset(self) -> None:
+        """
+        Drop the partial output, e.g. when the request is retried from scratch.
+        """
+        self._parser = ChatParser()
+
+    def finish(self, chat: str) -> None:
+        """
+        Write the full output, the README and the files not already written by `feed`.
+
+        Parameters
+        ----------
+        chat : str
+            The complete chat.
+        """
+        with span("to_files", **{"chat.chars": len(chat)}) as parse_span:
+            self.workspace["all_output.txt"] = chat
+            files = parse_chat(chat)
+            for file_name, file_content in files:
+                if self.written.get(file_name) != file_content:
+                    self.workspace[file_name] = file_content
+            parse_span.set_attributes(files=len(files), streamed_files=len(self.written))
+        self._parser = ChatParser()
+
+
+def overwrite_files(chat: str, dbs: DBs, skip: Collection[str] = ()) -> None:
     """
     Parse the chat and overwrite all files in the workspace.
 
@@ -109,22 +371,46 @@ def overwrite_files(chat: str, dbs: DBs) -> None:
         The chat containing the AI-modified code.
     dbs : DBs
         The database containing the workspace with file paths.
+    skip : Collection[str], optional
+        Files that must not be overwritten, e.g. those only sent in part.
     """
     dbs.memory["all_output_overwrite.txt"] = chat
 
-    files = fileNames
+    with span("parse_chat", **{"chat.chars": len(chat)}):
+        files = parse_chat(chat)
     print("files: ", files)
+    apply_file_edits(files, dbs, skip)
+
+
+def apply_file_edits(
+    files: List[Tuple[str, str]], dbs: DBs, skip: Collection[str] = ()
+) -> None:
+    """
+    Overwrite existing workspace files with edited versions.
+
+    The README the model describes its changes in is stored in memory instead, and
+    files that are not in the workspace or are to be skipped are left unchanged with
+    a warning.
+
+    Parameters
+    ----------
+    files : List[Tuple[str, str]]
+        The names and new contents of the files.
+    dbs : DBs
+        The database containing the workspace with file paths.
+    skip : Collection[str], optional
+        Files that must not be overwritten, e.g. those only sent in part.
+    """
     for file_name, file_content in files:
-        if file_name == "README.md":
+        if file_name in skip:
+            print(f"Warning: File '{file_name}' was only sent in part, not overwriting.")
+        elif file_name == "README.md":
             dbs.memory["LAST_MODIFICATION_README.md"] = file_content
         else:
             # Check if the file name exists in the workspace
-            if file_name in dbs.workspace.data[dbs.workspace.identifier]:
-                # Retrieve the file path from the workspace data
-                file_path = dbs.workspace.data[dbs.workspace.identifier][file_name]
+            if file_name in dbs.workspace:
                 # Write the modified code to the respective file
-                with open(file_path, 'w') as file:
-                    file.write(file_content)
+                dbs.workspace[file_name] = file_content
             else:
                 print(f"Warning: File '{file_name}' not found in workspace.")
 
@@ -147,7 +433,21 @@ def get_code_strings(workspace: DB, metadata_db: DB) -> dict[str, str]:
     -------
     dict[str, str]
         A dictionary mapping file names to their content.
+
+    Notes
+    -----
+    For workspaces that are not stored in a directory, the file list holds file names
+    in the workspace, and a name ending in "/" selects all files below it.
     """
+    files_paths = metadata_db[FILE_LIST_NAME].strip().split("\n")
+    if not isinstance(workspace.backend, DirectoryBackend):
+        prefixes = tuple(p.strip() for p in files_paths if p.strip().endswith("/"))
+        selected = {p.strip() for p in files_paths}
+        return {
+            name: content
+            for name, content in workspace.items()
+            if name in selected or name.startswith(prefixes)
+        }
 
     def get_all_files_in_dir(directory):
         for root, dirs, files in os.walk(directory):
@@ -156,7 +456,6 @@ def get_code_strings(workspace: DB, metadata_db: DB) -> dict[str, str]:
         for dir in dirs:
             yield from get_all_files_in_dir(os.path.join(root, dir))
 
-    files_paths = metadata_db[FILE_LIST_NAME].strip().split("\n")
     files = []
 
     for full_file_path in files_paths:
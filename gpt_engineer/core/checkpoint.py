@@ -0,0 +1,284 @@
+"""
+Checkpointing of step outputs, so that a failed run can resume where it failed.
+
+After every step, `Checkpoints` stores what the step produced: its messages and the
+digests of the files it wrote to the databases it declares in its `StepIO`, not their
+contents, so checkpointing does not copy the workspace. The checkpoint is keyed by a
+fingerprint of the step's inputs: the digests of the files it declares to read, the
+model and temperature, and the source of the step. When a run is resumed, a step whose
+checkpoint matches the current fingerprint, and whose files still hold what it wrote,
+is not run again; its messages are restored from the checkpoint instead. A retry after
+e.g. a rate limit in `gen_entrypoint` then only pays for the steps from the one that
+failed, while a step whose inputs changed (an edited prompt, a different model,
+regenerated code) or whose files were changed or removed since runs again, along with
+everything downstream of it whose inputs it changes.
+
+Checkpoints are stored in the memory database under `checkpoints/<step>.json`, so
+they are archived along with the memory when a new run starts from scratch.
+
+Classes:
+- Checkpoints: Fingerprints, stores and restores the outputs of steps.
+- PendingCheckpoint: The checkpoint of a step that is about to run.
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import weakref
+
+from dataclasses import fields
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from gpt_engineer.core.ai import AI
+from gpt_engineer.core.db import DB, DBs
+from gpt_engineer.core.domain import Step
+from gpt_engineer.core.scheduler import ANYTHING, CONSOLE, UNDECLARED, StepIO, _overlap
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PREFIX = "checkpoints/"
+
+# Databases left out of the inputs of undeclared steps: the runner rewrites the logs
+# after every step, and the archive only holds earlier runs
+_NOT_INPUTS = ("logs", "archive")
+
+
+class Checkpoints:
+    """
+    Fingerprints, stores and restores the outputs of steps.
+
+    Attributes
+    ----------
+    db : DB
+        The database the checkpoints are stored in, usually the memory.
+    io : Mapping[Step, StepIO]
+        The declared resources of the steps.
+    resume : bool
+        Whether steps with a matching checkpoint are restored instead of run.
+
+    Methods
+    -------
+    begin(ai, dbs, step) -> PendingCheckpoint:
+        Fingerprint a step before it runs and restore it if possible.
+    """
+
+    def __init__(self, db: DB, io: Mapping[Step, StepIO], resume: bool = False):
+        """
+        Initialize the Checkpoints class.
+
+        Parameters
+        ----------
+        db : DB
+            The database the checkpoints are stored in, usually the memory.
+        io : Mapping[Step, StepIO]
+            The declared resources of the steps.
+        resume : bool, optional
+            Whether to restore steps with a matching checkpoint, by default False.
+        """
+        self.db = db
+        self.io = io
+        self.resume = resume
+
+    def begin(self, ai: AI, dbs: DBs, step: Step) -> "PendingCheckpoint":
+        """
+        Fingerprint the inputs of a step before it runs and restore it if possible.
+
+        Parameters
+        ----------
+        ai : AI
+            The AI the step runs with.
+        dbs : DBs
+            The databases of the run.
+        step : Step
+            The step about to run.
+
+        Returns
+        -------
+        PendingCheckpoint
+            The restored messages if the step was restored, and otherwise the handle
+            to store its outputs with once it is done.
+        """
+        declared = self.io.get(step, UNDECLARED)
+        fingerprint = self.fingerprint(ai, dbs, step, declared)
+        pending = PendingCheckpoint(self, dbs, step, declared, fingerprint)
+        if self.resume:
+            pending.restored = self._restore(dbs, step, fingerprint)
+        return pending
+
+    def fingerprint(
+        self, ai: AI, dbs: DBs, step: Step, declared: Optional[StepIO] = None
+    ) -> str:
+        """
+        Return the fingerprint of the inputs of a step.
+
+        Parameters
+        ----------
+        ai : AI
+            The AI the step runs with.
+        dbs : DBs
+            The databases of the run.
+        step : Step
+            The step.
+        declared : Optional[StepIO], optional
+            The resources of the step, by default looked up in `io`.
+
+        Returns
+        -------
+        str
+            A hex digest that changes whenever a file the step reads changes.
+        """
+        if declared is None:
+            declared = self.io.get(step, UNDECLARED)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(_step_source_digest(step))
+        h.update(
+            repr(
+                (getattr(ai, "model_name", None), getattr(ai, "temperature", None))
+            ).encode()
+        )
+        for resource in sorted(set(declared.reads)):
+            # The log of a step is what it produced, not what it read
+            if resource in (CONSOLE, f"logs/{step.__name__}"):
+                continue
+            h.update(b"\0" + resource.encode("utf-8"))
+            for name, digest in self._inputs(dbs, resource):
+                h.update(b"\1" + name.encode("utf-8") + b"\1" + (digest or b"-"))
+        return h.hexdigest()
+
+    def _inputs(self, dbs: DBs, resource: str) -> Iterable[Tuple[str, Optional[bytes]]]:
+        if resource == ANYTHING:
+            for field in fields(dbs):
+                if field.name not in _NOT_INPUTS:
+                    yield from self._inputs(dbs, field.name)
+            return
+        field, _, key = resource.partition("/")
+        db: DB = getattr(dbs, field)
+        if key and key in db:
+            yield resource, db.digest(key)
+            return
+        for name in sorted(db):
+            if db is self.db and name.startswith(CHECKPOINT_PREFIX):
+                continue
+            if not key or name.startswith(key + "/"):
+                yield f"{field}/{name}", db.digest(name)
+
+    def _restore(self, dbs: DBs, step: Step, fingerprint: str) -> Optional[list]:
+        stored = self.db.get(_checkpoint_key(step))
+        if stored is None:
+            return None
+        checkpoint = json.loads(stored)
+        if checkpoint.get("fingerprint") != fingerprint:
+            logger.info(f"Running {step.__name__} again: its inputs changed")
+            return None
+        for field, files in checkpoint["writes"].items():
+            db: DB = getattr(dbs, field)
+            for name, digest in files.items():
+                current = db.digest(name)
+                if current is None or current.hex() != digest:
+                    logger.info(f"Running {step.__name__} again: its outputs changed")
+                    return None
+        logger.info(f"Resumed {step.__name__} from its checkpoint")
+        return AI.deserialize_messages(checkpoint["messages"])
+
+
+class PendingCheckpoint:
+    """
+    The checkpoint of a step that is about to run.
+
+    Attributes
+    ----------
+    fingerprint : str
+        The fingerprint of the inputs of the step.
+    restored : Optional[list]
+        The messages of the step if it was restored from a checkpoint, in which case
+        it must not run.
+
+    Methods
+    -------
+    save(messages):
+        Store the outputs of the step once it is done.
+    """
+
+    def __init__(
+        self,
+        checkpoints: Checkpoints,
+        dbs: DBs,
+        step: Step,
+        declared: StepIO,
+        fingerprint: str,
+    ):
+        self.fingerprint = fingerprint
+        self.restored: Optional[list] = None
+        self._checkpoints = checkpoints
+        self._dbs = dbs
+        self._step = step
+        self._writes = [resource for resource in declared.writes if resource != CONSOLE]
+        self._generations: Dict[str, int] = {
+            field: getattr(dbs, field).generation
+            for field in _written_fields(self._writes, dbs)
+        }
+
+    def save(self, messages: list) -> None:
+        """
+        Store the messages of the step and the digests of the files it wrote.
+
+        Only files changed since the step started and within its declared writes are
+        recorded, so the files of steps running concurrently are not attributed to it.
+
+        Parameters
+        ----------
+        messages : list
+            The messages the step returned.
+        """
+        writes: Dict[str, Dict[str, str]] = {}
+        store = self._checkpoints.db
+        for field, generation in self._generations.items():
+            db: DB = getattr(self._dbs, field)
+            files = {}
+            for name in db.changed_since(generation):
+                if db is store and name.startswith(CHECKPOINT_PREFIX):
+                    continue
+                if not any(_overlap(f"{field}/{name}", res) for res in self._writes):
+                    continue
+                digest = db.digest(name)
+                if digest is not None:
+                    files[name] = digest.hex()
+            if files:
+                writes[field] = files
+        store[_checkpoint_key(self._step)] = json.dumps(
+            {
+                "step": self._step.__name__,
+                "fingerprint": self.fingerprint,
+                "messages": AI.serialize_messages(messages),
+                "writes": writes,
+            }
+        )
+
+
+def _written_fields(writes: List[str], dbs: DBs) -> List[str]:
+    if ANYTHING in writes:
+        return [field.name for field in fields(dbs) if field.name != "archive"]
+    return sorted({resource.partition("/")[0] for resource in writes})
+
+
+def _checkpoint_key(step: Step) -> str:
+    return f"{CHECKPOINT_PREFIX}{step.__name__}.json"
+
+
+_source_digests: "weakref.WeakKeyDictionary[Step, bytes]" = weakref.WeakKeyDictionary()
+
+
+def _step_source_digest(step: Step) -> bytes:
+    # Changing the code of a step invalidates its checkpoints
+    digest = _source_digests.get(step)
+    if digest is None:
+        try:
+            source = inspect.getsource(step).encode("utf-8")
+        except (OSError, TypeError):
+            source = getattr(getattr(step, "__code__", None), "co_code", b"")
+        name = f"{step.__module__}.{step.__qualname__}:{step.__name__}".encode("utf-8")
+        digest = _source_digests[step] = hashlib.blake2b(
+            name + b"\0" + source, digest_size=16
+        ).digest()
+    return digest
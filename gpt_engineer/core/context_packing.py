@@ -0,0 +1,346 @@
+"""
+Packing of the files of an improve request into the model's context window.
+
+`get_code_strings` returns the full contents of every selected file, and improving
+code used to send all of them, whether or not the request then fit the window of the
+model. `pack_context` ranks the files by their lexical relevance to the request, a
+BM25 score of the request's identifiers over chunks of the files, computed locally,
+and fills a token budget in that order: the most relevant files are sent in full,
+less relevant ones as read-only excerpts (their definition lines and their most
+relevant chunks), and files that do not fit at all are only named. When every file
+fits, all of them are sent in full and nothing is ranked.
+
+The budget of a request is derived from the model's context window, less the tokens
+reserved for the completion, and can be lowered further to trade context for
+shorter, cheaper prompts.
+
+Classes:
+- Chunk: A range of lines of a file, scored for relevance.
+- PackedContext: The files, excerpts and dropped files of a request.
+
+Functions:
+- context_window: Returns the context window of a model.
+- prompt_budget: Returns the number of prompt tokens of a request to the model.
+- split_chunks: Splits a file into chunks at top-level definitions.
+- score_chunks: Scores chunks by their relevance to a query.
+- pack_context: Packs files into a token budget by relevance.
+
+Environment:
+- GPTE_CONTEXT_WINDOW: The context window in tokens, overriding the model's.
+- GPTE_COMPLETION_TOKENS: The tokens reserved for the completion (default a quarter
+  of the window).
+- GPTE_CONTEXT_TOKENS: A lower limit on the prompt tokens of a request.
+"""
+
+import math
+import os
+import re
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Mapping, Set
+
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-1106-preview": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+}
+"""
+Context windows in tokens, by model name. Versioned names (e.g. "gpt-4-0613") take
+the window of their longest listed prefix.
+"""
+
+DEFAULT_CONTEXT_WINDOW = 4096
+CHUNK_LINES = 60
+
+# Lines that open a definition and are kept in excerpts
+_DEFINITION = re.compile(r"^\s*(?:async\s+def|def|class|function|export|interface)\b")
+_BOUNDARY = re.compile(r"^(?:async\s+def|def|class|function|export|@)")
+_WORD = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+_STOP_WORDS = {"the", "and", "for", "with", "that", "this", "from", "into", "are", "not"}
+
+
+def context_window(model: str) -> int:
+    """
+    Return the context window of a model, or of GPTE_CONTEXT_WINDOW if set.
+
+    Parameters
+    ----------
+    model : str
+        The name of the model.
+
+    Returns
+    -------
+    int
+        The number of tokens of prompt and completion the model accepts.
+    """
+    if os.getenv("GPTE_CONTEXT_WINDOW"):
+        return int(os.environ["GPTE_CONTEXT_WINDOW"])
+    prefixes = [name for name in MODEL_CONTEXT_WINDOWS if model.startswith(name)]
+    if not prefixes:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(prefixes, key=len)]
+
+
+def prompt_budget(model: str, limited: bool = True) -> int:
+    """
+    Return the number of prompt tokens of a request to a model.
+
+    This is the context window less the tokens reserved for the completion, at most
+    GPTE_CONTEXT_TOKENS.
+
+    Parameters
+    ----------
+    model : str
+        The name of the model.
+    limited : bool, optional
+        Whether GPTE_CONTEXT_TOKENS applies, by default True. Without it, the budget
+        is the most that fits the window.
+
+    Returns
+    -------
+    int
+        The prompt token budget.
+    """
+    window = context_window(model)
+    reserved = int(os.getenv("GPTE_COMPLETION_TOKENS", str(window // 4)))
+    budget = window - reserved
+    if limited and os.getenv("GPTE_CONTEXT_TOKENS"):
+        budget = min(budget, int(os.environ["GPTE_CONTEXT_TOKENS"]))
+    return budget
+
+
+@dataclass
+class Chunk:
+    """
+    A range of lines of a file.
+
+    Attributes
+    ----------
+    file : str
+        The name of the file.
+    start : int
+        The index of the first line.
+    end : int
+        The index after the last line.
+    text : str
+        The lines of the chunk.
+    score : float
+        The relevance of the chunk to the query.
+    """
+
+    file: str
+    start: int
+    end: int
+    text: str
+    score: float = 0.0
+
+
+@dataclass
+class PackedContext:
+    """
+    The files of a request, packed into a token budget.
+
+    Attributes
+    ----------
+    files : Dict[str, str]
+        The files sent in full, which the model may edit.
+    excerpts : Dict[str, str]
+        The files sent in part, for reference only.
+    dropped : List[str]
+        The files that were left out.
+    tokens : int
+        The number of tokens of the files and excerpts.
+    """
+
+    files: Dict[str, str] = field(default_factory=dict)
+    excerpts: Dict[str, str] = field(default_factory=dict)
+    dropped: List[str] = field(default_factory=list)
+    tokens: int = 0
+
+    @property
+    def trimmed(self) -> Set[str]:
+        """
+        The names of the files that were not sent in full.
+        """
+        return set(self.excerpts) | set(self.dropped)
+
+    def report(self) -> Dict[str, List[str]]:
+        """
+        Return the names of the files by how they were sent.
+        """
+        return {
+            "full": sorted(self.files),
+            "excerpts": sorted(self.excerpts),
+            "dropped": sorted(self.dropped),
+        }
+
+
+def _terms(text: str) -> List[str]:
+    # Splits identifiers, e.g. "parseChatFile" and "parse_chat_file" alike
+    words = (word.lower() for word in _WORD.findall(text))
+    return [word for word in words if len(word) > 2 and word not in _STOP_WORDS]
+
+
+def split_chunks(file_name: str, text: str) -> List[Chunk]:
+    """
+    Split a file into chunks at top-level definitions.
+
+    A chunk starts at every unindented definition or decorator that follows a blank
+    line, and chunks longer than CHUNK_LINES are split further.
+
+    Parameters
+    ----------
+    file_name : str
+        The name of the file.
+    text : str
+        The content of the file.
+
+    Returns
+    -------
+    List[Chunk]
+        The chunks, covering all lines of the file.
+    """
+    lines = text.splitlines(keepends=True)
+    starts = [0]
+    for i, line in enumerate(lines):
+        if i == 0:
+            continue
+        if i - starts[-1] >= CHUNK_LINES or (
+            _BOUNDARY.match(line) and not lines[i - 1].strip()
+        ):
+            starts.append(i)
+    ends = starts[1:] + [len(lines)]
+    return [
+        Chunk(file_name, start, end, "".join(lines[start:end]))
+        for start, end in zip(starts, ends)
+        if end > start
+    ]
+
+
+def score_chunks(chunks: List[Chunk], query: str, k1: float = 1.2, b: float = 0.75):
+    """
+    Score chunks by their BM25 relevance to a query, in place.
+
+    Query terms that occur in the name of a chunk's file count as occurring in the
+    chunk, so that e.g. "fix the parser" ranks parser.py.
+
+    Parameters
+    ----------
+    chunks : List[Chunk]
+        The chunks of all files.
+    query : str
+        The request.
+    k1 : float, optional
+        The saturation of term frequencies, by default 1.2.
+    b : float, optional
+        The normalization by chunk length, by default 0.75.
+    """
+    query_terms = set(_terms(query))
+    if not chunks or not query_terms:
+        return
+    counts = [Counter(_terms(chunk.file) + _terms(chunk.text)) for chunk in chunks]
+    lengths = [sum(count.values()) for count in counts]
+    average = sum(lengths) / len(lengths) or 1.0
+    frequencies = Counter(term for count in counts for term in count)
+    for chunk, count, length in zip(chunks, counts, lengths):
+        score = 0.0
+        for term in query_terms & set(count):
+            idf = math.log(
+                1 + (len(chunks) - frequencies[term] + 0.5) / (frequencies[term] + 0.5)
+            )
+            tf = count[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average))
+        chunk.score = score
+
+
+def _excerpt(text: str, chunks: Iterable[Chunk]) -> str:
+    # The definition lines of the file and the lines of the given chunks, with the
+    # omitted lines marked
+    lines = text.splitlines(keepends=True)
+    keep = {i for i, line in enumerate(lines) if _DEFINITION.match(line)}
+    for chunk in chunks:
+        keep.update(range(chunk.start, chunk.end))
+    parts: List[str] = []
+    for i, line in enumerate(lines):
+        if i in keep:
+            parts.append(line if line.endswith("\n") else line + "\n")
+        elif not parts or parts[-1] != "...\n":
+            parts.append("...\n")
+    return "".join(parts)
+
+
+def pack_context(
+    files: Mapping[str, str],
+    query: str,
+    budget: int,
+    count_tokens: Callable[[str, str], int],
+) -> PackedContext:
+    """
+    Pack files into a token budget, by relevance to a query.
+
+    If all files fit, all are sent in full. Otherwise the files are taken from the
+    most to the least relevant: a file is sent in full if it fits the remaining
+    budget, else as an excerpt of its definition lines extended by its relevant
+    chunks while they fit, else it is dropped.
+
+    Parameters
+    ----------
+    files : Mapping[str, str]
+        The names and contents of the files.
+    query : str
+        The request the files are sent with.
+    budget : int
+        The number of tokens available for the files.
+    count_tokens : Callable[[str, str], int]
+        Counts the prompt tokens of a file, given its name and content.
+
+    Returns
+    -------
+    PackedContext
+        The files, excerpts and dropped files.
+    """
+    tokens = {name: count_tokens(name, content) for name, content in files.items()}
+    if sum(tokens.values()) <= budget:
+        return PackedContext(dict(files), tokens=sum(tokens.values()))
+
+    chunks = {name: split_chunks(name, content) for name, content in files.items()}
+    score_chunks(
+        [chunk for file_chunks in chunks.values() for chunk in file_chunks], query
+    )
+    relevance = {
+        name: max((chunk.score for chunk in file_chunks), default=0.0)
+        for name, file_chunks in chunks.items()
+    }
+
+    packed = PackedContext()
+    remaining = budget
+    # Ties, e.g. without any matching terms, favor smaller files
+    for name in sorted(files, key=lambda name: (-relevance[name], tokens[name], name)):
+        if tokens[name] <= remaining:
+            packed.files[name] = files[name]
+            remaining -= tokens[name]
+            continue
+        selected: List[Chunk] = []
+        excerpt = _excerpt(files[name], selected)
+        excerpt_tokens = count_tokens(name, excerpt)
+        if excerpt_tokens > remaining:
+            packed.dropped.append(name)
+            continue
+        for chunk in sorted(chunks[name], key=lambda chunk: -chunk.score):
+            if chunk.score <= 0:
+                break
+            candidate = _excerpt(files[name], selected + [chunk])
+            candidate_tokens = count_tokens(name, candidate)
+            if candidate_tokens <= remaining:
+                selected.append(chunk)
+                excerpt, excerpt_tokens = candidate, candidate_tokens
+        packed.excerpts[name] = excerpt
+        remaining -= excerpt_tokens
+    packed.tokens = budget - remaining
+    return packed
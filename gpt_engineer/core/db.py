@@ -1,48 +1,113 @@
 """
-Module for simple file-based key-value database management.
+Module for simple key-value database management.
 
-This module provides a simple file-based key-value database system, where keys are
-represented as filenames and values are the contents of these files. The primary class,
-DB, is responsible for the CRUD operations on the database. Additionally, the module
-provides a dataclass `DBs` that encapsulates multiple `DB` instances to represent different
-databases like memory, logs, preprompts, etc.
+This module provides a simple key-value database system, where keys are filenames and
+values are the contents of these files. The primary class, DB, is responsible for the
+CRUD operations on the database and stores its data in a pluggable backend (see
+`gpt_engineer.core.db_backends`): the request body, a directory, a SQLite file or a
+pack file. Additionally, the module provides a dataclass `DBs` that encapsulates
+multiple `DB` instances to represent different databases like memory, logs,
+preprompts, etc.
 
 Functions:
+    content_digest(content: str) -> bytes:
+        Returns the digest identifying the content of a file.
+
     archive(dbs: DBs) -> None:
-        Archives the memory and workspace databases, moving their contents to
-        the archive database with a timestamp.
+        Archives the memory and workspace databases, storing snapshots of their
+        contents in the archive database with a timestamp.
+
+    backends_from_env() -> Dict[str, Backend]:
+        Opens the backends selected for the databases through GPTE_DB_BACKENDS.
 
 Classes:
     DB:
-        A simple key-value store implemented as a file-based system.
+        A simple key-value store backed by a storage backend.
 
     DBs:
         A dataclass containing multiple DB instances representing different databases.
 
+    Files:
+        The dict holding the contents of a dict-backed DB, copied on write once
+        snapshotted.
+
 Imports:
     - datetime: For timestamp generation when archiving.
-    - shutil: For moving directories during archiving.
+    - difflib: For diffs of changed files.
+    - hashlib: For content digests of files.
     - dataclasses: For the DBs dataclass definition.
+    - gpt_engineer.core.tracing: For the time spent reading, writing and archiving.
     - pathlib: For path manipulations.
     - typing: For type annotations.
 """
 
 import datetime
-from dataclasses import dataclass
+import difflib
+import hashlib
+import json
+import os
+import threading
+import time
+
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+from gpt_engineer.core.db_backends import (
+    Backend,
+    DictBackend,
+    DirectoryBackend,
+    Files,  # noqa: F401 (re-exported)
+    open_backend,
+)
+from gpt_engineer.core.spill import spill_store_from_env
+from gpt_engineer.core.tracing import current_span, span
+
+
+def content_digest(content: str) -> bytes:
+    """
+    Return the digest identifying the content of a file.
 
-# This class represents a simple database that stores its data as files in a directory.
+    Parameters
+    ----------
+    content : str
+        The content of the file.
+
+    Returns
+    -------
+    bytes
+        The 16-byte BLAKE2b digest of the UTF-8 encoded content.
+    """
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+
+# This class represents a simple key-value store over a storage backend.
 class DB:
     """
-    A file-based key-value store where keys correspond to filenames and values to file contents.
+    A key-value store where keys correspond to filenames and values to file contents.
+
+    This class provides a dict-like interface to a storage backend. It allows for quick
+    checks on the existence of keys, retrieval of values based on keys, and setting new
+    key-value pairs. The backend is chosen by the arguments: a dict and an identifier
+    store the files in `data[identifier]` (spilling large values to disk if
+    GPTE_SPILL_BUDGET_MB is set), a path stores them as files in a directory
+    (as the original file-based DB did), and any other backend can be passed directly.
 
-    This class provides an interface to a file-based database, leveraging file operations to
-    facilitate CRUD-like interactions. It allows for quick checks on the existence of keys,
-    retrieval of values based on keys, and setting new key-value pairs.
+    Writing the content a file already has is a no-op, and every write that changes a
+    file increments `generation`, so callers can ask which files changed since a
+    generation and only process those. Writes are compared with what the backend holds
+    at the time, so files changed behind the back of the DB (e.g. edited on disk, or
+    written by another DB over the same store) are written again, but only writes
+    through the DB count as changes.
 
     Attributes
     ----------
+    backend : Backend
+        The storage backend holding the files.
     path : Path
-        The directory path where the database files are stored.
+        The directory where the database files are stored, for directory backends.
+    generation : int
+        The number of writes that changed a file.
 
     Methods
     -------
@@ -58,6 +123,27 @@ class DB:
     __setitem__(key: Union[str, Path], val: str):
         Set or update the content of a file in the database.
 
+    __iter__() -> Iterator[str]:
+        Iterate over the names of the files in the database.
+
+    items() -> Iterator[Tuple[str, Any]]:
+        Iterate over the names and contents of the files in the database.
+
+    snapshot() -> Mapping[str, Any]:
+        Return the current contents as a snapshot that later writes do not change.
+
+    flush() -> None:
+        Wait until all writes so far are persisted by the backend.
+
+    digest(key: str) -> Optional[bytes]:
+        Return the content digest of a file.
+
+    changed_since(generation: int) -> List[str]:
+        Return the names of the files changed after a generation.
+
+    diff(base: Mapping[str, Any], since: int = 0) -> Iterator[str]:
+        Iterate over the unified diff of the changed files against a snapshot.
+
     Note:
     -----
     Care should be taken when choosing keys (filenames) to avoid potential
@@ -67,25 +153,183 @@ class DB:
 
     """A simple key-value store, where keys are filenames and values are file contents."""
 
-    def __init__(self, data: dict, identifier: str):
-        self.data = data
-        self.identifier = identifier
-        if self.identifier not in self.data:
-            self.data[self.identifier] = {}
+    def __init__(
+        self,
+        data: Union[dict, str, Path, None] = None,
+        identifier: Optional[str] = None,
+        backend: Optional[Backend] = None,
+    ):
+        """
+        Initialize the DB class.
+
+        Parameters
+        ----------
+        data : Union[dict, str, Path, None]
+            The request body holding the files under `identifier`, or the path to the
+            directory where the files are stored.
+        identifier : Optional[str]
+            The key of the files in the request body.
+        backend : Optional[Backend]
+            The storage backend, overriding `data` and `identifier`.
+        """
+        if backend is None:
+            if isinstance(data, (str, Path)):
+                backend = DirectoryBackend(data)
+            else:
+                assert data is not None and identifier is not None
+                backend = DictBackend(data, identifier, spill=spill_store_from_env())
+        self.backend = backend
+        self.generation = 0
+        self._lock = threading.Lock()
+        # Files by the generation of their last change, most recent last
+        self._changes: Dict[str, int] = {}
+
+    @property
+    def path(self) -> Path:
+        if not isinstance(self.backend, DirectoryBackend):
+            raise AttributeError(
+                f"{type(self.backend).__name__} databases are not stored in a directory"
+            )
+        return self.backend.path
 
     def __contains__(self, key):
-        return key in self.data[self.identifier]
+        return key in self.backend
 
     def __getitem__(self, key):
-        if key not in self.data[self.identifier]:
+        val = self._read(key)
+        if val is None:
             raise KeyError(f"Key '{key}' not found")
-        return self.data[self.identifier][key]
+        return val
 
     def get(self, key, default=None):
-        return self.data[self.identifier].get(key, default)
+        val = self._read(key)
+        return default if val is None else val
+
+    def _read(self, key):
+        # Reads are counted on the span of the step doing them, when tracing
+        io_span = current_span()
+        if not io_span.recording:
+            return self.backend.read(key)
+        start = time.perf_counter()
+        val = self.backend.read(key)
+        io_span.add("db.reads", 1)
+        io_span.add("db.read_seconds", time.perf_counter() - start)
+        return val
 
     def __setitem__(self, key, val):
-        self.data[self.identifier][key] = val
+        name = str(key)
+        # Steps running concurrently may write to the same database
+        with self._lock:
+            if isinstance(val, str) and self.backend.read(name) == val:
+                return
+            io_span = current_span()
+            start = time.perf_counter() if io_span.recording else 0.0
+            self.backend.write(key, val)
+            if io_span.recording:
+                io_span.add("db.writes", 1)
+                io_span.add("db.write_seconds", time.perf_counter() - start)
+            self.generation += 1
+            self._changes.pop(name, None)
+            self._changes[name] = self.generation
+
+    def __iter__(self) -> Iterator[str]:
+        return self.backend.keys()
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return self.backend.items()
+
+    def snapshot(self) -> Mapping[str, Any]:
+        """
+        Return the current contents as a snapshot that later writes do not change.
+
+        For databases in the request body this is O(1): the snapshot is the current
+        dict itself, which is marked as shared so that the next write to the database
+        works on a copy. Other backends return a copy of their contents.
+
+        Returns
+        -------
+        Mapping[str, Any]
+            The contents of the database at the time of the call.
+        """
+        return self.backend.snapshot()
+
+    def flush(self) -> None:
+        self.backend.flush()
+
+    def digest(self, key: str) -> Optional[bytes]:
+        """
+        Return the content digest of the current content of a file.
+
+        Parameters
+        ----------
+        key : str
+            The name of the file.
+
+        Returns
+        -------
+        Optional[bytes]
+            The digest of the content, or None if the file does not exist or does not
+            hold text.
+        """
+        val = self.backend.read(key)
+        return content_digest(val) if isinstance(val, str) else None
+
+    def changed_since(self, generation: int) -> List[str]:
+        """
+        Return the names of the files changed after a generation.
+
+        Takes time proportional to the number of changed files, not to the size of the
+        database.
+
+        Parameters
+        ----------
+        generation : int
+            A value of `generation` read earlier, or 0 for all files written through
+            the DB.
+
+        Returns
+        -------
+        List[str]
+            The names of the changed files, in the order of their last change.
+        """
+        changed = []
+        for name in reversed(self._changes):
+            if self._changes[name] <= generation:
+                break
+            changed.append(name)
+        return changed[::-1]
+
+    def diff(self, base: Mapping[str, Any], since: int = 0, n: int = 3) -> Iterator[str]:
+        """
+        Iterate over the unified diff of the files changed since a generation.
+
+        Parameters
+        ----------
+        base : Mapping[str, Any]
+            The contents to compare with, usually a `snapshot` taken at `since`.
+            Files missing from it are diffed against an empty file.
+        since : int, optional
+            The generation to diff from, by default 0.
+        n : int, optional
+            The number of context lines, by default 3.
+
+        Returns
+        -------
+        Iterator[str]
+            The lines of the diff.
+        """
+        for name in self.changed_since(since):
+            old = base.get(name, "")
+            new = self.get(name, "")
+            if old == new or not isinstance(old, str) or not isinstance(new, str):
+                continue
+            yield from difflib.unified_diff(
+                old.splitlines(keepends=True),
+                new.splitlines(keepends=True),
+                fromfile=f"a/{name}",
+                tofile=f"b/{name}",
+                n=n,
+            )
 
 
 # dataclass for all dbs:
@@ -101,9 +345,81 @@ class DBs:
 
 
 def archive(dbs: DBs):
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    dbs.archive.data[dbs.archive.identifier][timestamp] = {
-        "memory": dbs.memory.data[dbs.memory.identifier],
-        "workspace": dbs.workspace.data[dbs.workspace.identifier]
-    }
+    """
+    Archive the memory and workspace databases under the current timestamp.
+
+    Databases in the request body are archived as snapshots, so the archive is not
+    affected by later writes to the memory and workspace databases, and archiving takes
+    constant time and memory however many files the databases hold. Directories are
+    moved into an archive directory, leaving the memory and workspace empty, as the
+    file-based databases always did, except for a workspace that holds the archive:
+    that is the project being improved, which is left in place. Other backends are archived by content: every
+    distinct file content is stored once in the archive database, under
+    `objects/<digest>`, and `<timestamp>/<database>.json` maps the file names to
+    their digests. Archiving then only writes the files that changed since any
+    earlier archive, across runs.
+
+    Parameters
+    ----------
+    dbs : DBs
+        The databases of the run.
+    """
+    with span("db.archive"):
+        _archive(dbs)
     return []
+
+
+def _archive(dbs: DBs) -> None:
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    if isinstance(dbs.archive.backend, DictBackend):
+        dbs.archive[timestamp] = {
+            "memory": dbs.memory.snapshot(),
+            "workspace": dbs.workspace.snapshot(),
+        }
+        return
+
+    for name in ["memory", "workspace"]:
+        db = getattr(dbs, name)
+        if isinstance(db.backend, DirectoryBackend) and isinstance(
+            dbs.archive.backend, DirectoryBackend
+        ):
+            if db.path not in dbs.archive.path.parents:
+                db.backend.move_to(dbs.archive.path / timestamp / name)
+            continue
+        manifest = {}
+        for key in db:
+            digest = db.digest(key)
+            if digest is None:
+                continue
+            manifest[key] = digest.hex()
+            if f"objects/{digest.hex()}" not in dbs.archive:
+                dbs.archive[f"objects/{digest.hex()}"] = db[key]
+        dbs.archive[f"{timestamp}/{name}.json"] = json.dumps(manifest, indent=2)
+
+
+def backends_from_env() -> Dict[str, Backend]:
+    """
+    Open the backends selected for the databases of a run through GPTE_DB_BACKENDS.
+
+    The variable holds comma-separated `<field>=<spec>` pairs, where `<field>` is a
+    field of `DBs` (or `*` for all fields not listed) and `<spec>` is a backend spec as
+    accepted by `gpt_engineer.core.db_backends.open_backend`, e.g.
+    `workspace=directory:/tmp/run,*=sqlite:/tmp/run/dbs.sqlite`.
+
+    Returns
+    -------
+    Dict[str, Backend]
+        The backends by field; fields not in the result are stored in the request body.
+    """
+    specs = dict(
+        pair.strip().split("=", 1)
+        for pair in os.getenv("GPTE_DB_BACKENDS", "").split(",")
+        if pair.strip()
+    )
+    backends = {}
+    for field in fields(DBs):
+        spec = specs.get(field.name, specs.get("*", "dict"))
+        backend = open_backend(spec, field.name)
+        if backend is not None:
+            backends[field.name] = backend
+    return backends
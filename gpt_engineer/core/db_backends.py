@@ -0,0 +1,496 @@
+"""
+Storage backends for `gpt_engineer.core.db.DB`.
+
+A `DB` maps file names to file contents and delegates the storage to a backend. The
+backends trade off differently between latency, throughput and what can read the data
+outside of gpt-engineer:
+
+- DictBackend keeps the files in a dict inside the request body, so callers get the
+  results back in the same object they passed in.
+- DirectoryBackend stores every file as a file in a directory, so generated code can
+  be run and inspected in place.
+- SQLiteBackend stores any number of databases in one SQLite file.
+- PackFileBackend appends every write to a single pack file and reads through a
+  memory map, which makes bulk writes and scans cheap.
+
+Classes:
+- Files: The dict holding the contents of a dict-backed DB, copied on write once
+  snapshotted.
+- Backend: The interface of all storage backends.
+- DictBackend: Files in a dict inside the request body.
+- DirectoryBackend: Files in a directory.
+- SQLiteBackend: Files in a table of a SQLite database.
+- PackFileBackend: Files in an append-only, memory-mapped pack file.
+
+Functions:
+- open_backend: Open a backend from a spec like "sqlite:/path/to/run.db".
+"""
+
+import mmap
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple, Union
+
+from gpt_engineer.core.spill import SpilledValue, SpillStore
+
+
+class Files(dict):
+    """
+    The contents of a dict-backed `DB`, a plain dict that may be shared with snapshots.
+
+    Once `DB.snapshot` has handed out a `Files`, it is marked as shared and no `DB`
+    writes to it again: the next write first replaces it by a shallow copy. Snapshots
+    therefore cost nothing to take, stay unchanged, and share all file contents (and,
+    until the next write, the dict itself) with the live database. Being a dict, it
+    serializes to JSON like the request body it lives in.
+
+    Large values may be stored as `SpilledValue` handles (see
+    `gpt_engineer.core.spill`). Item access, `get`, `items`, `values`, `pop`, `copy`
+    and conversions like `dict(files)`, `{**files}` and `files | other` load them, so
+    readers of the dict only ever see strings.
+
+    Attributes
+    ----------
+    shared : bool
+        Whether a snapshot references this dict, making it read-only.
+    """
+
+    shared = False
+
+    def __getitem__(self, key):
+        val = super().__getitem__(key)
+        return val.load() if isinstance(val, SpilledValue) else val
+
+    def get(self, key, default=None):
+        val = super().get(key, default)
+        return val.load() if isinstance(val, SpilledValue) else val
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def __iter__(self):
+        # Overriding __iter__ makes dict(files), {**files} and dict.update read the
+        # values through __getitem__ instead of copying the handles
+        return super().__iter__()
+
+    def pop(self, key, *default):
+        val = super().pop(key, *default)
+        return val.load() if isinstance(val, SpilledValue) else val
+
+    def copy(self):
+        return dict(self)
+
+    def __or__(self, other):
+        return {**self, **other}
+
+
+class Backend(ABC):
+    """
+    The interface of the storage behind a `DB`.
+
+    Methods
+    -------
+    __contains__(key) -> bool:
+        Check if a file exists.
+    read(key) -> Optional[Any]:
+        Return the content of a file, or None if it does not exist.
+    write(key, val) -> None:
+        Set the content of a file.
+    keys() -> Iterator[str]:
+        Iterate over the names of all files.
+    items() -> Iterator[Tuple[str, Any]]:
+        Iterate over the names and contents of all files.
+    snapshot() -> Mapping[str, Any]:
+        Return the current contents as a mapping that later writes do not change.
+    flush() -> None:
+        Wait until all writes so far are persisted.
+    close() -> None:
+        Release the resources held by the backend.
+    """
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def read(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def write(self, key: str, val: Any) -> None:
+        ...
+
+    @abstractmethod
+    def keys(self) -> Iterator[str]:
+        ...
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for key in self.keys():
+            val = self.read(key)
+            if val is not None:
+                yield key, val
+
+    def snapshot(self) -> Mapping[str, Any]:
+        return dict(self.items())
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class DictBackend(Backend):
+    """
+    Files kept in a dict inside the request body, under `data[identifier]`.
+
+    Values are stored as is, so they need not be strings (the archive database stores
+    snapshots of other databases). With a spill store, large strings are stored as
+    spilled values that may be moved to disk.
+
+    Attributes
+    ----------
+    data : dict
+        The request body holding the files.
+    identifier : str
+        The key of the files in the request body.
+    spill : Optional[SpillStore]
+        The store of large values, if spilling is enabled.
+    """
+
+    def __init__(self, data: dict, identifier: str, spill: Optional[SpillStore] = None):
+        self.data = data
+        self.identifier = identifier
+        self.spill = spill
+        if not isinstance(self.data.get(self.identifier), Files):
+            self.data[self.identifier] = Files(self.data.get(self.identifier, {}))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data[self.identifier]
+
+    def read(self, key: str) -> Optional[Any]:
+        return self.data[self.identifier].get(key)
+
+    def write(self, key: str, val: Any) -> None:
+        files = self.data[self.identifier]
+        if files.shared:
+            # Copy on write, leaving the snapshots unchanged and the values spilled
+            files = self.data[self.identifier] = Files(dict.items(files))
+        if self.spill is not None and isinstance(val, str):
+            val = self.spill.put(val)
+        files[key] = val
+
+    def keys(self) -> Iterator[str]:
+        return iter(list(self.data[self.identifier]))
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return iter(list(self.data[self.identifier].items()))
+
+    def snapshot(self) -> Files:
+        files = self.data[self.identifier]
+        files.shared = True
+        return files
+
+
+def _check_write(key: Union[str, Path], val: Any) -> None:
+    if str(key).startswith("../"):
+        raise ValueError(f"File name {key} attempted to access parent path.")
+    assert isinstance(val, str), "val must be str"
+
+
+class DirectoryBackend(Backend):
+    """
+    Files stored as files in a directory, with file names relative to it.
+
+    Attributes
+    ----------
+    path : Path
+        The directory holding the files.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path: Path = Path(path).absolute()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        return (self.path / key).is_file()
+
+    def read(self, key: str) -> Optional[str]:
+        full_path = self.path / key
+        if not full_path.is_file():
+            return None
+        with full_path.open("r", encoding="utf-8") as f:
+            return f.read()
+
+    def write(self, key: str, val: str) -> None:
+        _check_write(key, val)
+        full_path = self.path / key
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_text(val, encoding="utf-8")
+
+    def keys(self) -> Iterator[str]:
+        if not self.path.is_dir():
+            return
+        for root, _, files in os.walk(self.path):
+            for file in files:
+                yield Path(root, file).relative_to(self.path).as_posix()
+
+    def move_to(self, target: Path) -> None:
+        """
+        Move the directory, e.g. into an archive. Later writes recreate it empty.
+
+        Parameters
+        ----------
+        target : Path
+            The new location of the directory.
+        """
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(self.path), str(target))
+
+
+class SQLiteBackend(Backend):
+    """
+    Files stored in a table of a SQLite database, shared by all its namespaces.
+
+    Several databases of a run can live in one SQLite file, each in its own namespace.
+    The database runs in WAL mode, so readers do not block the writer.
+
+    Attributes
+    ----------
+    path : Path
+        The SQLite database file.
+    namespace : str
+        The namespace of the files in the table.
+    """
+
+    def __init__(self, path: Union[str, Path], namespace: str = ""):
+        self.path = Path(path).absolute()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM files WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        return row is not None
+
+    def read(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM files WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def write(self, key: str, val: str) -> None:
+        _check_write(key, val)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (namespace, key, value) VALUES (?, ?, ?)",
+                (self.namespace, str(key), val),
+            )
+
+    def keys(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM files WHERE namespace = ? ORDER BY key",
+                (self.namespace,),
+            ).fetchall()
+        return (row[0] for row in rows)
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM files WHERE namespace = ? ORDER BY key",
+                (self.namespace,),
+            ).fetchall()
+        return iter(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Length of the key and of the value, in bytes, in front of every record
+_RECORD_HEADER = struct.Struct("<II")
+
+
+class PackFileBackend(Backend):
+    """
+    Files stored as records appended to a single pack file, read through a memory map.
+
+    Every write appends a (key, value) record, so writes are sequential and never
+    rewrite earlier data; the index of the latest record of every key is kept in
+    memory and rebuilt from the file when it is opened. Reads slice the memory map,
+    which is extended lazily as the file grows. Overwritten records stay in the file
+    until `compact` is called.
+
+    Attributes
+    ----------
+    path : Path
+        The pack file.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path).absolute()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._file = open(self.path, "a+b")
+        self._size = self._file.seek(0, os.SEEK_END)
+        self._mmap: Optional[mmap.mmap] = None
+        self._load_index()
+
+    def _map(self, end: int) -> mmap.mmap:
+        # Map the file up to at least `end`; the caller holds the lock
+        if self._mmap is None or len(self._mmap) < end:
+            self._file.flush()
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _load_index(self) -> None:
+        if self._size == 0:
+            return
+        data = self._map(self._size)
+        offset = 0
+        while offset + _RECORD_HEADER.size <= self._size:
+            key_len, val_len = _RECORD_HEADER.unpack_from(data, offset)
+            key_start = offset + _RECORD_HEADER.size
+            val_start = key_start + key_len
+            if val_start + val_len > self._size:
+                # Torn write at the end of the file
+                break
+            key = data[key_start:val_start].decode("utf-8")
+            self._index[key] = (val_start, val_len)
+            offset = val_start + val_len
+        if offset < self._size:
+            self._file.truncate(offset)
+            self._size = offset
+            self._mmap.close()  # type: ignore
+            self._mmap = None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def read(self, key: str) -> Optional[str]:
+        with self._lock:
+            location = self._index.get(key)
+            if location is None:
+                return None
+            start, length = location
+            return self._map(start + length)[start : start + length].decode("utf-8")
+
+    def write(self, key: str, val: str) -> None:
+        _check_write(key, val)
+        key_bytes = str(key).encode("utf-8")
+        val_bytes = val.encode("utf-8")
+        record = _RECORD_HEADER.pack(len(key_bytes), len(val_bytes))
+        with self._lock:
+            self._file.write(record + key_bytes + val_bytes)
+            val_start = self._size + len(record) + len(key_bytes)
+            self._size = val_start + len(val_bytes)
+            self._index[str(key)] = (val_start, len(val_bytes))
+
+    def keys(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._index))
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        with self._lock:
+            if not self._index:
+                return iter([])
+            data = self._map(self._size)
+            return iter(
+                [
+                    (key, data[start : start + length].decode("utf-8"))
+                    for key, (start, length) in self._index.items()
+                ]
+            )
+
+    def compact(self) -> None:
+        """
+        Rewrite the pack file with only the latest record of every file.
+        """
+        contents = list(self.items())
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f:
+            for key, val in contents:
+                key_bytes = key.encode("utf-8")
+                val_bytes = val.encode("utf-8")
+                f.write(_RECORD_HEADER.pack(len(key_bytes), len(val_bytes)))
+                f.write(key_bytes + val_bytes)
+        with self._lock:
+            self._close_file()
+            os.replace(tmp_path, self.path)
+            self._index = {}
+            self._file = open(self.path, "a+b")
+            self._size = self._file.seek(0, os.SEEK_END)
+            self._load_index()
+
+    def _close_file(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_file()
+
+
+def open_backend(spec: str, name: str) -> Optional[Backend]:
+    """
+    Open the backend described by a spec for one of the databases of a run.
+
+    Parameters
+    ----------
+    spec : str
+        One of "dict", "directory:<dir>", "sqlite:<file>" or "pack:<dir>". Directory
+        databases are stored in `<dir>/<name>`, SQLite databases in the namespace
+        `<name>` of `<file>`, and pack files in `<dir>/<name>.pack`.
+    name : str
+        The name of the database, e.g. "workspace".
+
+    Returns
+    -------
+    Optional[Backend]
+        The backend, or None for "dict", which stores the database in the request body.
+
+    Raises
+    ------
+    ValueError
+        If the spec names an unknown backend.
+    """
+    kind, _, location = spec.partition(":")
+    if kind == "dict":
+        return None
+    if kind == "directory":
+        return DirectoryBackend(Path(location) / name)
+    if kind == "sqlite":
+        return SQLiteBackend(location, namespace=name)
+    if kind == "pack":
+        return PackFileBackend(Path(location) / f"{name}.pack")
+    raise ValueError(f"Unknown DB backend '{kind}' in '{spec}'")
@@ -0,0 +1,467 @@
+"""
+Materialization of databases as directories on disk.
+
+Databases in the request body (or in SQLite and pack files) exist only in memory or in
+a single file, but running the generated code needs the workspace as a directory. A
+`Materializer` writes a database to a directory in bulk: files are hashed and only
+written when their content differs from what is on disk, and the writes are grouped in
+batches that a thread pool writes in parallel, each file atomically and optionally
+fsync'ed. `WriteBehindBackend` wraps the backend of a database and flushes written
+files in the background, so generated projects appear on disk without every write of
+a step waiting for the file system.
+
+Classes:
+- MaterializeStats: Counts of the files written and skipped by a flush.
+- Materializer: Writes databases to a directory, skipping unchanged files.
+- WriteBehindBackend: A backend that flushes written files to a directory in the
+  background.
+
+Functions:
+- workspace_path: Returns a directory holding the current files of a database.
+- write_behind_from_env: Wraps a database in a write-behind backend if configured.
+- stop_write_behind: Flushes a write-behind database and stops its thread.
+
+Environment:
+- GPTE_WORKSPACE_DIR: Directory that in-memory workspaces are flushed to in the
+  background, each run in a directory of its own (write-behind is disabled when
+  unset).
+- GPTE_MATERIALIZE_FSYNC: Set to 1 to fsync every materialized file.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from gpt_engineer.core.db import DB, content_digest
+from gpt_engineer.core.db_backends import Backend, DirectoryBackend
+from gpt_engineer.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MaterializeStats:
+    """
+    Counts of the files handled by a flush.
+
+    Attributes
+    ----------
+    written : int
+        The number of files written to disk.
+    unchanged : int
+        The number of files skipped because the disk already held their content. Files
+        a database reports as unchanged since the last flush are not even visited and
+        not counted.
+    bytes_written : int
+        The total size of the files written.
+    """
+
+    written: int = 0
+    unchanged: int = 0
+    bytes_written: int = 0
+
+    def __iadd__(self, other: "MaterializeStats") -> "MaterializeStats":
+        self.written += other.written
+        self.unchanged += other.unchanged
+        self.bytes_written += other.bytes_written
+        return self
+
+
+class Materializer:
+    """
+    Writes the files of databases to a directory, skipping files that did not change.
+
+    The materializer remembers the digest of every file it wrote and the generation of
+    every database it flushed, so flushing the same database again only looks at the
+    files the database changed since, and only writes those whose content differs.
+    Files it has not written yet are compared with what is on disk, so materializing
+    into a directory left over from an earlier run does not rewrite it either.
+
+    Attributes
+    ----------
+    target : Path
+        The directory the files are written to.
+    workers : int
+        The number of threads writing batches in parallel.
+    batch_size : int
+        The number of files written by one task of the thread pool.
+    fsync : bool
+        Whether every file is fsync'ed before it replaces the previous version.
+
+    Methods
+    -------
+    flush(files) -> MaterializeStats:
+        Write files to the directory.
+    """
+
+    def __init__(
+        self,
+        target: Union[str, Path],
+        workers: int = 4,
+        batch_size: int = 64,
+        fsync: Optional[bool] = None,
+    ):
+        """
+        Initialize the Materializer class.
+
+        Parameters
+        ----------
+        target : Union[str, Path]
+            The directory the files are written to. It is created if needed.
+        workers : int, optional
+            The number of threads writing batches in parallel, by default 4.
+        batch_size : int, optional
+            The number of files written by one task, by default 64.
+        fsync : Optional[bool], optional
+            Whether to fsync every file, by default read from GPTE_MATERIALIZE_FSYNC.
+        """
+        self.target = Path(target).absolute()
+        self.target.mkdir(parents=True, exist_ok=True)
+        self._root = os.path.realpath(self.target)
+        self.workers = workers
+        self.batch_size = batch_size
+        if fsync is None:
+            fsync = os.getenv("GPTE_MATERIALIZE_FSYNC", "") in ("1", "true")
+        self.fsync = fsync
+        self._digests: Dict[str, bytes] = {}
+        self._generations: "weakref.WeakKeyDictionary[DB, int]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def flush(self, files: Union[DB, Iterable[Tuple[str, Any]]]) -> MaterializeStats:
+        """
+        Write files to the directory, skipping those whose content is already on disk.
+
+        Parameters
+        ----------
+        files : Union[DB, Iterable[Tuple[str, Any]]]
+            A database, or the names and contents of the files to write.
+
+        Returns
+        -------
+        MaterializeStats
+            The number of files written and skipped.
+
+        Raises
+        ------
+        ValueError
+            If a file name points outside of the target directory.
+        """
+        if isinstance(files, DB):
+            candidates = self._changed_files(files)
+        else:
+            candidates = [
+                (key, val, content_digest(val))
+                for key, val in files
+                if isinstance(val, str)
+            ]
+        stats = MaterializeStats()
+        pending: List[Tuple[str, str, bytes, bytes]] = []
+        with self._lock:
+            for key, val, digest in candidates:
+                if self._digests.get(key) == digest:
+                    stats.unchanged += 1
+                    continue
+                content = val.encode("utf-8")
+                pending.append((self._path_of(key), key, content, digest))
+
+        if not pending:
+            return stats
+
+        for parent in {os.path.dirname(path) for path, *_ in pending}:
+            os.makedirs(parent, exist_ok=True)
+        batches = [
+            pending[i : i + self.batch_size]
+            for i in range(0, len(pending), self.batch_size)
+        ]
+        if len(batches) == 1 or self.workers <= 1:
+            results = map(self._write_batch, batches)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(self._write_batch, batches))
+        for batch_stats in results:
+            stats += batch_stats
+        return stats
+
+    def _changed_files(self, db: DB) -> List[Tuple[str, str, bytes]]:
+        with self._lock:
+            since = self._generations.get(db)
+            self._generations[db] = db.generation
+        keys = list(db) if since is None else db.changed_since(since)
+        files = []
+        for key in keys:
+            val = db.get(key)
+            if isinstance(val, str):
+                files.append((key, val, db.digest(key)))
+        return files
+
+    def _path_of(self, key: str) -> str:
+        # A lexical check is enough: the materializer creates no symlinks itself
+        path = os.path.normpath(os.path.join(self._root, key))
+        if not path.startswith(self._root + os.sep):
+            raise ValueError(f"File name {key} attempted to access parent path.")
+        return path
+
+    def _write_batch(
+        self, batch: List[Tuple[str, str, bytes, bytes]]
+    ) -> MaterializeStats:
+        stats = MaterializeStats()
+        for path, key, content, digest in batch:
+            on_disk = self._on_disk(path, content)
+            if on_disk:
+                stats.unchanged += 1
+            else:
+                self._write_file(path, content, replace=on_disk is not None)
+                stats.written += 1
+                stats.bytes_written += len(content)
+            with self._lock:
+                self._digests[key] = digest
+        return stats
+
+    @staticmethod
+    def _on_disk(path: str, content: bytes) -> Optional[bool]:
+        # Whether the file holds the content, or None if there is no file
+        try:
+            if os.stat(path).st_size != len(content):
+                return False
+            with open(path, "rb") as f:
+                return f.read() == content
+        except FileNotFoundError:
+            return None
+
+    def _write_file(self, path: str, content: bytes, replace: bool) -> None:
+        # Replace existing files through a rename, so readers never see partial files
+        tmp_path = f"{path}.{threading.get_ident()}.tmp" if replace else path
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(content)
+            while view:
+                view = view[os.write(fd, view) :]
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        if replace:
+            os.replace(tmp_path, path)
+
+
+class WriteBehindBackend(Backend):
+    """
+    A backend that stores files in another backend and flushes them to a directory.
+
+    Writes go to the wrapped backend and return immediately. A background thread
+    collects the names of the written files for `delay` seconds, so that files
+    rewritten in quick succession (e.g. while a completion streams) are written once,
+    and then materializes them. `flush` waits until the directory is up to date. Once
+    stopped or closed, writes are written through to the directory.
+
+    Attributes
+    ----------
+    backend : Backend
+        The wrapped backend holding the files.
+    materializer : Materializer
+        The materializer writing the files to disk.
+    delay : float
+        The number of seconds writes are collected before they are flushed.
+    path : Path
+        The directory the files are flushed to.
+    """
+
+    def __init__(self, backend: Backend, materializer: Materializer, delay: float = 0.05):
+        self.backend = backend
+        self.materializer = materializer
+        self.delay = delay
+        self._dirty: Dict[str, None] = {}
+        self._in_flight = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="gpte-write-behind", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def path(self) -> Path:
+        return self.materializer.target
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.backend
+
+    def read(self, key: str) -> Optional[Any]:
+        return self.backend.read(key)
+
+    def write(self, key: str, val: Any) -> None:
+        self.backend.write(key, val)
+        with self._cond:
+            if not self._closed:
+                self._dirty[key] = None
+                self._cond.notify()
+                return
+        # Without the background thread, write through
+        self.materializer.flush([(key, val)])
+
+    def keys(self) -> Iterator[str]:
+        return self.backend.keys()
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return self.backend.items()
+
+    def snapshot(self):
+        return self.backend.snapshot()
+
+    def flush(self) -> None:
+        """
+        Wait until all files written so far are on disk.
+
+        Raises
+        ------
+        Exception
+            The error of a background flush that failed since the last call.
+        """
+        with self._cond:
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._dirty and not self._in_flight)
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def stop(self) -> None:
+        """
+        Flush the files written so far and stop the background thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        # The thread flushes the remaining files before it returns
+        self._thread.join()
+
+    def close(self) -> None:
+        self.flush()
+        self.stop()
+        self.backend.close()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty or self._closed)
+                if self._closed and not self._dirty:
+                    return
+            # Coalesce the writes that arrive shortly after the first one
+            time.sleep(self.delay)
+            with self._cond:
+                keys, self._dirty = list(self._dirty), {}
+                self._in_flight += 1
+            try:
+                self.materializer.flush((key, self.backend.read(key)) for key in keys)
+            except BaseException as e:
+                logger.exception("Failed to flush the workspace to disk")
+                with self._cond:
+                    self._error = e
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+
+_materializers: "weakref.WeakKeyDictionary[Backend, Materializer]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def workspace_path(db: DB) -> Path:
+    """
+    Return a directory holding the current files of a database, e.g. to run them.
+
+    Directory databases are returned as they are and write-behind databases are
+    flushed. Other databases are materialized into a temporary directory, which is
+    reused (and only updated with the changed files) when called again, and removed
+    along with the backend of the database.
+
+    Parameters
+    ----------
+    db : DB
+        The database, usually the workspace.
+
+    Returns
+    -------
+    Path
+        The directory with the files of the database.
+    """
+    backend = db.backend
+    if isinstance(backend, DirectoryBackend):
+        return backend.path
+    with span("db.materialize") as flush_span:
+        if isinstance(backend, WriteBehindBackend):
+            backend.flush()
+            return backend.path
+        materializer = _materializers.get(backend)
+        if materializer is None:
+            target = tempfile.mkdtemp(prefix="gpte-workspace-")
+            materializer = _materializers[backend] = Materializer(target)
+            weakref.finalize(backend, shutil.rmtree, target, ignore_errors=True)
+        stats = materializer.flush(db)
+        flush_span.set_attributes(
+            files_written=stats.written, bytes_written=stats.bytes_written
+        )
+    logger.debug(
+        f"Materialized {stats.written} files ({stats.unchanged} unchanged) "
+        f"into {materializer.target}"
+    )
+    return materializer.target
+
+
+def write_behind_from_env(db: DB) -> DB:
+    """
+    Flush the files of a database to GPTE_WORKSPACE_DIR in the background, if set.
+
+    Every call flushes to a new directory in GPTE_WORKSPACE_DIR, named after the
+    time, so that concurrent runs do not overwrite each other's files. The
+    background thread runs until `stop_write_behind`.
+
+    Parameters
+    ----------
+    db : DB
+        The database, usually the workspace.
+
+    Returns
+    -------
+    DB
+        The database, whose backend is wrapped in a `WriteBehindBackend` if the
+        variable is set and the database is not stored in a directory already.
+    """
+    path = os.getenv("GPTE_WORKSPACE_DIR")
+    if path and not isinstance(db.backend, (DirectoryBackend, WriteBehindBackend)):
+        os.makedirs(path, exist_ok=True)
+        target = tempfile.mkdtemp(prefix=time.strftime("%Y%m%d-%H%M%S-"), dir=path)
+        logger.info(f"Flushing the workspace to {target}")
+        db.backend = WriteBehindBackend(db.backend, Materializer(target))
+    return db
+
+
+def stop_write_behind(db: DB) -> None:
+    """
+    Flush a write-behind database and stop its background thread.
+
+    The database then writes to its wrapped backend only. Other databases are left
+    as they are.
+
+    Parameters
+    ----------
+    db : DB
+        The database, usually the workspace at the end of a run.
+    """
+    if isinstance(db.backend, WriteBehindBackend):
+        backend = db.backend
+        backend.stop()
+        db.backend = backend.backend
@@ -0,0 +1,256 @@
+"""
+This module provides a process-wide cache of the models available to the configured
+OpenAI account.
+
+Constructing an `AI` used to cost two network round trips before a single token was
+generated: `fallback_model` retrieved the requested model and `create_chat_model`
+downloaded the full model list. Both now consult a shared `ModelCatalog`, so only the
+first construction in a process (or the first one after the cache expires) talks to
+the API.
+
+Key Features:
+- Time-bounded in-memory cache, keyed by API base and API key.
+- Optional on-disk JSON snapshot so short-lived CLI processes can share the catalog.
+- Thread-safe: concurrent constructions trigger at most one fetch per key.
+- Explicit invalidation, e.g. after the account was granted access to a new model.
+
+Classes:
+- ModelCatalog: TTL-bound cache of available model ids.
+
+Functions:
+- default_catalog: Returns the process-wide catalog, configured from the environment.
+- invalidate_model_catalog: Drops all cached catalog entries of the default catalog.
+
+Environment:
+- GPTE_MODEL_CATALOG_TTL: Lifetime of a cached catalog in seconds (default 3600).
+- GPTE_MODEL_CATALOG_PATH: Path of the on-disk snapshot (disabled when unset).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600.0
+
+
+def fetch_openai_models() -> List[str]:
+    """
+    Fetch the ids of all models available to the configured OpenAI account.
+
+    Returns
+    -------
+    List[str]
+        The ids of the available models.
+    """
+    return [model["id"] for model in openai.Model.list()["data"]]
+
+
+def current_catalog_key() -> str:
+    """
+    Build the cache key for the currently configured OpenAI account.
+
+    The key combines the API base with a digest of the API key, so that switching
+    credentials never serves another account's catalog and the key itself never
+    ends up on disk.
+
+    Returns
+    -------
+    str
+        The cache key.
+    """
+    key_digest = hashlib.sha256((openai.api_key or "").encode("utf-8")).hexdigest()
+    return f"{openai.api_base}#{key_digest[:16]}"
+
+
+class ModelCatalog:
+    """
+    A thread-safe, TTL-bound cache of the model ids available to an account.
+
+    Attributes
+    ----------
+    ttl : float
+        The number of seconds a fetched catalog stays valid.
+    snapshot_path : Optional[Path]
+        The JSON file the catalog is persisted to, if any.
+    fetch_count : int
+        The number of times the catalog was fetched from the API.
+
+    Methods
+    -------
+    models() -> List[str]:
+        Return the available model ids, fetching them if the cache is cold.
+    is_available(model) -> bool:
+        Check whether a model is available.
+    invalidate(key) -> None:
+        Drop one or all cached catalogs, both in memory and on disk.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        snapshot_path: Optional[Union[str, Path]] = None,
+        fetch: Callable[[], List[str]] = fetch_openai_models,
+        key: Callable[[], str] = current_catalog_key,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the ModelCatalog class.
+
+        Parameters
+        ----------
+        ttl : float, optional
+            Lifetime of a cached catalog in seconds, by default one hour.
+        snapshot_path : Optional[Union[str, Path]], optional
+            Path of the on-disk snapshot, by default None (memory only).
+        fetch : Callable[[], List[str]], optional
+            Function fetching the model ids, by default `fetch_openai_models`.
+        key : Callable[[], str], optional
+            Function returning the cache key of the current account.
+        clock : Callable[[], float], optional
+            Wall-clock time source, by default `time.time`.
+        """
+        self.ttl = ttl
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.fetch_count = 0
+        self._fetch = fetch
+        self._key = key
+        self._clock = clock
+        self._entries: Dict[str, Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def models(self) -> List[str]:
+        """
+        Return the available model ids, fetching them if the cache is cold or expired.
+
+        Returns
+        -------
+        List[str]
+            The ids of the available models.
+        """
+        key = self._key()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0]):
+                entry = self._load_snapshot(key)
+            if entry is None or self._expired(entry[0]):
+                logger.debug(f"Fetching model catalog for {key.split('#')[0]}")
+                entry = (self._clock(), list(self._fetch()))
+                self.fetch_count += 1
+                self._store_snapshot(key, entry)
+            self._entries[key] = entry
+            return list(entry[1])
+
+    def is_available(self, model: str) -> bool:
+        """
+        Check whether a model is available to the current account.
+
+        Parameters
+        ----------
+        model : str
+            The model id to look up.
+
+        Returns
+        -------
+        bool
+            True if the model is in the catalog, False otherwise.
+        """
+        return model in self.models()
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """
+        Drop cached catalogs from memory and from the on-disk snapshot.
+
+        Parameters
+        ----------
+        key : Optional[str], optional
+            The cache key to drop, by default None which drops every entry.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            if self.snapshot_path is None or not self.snapshot_path.is_file():
+                return
+            if key is None:
+                self.snapshot_path.unlink()
+                return
+            snapshot = self._read_snapshot()
+            snapshot.pop(key, None)
+            self._write_snapshot(snapshot)
+
+    def _expired(self, fetched_at: float) -> bool:
+        return self._clock() - fetched_at >= self.ttl
+
+    def _read_snapshot(self) -> dict:
+        try:
+            return json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_snapshot(self, snapshot: dict) -> None:
+        # Write to a sibling file first so concurrent readers never see partial JSON
+        tmp_path = self.snapshot_path.with_name(
+            f"{self.snapshot_path.name}.{os.getpid()}.tmp"
+        )
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(snapshot), encoding="utf-8")
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.debug(f"Could not write model catalog snapshot: {e}")
+
+    def _load_snapshot(self, key: str) -> Optional[Tuple[float, List[str]]]:
+        if self.snapshot_path is None:
+            return None
+        entry = self._read_snapshot().get(key)
+        if not entry:
+            return None
+        return entry["fetched_at"], entry["models"]
+
+    def _store_snapshot(self, key: str, entry: Tuple[float, List[str]]) -> None:
+        if self.snapshot_path is None:
+            return
+        snapshot = self._read_snapshot()
+        snapshot[key] = {"fetched_at": entry[0], "models": entry[1]}
+        self._write_snapshot(snapshot)
+
+
+_default_catalog: Optional[ModelCatalog] = None
+_default_catalog_lock = threading.Lock()
+
+
+def default_catalog() -> ModelCatalog:
+    """
+    Return the process-wide model catalog, creating it on first use.
+
+    Returns
+    -------
+    ModelCatalog
+        The catalog shared by every `AI` instance in the process.
+    """
+    global _default_catalog
+    with _default_catalog_lock:
+        if _default_catalog is None:
+            _default_catalog = ModelCatalog(
+                ttl=float(os.getenv("GPTE_MODEL_CATALOG_TTL", DEFAULT_TTL)),
+                snapshot_path=os.getenv("GPTE_MODEL_CATALOG_PATH") or None,
+            )
+        return _default_catalog
+
+
+def invalidate_model_catalog() -> None:
+    """
+    Drop every cached entry of the process-wide model catalog.
+    """
+    default_catalog().invalidate()
@@ -0,0 +1,186 @@
+"""
+Token bucket rate limiting of chat completion requests.
+
+Running many generations at once, like the benchmark runner does, sends requests
+faster than the account's rate limit allows, and every request over the limit costs
+a failed round trip and an exponential backoff. A `TokenBucket` spaces requests out
+before they are sent instead. `AI` takes a token from its bucket before every
+attempt of a completion.
+
+A bucket can keep its state in a file, so that the processes of a benchmark run
+share one budget: each reservation locks the file, refills the bucket for the time
+passed, and takes its tokens, possibly going into debt, which the caller then waits
+out without holding the lock. Reservations are thereby served in order.
+
+Classes:
+- TokenBucket: A token bucket, optionally shared between processes through a file.
+
+Functions:
+- rate_limiter_from_env: Returns the bucket configured through the environment, if any.
+
+Environment:
+- GPTE_RATE_LIMIT: Requests per minute (rate limiting is disabled when unset or 0).
+- GPTE_RATE_LIMIT_BURST: Requests that may be sent at once after an idle period
+  (default 1).
+- GPTE_RATE_LIMIT_FILE: File holding the state of a bucket shared between processes.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at a constant rate.
+
+    Attributes
+    ----------
+    rate : float
+        The tokens added per second.
+    capacity : float
+        The most tokens the bucket holds.
+    path : Optional[Path]
+        The file the state is shared through, if any.
+
+    Methods
+    -------
+    reserve(tokens) -> float:
+        Take tokens and return the seconds to wait until they are available.
+    acquire(tokens) -> float:
+        Take tokens, waiting until they are available.
+    aacquire(tokens) -> float:
+        Asynchronous variant of `acquire`.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1.0,
+        path: Union[str, Path, None] = None,
+    ):
+        """
+        Initialize the bucket, full.
+
+        Parameters
+        ----------
+        rate : float
+            The tokens added per second.
+        capacity : float, optional
+            The most tokens the bucket holds, by default 1.
+        path : Union[str, Path, None], optional
+            A file to share the state through, by default None (this process only).
+        """
+        if rate <= 0:
+            raise ValueError("The rate of a token bucket must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self.path = Path(path) if path is not None else None
+        self._lock = threading.Lock()
+        # Tokens and the wall clock time they were counted at
+        self._state: List[float] = [capacity, time.time()]
+
+    @contextlib.contextmanager
+    def _shared_state(self) -> Iterator[List[float]]:
+        with self._lock:
+            if self.path is None:
+                yield self._state
+                return
+            try:
+                import fcntl
+            except ImportError:  # pragma: no cover - not available on Windows
+                logger.debug("fcntl is not available, rate limiting this process only")
+                yield self._state
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a+", encoding="utf-8") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else [self.capacity, time.time()]
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens from the bucket, going into debt if there are not enough.
+
+        Parameters
+        ----------
+        tokens : float, optional
+            The tokens to take, by default 1.
+
+        Returns
+        -------
+        float
+            The seconds to wait before the tokens are available.
+        """
+        with self._shared_state() as state:
+            now = time.time()
+            available = min(self.capacity, state[0] + (now - state[1]) * self.rate)
+            state[0] = available - tokens
+            state[1] = now
+        return max(0.0, -state[0] / self.rate)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens from the bucket, waiting until they are available.
+
+        Parameters
+        ----------
+        tokens : float, optional
+            The tokens to take, by default 1.
+
+        Returns
+        -------
+        float
+            The seconds waited.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: float = 1.0) -> float:
+        """
+        Asynchronous variant of `acquire`, waiting with `asyncio.sleep`.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+_buckets: Dict[Tuple[float, float, Optional[str]], TokenBucket] = {}
+
+
+def rate_limiter_from_env() -> Optional[TokenBucket]:
+    """
+    Return the token bucket configured through the environment.
+
+    Returns
+    -------
+    Optional[TokenBucket]
+        The bucket for GPTE_RATE_LIMIT requests per minute, or None if rate limiting
+        is not enabled.
+    """
+    per_minute = float(os.getenv("GPTE_RATE_LIMIT", "0") or 0)
+    if per_minute <= 0:
+        return None
+    capacity = float(os.getenv("GPTE_RATE_LIMIT_BURST", "1"))
+    path = os.getenv("GPTE_RATE_LIMIT_FILE") or None
+    key = (per_minute, capacity, str(Path(path).absolute()) if path else None)
+    if key not in _buckets:
+        _buckets[key] = TokenBucket(per_minute / 60, capacity, path)
+    return _buckets[key]
@@ -0,0 +1,226 @@
+"""
+This module provides an opt-in, content-addressed on-disk cache of chat completions.
+
+Benchmarks and evals send the same system and user prompts at temperature 0 over and
+over. With a cache configured, `AI.next` looks up the completion by a digest of the
+endpoint, model, temperature and serialized messages and replays the stored message instead of
+calling the API. The token usage stored with the completion is still recorded, so
+token usage logs of replayed runs match the original ones.
+
+Classes:
+- ResponseCache: Directory of cached completions with size-based eviction.
+
+Functions:
+- response_cache_from_env: Returns the cache configured through the environment, if any.
+
+Environment:
+- GPTE_RESPONSE_CACHE_DIR: Directory of the cache (caching is disabled when unset).
+- GPTE_RESPONSE_CACHE_MAX_MB: Size limit of the cache in megabytes (default 256).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from langchain.schema import AIMessage, BaseMessage, messages_from_dict, messages_to_dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 << 20
+
+CachedResponse = Tuple[AIMessage, Optional[Tuple[int, int]]]
+
+
+class ResponseCache:
+    """
+    A content-addressed store of chat completions in a directory.
+
+    Each completion is a JSON file named after the digest of its request. When the
+    directory grows beyond `max_bytes`, the least recently used entries are removed.
+
+    Attributes
+    ----------
+    path : Path
+        The directory holding the cached completions.
+    max_bytes : int
+        The size limit of the directory.
+    hits : int
+        The number of lookups answered from the cache.
+    misses : int
+        The number of lookups that found nothing.
+
+    Methods
+    -------
+    key(model, temperature, messages, endpoint) -> str:
+        Compute the cache key of a request.
+    get(key) -> Optional[CachedResponse]:
+        Return the cached message and token usage for a key.
+    put(key, message, usage) -> None:
+        Store a completion and evict old entries if needed.
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the ResponseCache class.
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The directory holding the cached completions.
+        max_bytes : int, optional
+            The size limit of the directory, by default 256 MB.
+        """
+        self.path = Path(path).absolute()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # The size of the directory as of the last scan, plus the entries written
+        # since, so that only writes that cross the limit scan the directory
+        self._size: Optional[int] = None
+
+    @staticmethod
+    def key(
+        model: str, temperature: float, messages: List[BaseMessage], endpoint: str = ""
+    ) -> str:
+        """
+        Compute the cache key of a request.
+
+        Parameters
+        ----------
+        model : str
+            The name of the model.
+        temperature : float
+            The sampling temperature.
+        messages : List[BaseMessage]
+            The messages sent to the model.
+        endpoint : str, optional
+            The API base URL the request is sent to, by default "" (not given).
+
+        Returns
+        -------
+        str
+            The hex digest identifying the request.
+        """
+        request = {
+            "endpoint": endpoint,
+            "model": model,
+            "temperature": temperature,
+            "messages": [
+                {"type": message.type, "content": message.content} for message in messages
+            ],
+        }
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Return the cached message and token usage for a key.
+
+        Parameters
+        ----------
+        key : str
+            The cache key of the request.
+
+        Returns
+        -------
+        Optional[CachedResponse]
+            The message and its (prompt, completion) token usage, or None on a miss.
+        """
+        entry_path = self.path / f"{key}.json"
+        try:
+            entry = json.loads(entry_path.read_text(encoding="utf-8"))
+            # Mark as recently used for eviction
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        message = messages_from_dict([entry["message"]])[0]
+        usage = tuple(entry["usage"]) if entry["usage"] else None
+        return message, usage  # type: ignore
+
+    def put(
+        self, key: str, message: AIMessage, usage: Optional[Tuple[int, int]] = None
+    ) -> None:
+        """
+        Store a completion and evict the least recently used entries if needed.
+
+        Parameters
+        ----------
+        key : str
+            The cache key of the request.
+        message : AIMessage
+            The completion.
+        usage : Optional[Tuple[int, int]], optional
+            The (prompt, completion) token usage of the completion.
+        """
+        entry = {
+            "message": messages_to_dict([message])[0],
+            "usage": list(usage) if usage else None,
+        }
+        entry_path = self.path / f"{key}.json"
+        tmp_path = self.path / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path.write_text(json.dumps(entry), encoding="utf-8")
+        with self._lock:
+            try:
+                replaced = entry_path.stat().st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, entry_path)
+            if self._size is not None:
+                self._size += entry_path.stat().st_size - replaced
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Scans the directory, which other processes may write to as well, and
+        # removes the least recently used entries while it is over the limit
+        entries = []
+        total = 0
+        for entry_path in self.path.glob("*.json"):
+            try:
+                stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+            total += stat.st_size
+        if total > self.max_bytes:
+            for _, size, entry_path in sorted(entries):
+                entry_path.unlink(missing_ok=True)
+                total -= size
+                logger.debug(f"Evicted cached response {entry_path.name}")
+                if total <= self.max_bytes:
+                    break
+        self._size = total
+
+
+_caches: Dict[Tuple[str, int], ResponseCache] = {}
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """
+    Return the response cache configured through the environment.
+
+    Returns
+    -------
+    Optional[ResponseCache]
+        The cache in GPTE_RESPONSE_CACHE_DIR, or None if caching is not enabled.
+    """
+    path = os.getenv("GPTE_RESPONSE_CACHE_DIR")
+    if not path:
+        return None
+    max_bytes = int(float(os.getenv("GPTE_RESPONSE_CACHE_MAX_MB", "256")) * (1 << 20))
+    key = (str(Path(path).absolute()), max_bytes)
+    if key not in _caches:
+        _caches[key] = ResponseCache(path, max_bytes=max_bytes)
+    return _caches[key]
@@ -0,0 +1,478 @@
+"""
+Scheduling of steps as a dependency graph.
+
+Steps declare the databases, or files in databases, they read and write as a
+`StepIO`, e.g. `StepIO(reads=("workspace/all_output.txt",), writes=("workspace/run.sh",))`.
+A later step depends on an earlier one if one of them writes what the other reads or
+writes, so the graph keeps the outcome of running the steps in order while steps that
+do not touch the same data run concurrently. Steps that interact with the user declare
+the `console` resource, which serializes them and keeps them on the calling thread;
+steps without a declaration conflict with every other step.
+
+Every run records a `ScheduleTrace` with the start and end of each step and the
+critical path: the chain of dependent steps that determined the total latency.
+With `Checkpoints`, the outputs of every step are checkpointed, and steps whose inputs
+did not change since their checkpoint are restored instead of run when resuming.
+Each step also runs in a "step" span (see `gpt_engineer.core.tracing`); steps in the
+thread pool run in a copy of the caller's context, so their spans nest under the run.
+
+Classes:
+- StepIO: The resources a step reads and writes.
+- StepTiming: When a step ran and what it waited for.
+- ScheduleTrace: The timings of a scheduled run and its critical path.
+
+Functions:
+- build_dag: Computes the dependencies of a list of steps.
+- run_dag: Runs steps concurrently along their dependencies.
+- arun_dag: Asynchronous variant of `run_dag`.
+
+Environment:
+- GPTE_STEP_WORKERS: The maximum number of steps running at once (default 4).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import typing
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from gpt_engineer.core.ai import AI
+from gpt_engineer.core.db import DBs
+from gpt_engineer.core.domain import Step
+from gpt_engineer.core.tracing import span
+
+if typing.TYPE_CHECKING:
+    from gpt_engineer.core.checkpoint import Checkpoints
+
+logger = logging.getLogger(__name__)
+
+CONSOLE = "console"
+"""The resource of steps that read from or write to the terminal."""
+
+ANYTHING = "*"
+
+
+@dataclass(frozen=True)
+class StepIO:
+    """
+    The resources a step reads and writes.
+
+    Resources are `DBs` field names ("workspace"), files in them ("workspace/run.sh"),
+    or `CONSOLE`. A database overlaps every file in it.
+
+    Attributes
+    ----------
+    reads : Tuple[str, ...]
+        The resources the step reads.
+    writes : Tuple[str, ...]
+        The resources the step writes.
+    """
+
+    reads: Tuple[str, ...] = ()
+    writes: Tuple[str, ...] = ()
+
+
+UNDECLARED = StepIO(reads=(ANYTHING,), writes=(ANYTHING,))
+
+
+def _overlap(a: str, b: str) -> bool:
+    return a == b or ANYTHING in (a, b) or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def _conflict(first: StepIO, second: StepIO) -> bool:
+    return any(
+        _overlap(written, used)
+        for written in first.writes
+        for used in second.reads + second.writes
+    ) or any(_overlap(read, written) for read in first.reads for written in second.writes)
+
+
+def _io_of(step: Step, io: Mapping[Step, StepIO]) -> StepIO:
+    declared = io.get(step, UNDECLARED)
+    # The runner stores the messages of every step in the logs database
+    return StepIO(declared.reads, declared.writes + (f"logs/{step.__name__}",))
+
+
+def build_dag(steps: List[Step], io: Mapping[Step, StepIO]) -> List[Set[int]]:
+    """
+    Compute the dependencies of a list of steps.
+
+    Parameters
+    ----------
+    steps : List[Step]
+        The steps, in the order they would run sequentially.
+    io : Mapping[Step, StepIO]
+        The declared resources of the steps.
+
+    Returns
+    -------
+    List[Set[int]]
+        For every step, the indices of the earlier steps it depends on directly.
+    """
+    ios = [_io_of(step, io) for step in steps]
+    deps: List[Set[int]] = []
+    for j, later in enumerate(ios):
+        direct = {i for i in range(j) if _conflict(ios[i], later)}
+        # Drop dependencies implied by other dependencies
+        implied = set().union(*(_ancestors(deps, i) for i in direct))
+        deps.append(direct - implied)
+    return deps
+
+
+def _ancestors(deps: List[Set[int]], i: int) -> Set[int]:
+    seen: Set[int] = set()
+    stack = list(deps[i])
+    while stack:
+        k = stack.pop()
+        if k not in seen:
+            seen.add(k)
+            stack.extend(deps[k])
+    return seen
+
+
+@dataclass
+class StepTiming:
+    """
+    When a step ran and what it waited for.
+
+    Attributes
+    ----------
+    name : str
+        The name of the step.
+    start : float
+        The start of the step in seconds since the start of the run.
+    end : float
+        The end of the step in seconds since the start of the run.
+    depends_on : List[str]
+        The names of the steps it depended on directly.
+    resumed : bool
+        Whether the step was restored from a checkpoint instead of run.
+    """
+
+    name: str
+    start: float
+    end: float
+    depends_on: List[str] = field(default_factory=list)
+    resumed: bool = False
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class ScheduleTrace:
+    """
+    The timings of a scheduled run and its critical path.
+
+    Attributes
+    ----------
+    steps : List[StepTiming]
+        The timings of the steps that ran, in the order of the step list.
+    wall_seconds : float
+        The time from the start of the first step to the end of the last one.
+    critical_path : List[str]
+        The chain of dependent steps with the largest total duration.
+    critical_path_seconds : float
+        The total duration of the steps on the critical path.
+    """
+
+    steps: List[StepTiming]
+    wall_seconds: float
+    critical_path: List[str]
+    critical_path_seconds: float
+
+    @classmethod
+    def from_timings(cls, timings: List[StepTiming], wall_seconds: float):
+        by_name = {timing.name: timing for timing in timings}
+        # Longest path through the dependencies, weighted by step durations
+        best: Dict[str, Tuple[float, List[str]]] = {}
+        for timing in timings:
+            before = max(
+                (best[dep] for dep in timing.depends_on if dep in best),
+                default=(0.0, []),
+                key=lambda path: path[0],
+            )
+            best[timing.name] = (
+                before[0] + by_name[timing.name].duration,
+                before[1] + [timing.name],
+            )
+        seconds, path = max(best.values(), default=(0.0, []), key=lambda p: p[0])
+        return cls(timings, wall_seconds, path, seconds)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), indent=2)
+
+
+def _max_workers() -> int:
+    return max(1, int(os.getenv("GPTE_STEP_WORKERS", "4")))
+
+
+def _run_step(
+    ai: AI, dbs: DBs, step: Step, checkpoints: Optional["Checkpoints"] = None
+) -> bool:
+    # Returns whether the step was restored from its checkpoint
+    with span("step", **{"step.name": step.__name__}) as step_span:
+        pending = checkpoints.begin(ai, dbs, step) if checkpoints is not None else None
+        resumed = pending is not None and pending.restored is not None
+        step_span.set_attribute("step.resumed", resumed)
+        if resumed:
+            messages = pending.restored
+        else:
+            messages = step(ai, dbs)
+            if pending is not None:
+                pending.save(messages)
+        dbs.logs[step.__name__] = AI.serialize_messages(messages)
+    return resumed
+
+
+def run_dag(
+    ai: AI,
+    dbs: DBs,
+    steps: List[Step],
+    io: Mapping[Step, StepIO],
+    max_workers: Optional[int] = None,
+    checkpoints: Optional["Checkpoints"] = None,
+) -> ScheduleTrace:
+    """
+    Run steps concurrently along their dependencies, storing their messages in the logs.
+
+    A step starts once all steps it depends on are done. While a single step can run,
+    it runs on the calling thread, as do all console steps, so that prompts and ctrl+c
+    behave as in a sequential run; additional independent steps run in a thread pool.
+    If a step raises, no further steps are started and the error is re-raised once the
+    running steps are done.
+
+    Parameters
+    ----------
+    ai : AI
+        The AI to run the steps with.
+    dbs : DBs
+        The databases of the run.
+    steps : List[Step]
+        The steps, in the order they would run sequentially.
+    io : Mapping[Step, StepIO]
+        The declared resources of the steps.
+    max_workers : Optional[int], optional
+        The maximum number of steps running at once, by default GPTE_STEP_WORKERS.
+    checkpoints : Optional[Checkpoints], optional
+        The checkpoints to store the outputs of the steps in and, when resuming,
+        restore steps from, by default None.
+
+    Returns
+    -------
+    ScheduleTrace
+        The timings of the steps and the critical path.
+    """
+    scheduler = _Scheduler(steps, build_dag(steps, io), io)
+    limit = max_workers or _max_workers()
+    pool = ThreadPoolExecutor(max_workers=limit)
+    running: Dict[Future, int] = {}
+    try:
+        while not scheduler.finished(running):
+            ready = scheduler.ready()
+            inline = [i for i in ready if scheduler.is_console(i)]
+            background = [i for i in ready if not scheduler.is_console(i)]
+            if not running and not inline and len(background) == 1:
+                # A lone step runs on the calling thread, as in a sequential run
+                inline, background = background, []
+            for i in background[: max(0, limit - len(running))]:
+                scheduler.start(i)
+                future = pool.submit(
+                    copy_context().run, _run_step, ai, dbs, steps[i], checkpoints
+                )
+                running[future] = i
+            if inline:
+                i = inline[0]
+                scheduler.start(i)
+                try:
+                    resumed = _run_step(ai, dbs, steps[i], checkpoints)
+                except BaseException as e:
+                    scheduler.fail(i, e)
+                else:
+                    scheduler.finish(i, resumed)
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    scheduler.finish(i, future.result())
+                else:
+                    scheduler.fail(i, error)
+    finally:
+        pool.shutdown(wait=True)
+    return scheduler.trace()
+
+
+async def arun_dag(
+    ai: AI,
+    dbs: DBs,
+    steps: List[Step],
+    io: Mapping[Step, StepIO],
+    async_steps: Mapping[Step, Callable[[AI, DBs], Awaitable[list]]],
+    max_workers: Optional[int] = None,
+    checkpoints: Optional["Checkpoints"] = None,
+) -> ScheduleTrace:
+    """
+    Asynchronous variant of `run_dag`.
+
+    Steps with an asynchronous variant are awaited, all other steps run in the event
+    loop's default executor, except for console steps: these run one at a time on the
+    thread of the event loop, as on the calling thread of `run_dag`, so that prompts
+    and redirected output behave as in a sequential run. A console step without an
+    asynchronous variant blocks the event loop while it runs.
+
+    Parameters
+    ----------
+    ai : AI
+        The AI to run the steps with.
+    dbs : DBs
+        The databases of the run.
+    steps : List[Step]
+        The steps, in the order they would run sequentially.
+    io : Mapping[Step, StepIO]
+        The declared resources of the steps.
+    async_steps : Mapping[Step, Callable[[AI, DBs], Awaitable[list]]]
+        The asynchronous variants of steps.
+    max_workers : Optional[int], optional
+        The maximum number of steps running at once, by default GPTE_STEP_WORKERS.
+    checkpoints : Optional[Checkpoints], optional
+        The checkpoints to store the outputs of the steps in and, when resuming,
+        restore steps from, by default None.
+
+    Returns
+    -------
+    ScheduleTrace
+        The timings of the steps and the critical path.
+    """
+    loop = asyncio.get_running_loop()
+    scheduler = _Scheduler(steps, build_dag(steps, io), io)
+    limit = max_workers or _max_workers()
+    running: Dict[asyncio.Future, int] = {}
+
+    async def run_step(step: Step, inline: bool = False) -> bool:
+        async_step = async_steps.get(step)
+        if async_step is None and inline:
+            return _run_step(ai, dbs, step, checkpoints)
+        if async_step is None:
+            return await loop.run_in_executor(
+                None, copy_context().run, _run_step, ai, dbs, step, checkpoints
+            )
+        with span("step", **{"step.name": step.__name__}) as step_span:
+            pending = (
+                checkpoints.begin(ai, dbs, step) if checkpoints is not None else None
+            )
+            resumed = pending is not None and pending.restored is not None
+            step_span.set_attribute("step.resumed", resumed)
+            if resumed:
+                messages = pending.restored
+            else:
+                messages = await async_step(ai, dbs)
+                if pending is not None:
+                    pending.save(messages)
+            dbs.logs[step.__name__] = AI.serialize_messages(messages)
+        return resumed
+
+    try:
+        while not scheduler.finished(running):
+            ready = scheduler.ready()
+            inline = [i for i in ready if scheduler.is_console(i)]
+            background = [i for i in ready if not scheduler.is_console(i)]
+            for i in background[: max(0, limit - len(running))]:
+                scheduler.start(i)
+                running[asyncio.ensure_future(run_step(steps[i]))] = i
+            if inline:
+                i = inline[0]
+                scheduler.start(i)
+                try:
+                    resumed = await run_step(steps[i], inline=True)
+                except BaseException as e:
+                    scheduler.fail(i, e)
+                else:
+                    scheduler.finish(i, resumed)
+                continue
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = running.pop(task)
+                if task.exception() is None:
+                    scheduler.finish(i, task.result())
+                else:
+                    scheduler.fail(i, task.exception())
+    finally:
+        if running:
+            await asyncio.wait(running)
+    return scheduler.trace()
+
+
+class _Scheduler:
+    # The bookkeeping shared by the synchronous and asynchronous runners
+
+    def __init__(
+        self, steps: List[Step], deps: List[Set[int]], io: Mapping[Step, StepIO]
+    ):
+        self.steps = steps
+        self.deps = deps
+        self.console = [CONSOLE in io.get(step, UNDECLARED).writes for step in steps]
+        self.started: Set[int] = set()
+        self.done: Set[int] = set()
+        self.error: Optional[BaseException] = None
+        self.origin = time.perf_counter()
+        self.times: Dict[int, Tuple[float, float]] = {}
+        self.resumed: Set[int] = set()
+
+    def is_console(self, i: int) -> bool:
+        return self.console[i]
+
+    def ready(self) -> List[int]:
+        if self.error is not None:
+            return []
+        return [
+            i
+            for i in range(len(self.steps))
+            if i not in self.started and self.deps[i] <= self.done
+        ]
+
+    def finished(self, running) -> bool:
+        if running:
+            return False
+        if self.error is not None:
+            raise self.error
+        return len(self.done) == len(self.steps)
+
+    def start(self, i: int) -> None:
+        self.started.add(i)
+        self.times[i] = (time.perf_counter() - self.origin, 0.0)
+
+    def finish(self, i: int, resumed: bool = False) -> None:
+        self.done.add(i)
+        if resumed:
+            self.resumed.add(i)
+        self.times[i] = (self.times[i][0], time.perf_counter() - self.origin)
+        logger.debug(f"Step {self.steps[i].__name__} done after {self.times[i][1]:.2f}s")
+
+    def fail(self, i: int, error: BaseException) -> None:
+        self.finish(i)
+        if self.error is None:
+            self.error = error
+
+    def trace(self) -> ScheduleTrace:
+        timings = [
+            StepTiming(
+                name=self.steps[i].__name__,
+                start=self.times[i][0],
+                end=self.times[i][1],
+                depends_on=[self.steps[k].__name__ for k in sorted(self.deps[i])],
+                resumed=i in self.resumed,
+            )
+            for i in range(len(self.steps))
+            if i in self.done
+        ]
+        wall = max((timing.end for timing in timings), default=0.0)
+        return ScheduleTrace.from_timings(timings, wall)
@@ -0,0 +1,232 @@
+"""
+Sharding of improve requests over large file selections.
+
+Improving code sends every selected file to the model in one prompt, which overflows
+the context window of large selections and leaves all of the work to one long
+completion. `plan_shards` instead groups the files, in path order so that files of the
+same package stay together, into shards whose prompts fit a token budget; the shards
+are then improved by concurrent requests. `merge_edits` combines the edits of all
+shards: an existing file only takes the edits of the shard it was sent with, edits
+other shards return for it are dropped and reported, since they were made without
+seeing the file. New files may be returned by several shards; identical versions are
+taken once, edits to different lines are merged, and overlapping edits are reported as
+conflicts.
+
+Classes:
+- Shard: A group of files improved by one request.
+- MergeResult: The merged edits of all shards and their conflicts.
+
+Functions:
+- plan_shards: Groups files into shards under a token budget.
+- three_way_merge: Merges two edits of the same text, if they do not overlap.
+- merge_edits: Merges the files returned by all shards.
+- shard_tokens_from_env: Returns the token budget of a shard.
+- improve_workers_from_env: Returns the number of shards improved at once.
+
+Environment:
+- GPTE_IMPROVE_SHARD_TOKENS: The token budget of the files of a shard (by default, what
+  fits the context window, so that only selections too large for one request are
+  sharded).
+- GPTE_IMPROVE_WORKERS: The number of shard requests in flight at once (default 4).
+"""
+
+import os
+
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Collection, Dict, List, Mapping, Optional, Sequence, Tuple
+
+
+@dataclass
+class Shard:
+    """
+    A group of files improved by one request.
+
+    Attributes
+    ----------
+    files : List[str]
+        The names of the files, in path order.
+    tokens : int
+        The number of tokens of the files in the prompt.
+    """
+
+    files: List[str] = field(default_factory=list)
+    tokens: int = 0
+
+
+@dataclass
+class MergeResult:
+    """
+    The merged edits of all shards.
+
+    Attributes
+    ----------
+    files : Dict[str, str]
+        The merged content of every edited file.
+    conflicts : Dict[str, List[int]]
+        For files whose edits overlapped, the indices of the shards that edited them.
+    dropped : Dict[str, List[int]]
+        For existing files, the indices of the shards that edited them without being
+        sent them, whose edits were dropped.
+    """
+
+    files: Dict[str, str]
+    conflicts: Dict[str, List[int]]
+    dropped: Dict[str, List[int]] = field(default_factory=dict)
+
+
+def plan_shards(tokens: Mapping[str, int], budget: int) -> List[Shard]:
+    """
+    Group files into shards whose tokens stay within a budget.
+
+    Files are taken in path order and added to the current shard until the next file
+    would exceed the budget. A file larger than the budget gets a shard of its own.
+
+    Parameters
+    ----------
+    tokens : Mapping[str, int]
+        The number of prompt tokens of every file.
+    budget : int
+        The maximum number of tokens of the files of a shard.
+
+    Returns
+    -------
+    List[Shard]
+        The shards, a single one if all files fit the budget.
+    """
+    shards: List[Shard] = []
+    current = Shard()
+    for name in sorted(tokens):
+        if current.files and current.tokens + tokens[name] > budget:
+            shards.append(current)
+            current = Shard()
+        current.files.append(name)
+        current.tokens += tokens[name]
+    if current.files or not shards:
+        shards.append(current)
+    return shards
+
+
+def three_way_merge(base: str, ours: str, theirs: str) -> Optional[str]:
+    """
+    Merge two edits of the same text, line by line.
+
+    Parameters
+    ----------
+    base : str
+        The original text.
+    ours : str
+        The first edited version.
+    theirs : str
+        The second edited version.
+
+    Returns
+    -------
+    Optional[str]
+        The text with both edits applied, or None if they change the same or
+        adjacent lines differently.
+    """
+    if ours == theirs or theirs == base:
+        return ours
+    if ours == base:
+        return theirs
+
+    base_lines = base.splitlines(keepends=True)
+    # Changed line ranges of the base, with their replacement and the side
+    hunks: List[Tuple[int, int, List[str], int]] = []
+    for side, text in enumerate((ours, theirs)):
+        lines = text.splitlines(keepends=True)
+        matcher = SequenceMatcher(None, base_lines, lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                hunks.append((i1, i2, lines[j1:j2], side))
+    hunks.sort(key=lambda hunk: (hunk[0], hunk[1], hunk[3]))
+
+    merged: List[str] = []
+    pos = 0
+    last: List[Optional[Tuple[int, int, List[str], int]]] = [None, None]
+    for hunk in hunks:
+        start, end, lines, side = hunk
+        other = last[1 - side]
+        if other is not None and start <= other[1]:
+            if (start, end, lines) == other[:3]:
+                # The same change on both sides
+                continue
+            return None
+        last[side] = hunk
+        merged.extend(base_lines[pos:start])
+        merged.extend(lines)
+        pos = end
+    merged.extend(base_lines[pos:])
+    return "".join(merged)
+
+
+def merge_edits(
+    base: Mapping[str, str],
+    edits: Sequence[Sequence[Tuple[str, str]]],
+    owners: Sequence[Collection[str]],
+    concatenate: Collection[str] = ("README.md",),
+) -> MergeResult:
+    """
+    Merge the files returned by all shards.
+
+    Parameters
+    ----------
+    base : Mapping[str, str]
+        The contents of the files before the edits.
+    edits : Sequence[Sequence[Tuple[str, str]]]
+        For every shard, the names and new contents of the files it returned.
+    owners : Sequence[Collection[str]]
+        For every shard, the names of the files it was sent. Only these shards may
+        edit the files of `base`.
+    concatenate : Collection[str], optional
+        Files whose versions are joined rather than merged, by default the README the
+        model describes its changes in.
+
+    Returns
+    -------
+    MergeResult
+        The merged files, the conflicts and the dropped edits.
+    """
+    versions: Dict[str, List[Tuple[int, str]]] = {}
+    dropped: Dict[str, List[int]] = {}
+    for shard, files in enumerate(edits):
+        for name, content in files:
+            if name in base and name not in concatenate and name not in owners[shard]:
+                dropped.setdefault(name, []).append(shard)
+                continue
+            versions.setdefault(name, []).append((shard, content))
+
+    merged: Dict[str, str] = {}
+    conflicts: Dict[str, List[int]] = {}
+    for name, candidates in versions.items():
+        if name in concatenate:
+            merged[name] = "\n\n".join(content for _, content in candidates)
+            continue
+        result: Optional[str] = candidates[0][1]
+        for _, content in candidates[1:]:
+            result = three_way_merge(base.get(name, ""), result, content)  # type: ignore
+            if result is None:
+                break
+        if result is None:
+            conflicts[name] = [shard for shard, _ in candidates]
+            result = candidates[0][1]
+        merged[name] = result
+    return MergeResult(merged, conflicts, dropped)
+
+
+def shard_tokens_from_env() -> Optional[int]:
+    """
+    Return the token budget of the files of a shard, from GPTE_IMPROVE_SHARD_TOKENS.
+
+    None if it is not set, in which case shards take what fits the context window.
+    """
+    tokens = os.getenv("GPTE_IMPROVE_SHARD_TOKENS")
+    return int(tokens) if tokens else None
+
+
+def improve_workers_from_env() -> int:
+    """
+    Return the number of shard requests in flight at once, from GPTE_IMPROVE_WORKERS.
+    """
+    return max(1, int(os.getenv("GPTE_IMPROVE_WORKERS", "4")))
@@ -0,0 +1,298 @@
+"""
+Spilling of large database values to disk under a process-wide memory budget.
+
+Dict-backed databases keep every value as a Python string in the request body, so with
+many concurrent runs in one process, resident memory grows with the size of all their
+outputs, logs and workspaces. With a `SpillStore`, values above a size threshold are
+stored as `SpilledValue` handles instead. The handles keep their text in memory while
+the store's budget allows it; once the large values of all databases exceed the
+budget, the least recently used ones are written to an anonymous temporary file and
+dropped from memory, and read back when accessed again.
+
+The body stays usable as before: `Files` loads spilled values on item access and
+iteration, so callers reading the body, and `json.dumps`, see plain strings.
+
+Classes:
+- SpilledValue: A large value that may live on disk.
+- SpillStore: The temporary file and LRU memory budget shared by spilled values.
+
+Functions:
+- spill_store_from_env: Returns the process-wide store configured through the
+  environment, if any.
+
+Environment:
+- GPTE_SPILL_BUDGET_MB: Memory budget of large values in megabytes (spilling is
+  disabled when unset).
+- GPTE_SPILL_THRESHOLD_KB: Size from which values are spilled, in kilobytes
+  (default 64).
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import weakref
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+DEFAULT_THRESHOLD = 64 << 10
+
+
+class SpilledValue:
+    """
+    A large value whose text is kept in memory or on disk by a `SpillStore`.
+
+    Values compare equal to the strings (and other spilled values) holding the same
+    text, so mappings of spilled values compare like mappings of strings.
+
+    Methods
+    -------
+    load() -> str:
+        Return the text, reading it back from disk if it was spilled.
+    """
+
+    __slots__ = ("_store", "_id", "_text", "__weakref__")
+
+    def __init__(self, store: "SpillStore", entry_id: int, text: str):
+        self._store = store
+        self._id = entry_id
+        self._text: Optional[str] = text
+
+    def load(self) -> str:
+        return self._store.load(self)
+
+    def __str__(self) -> str:
+        return self.load()
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, SpilledValue):
+            other = other.load()
+        return self.load() == other
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        state = "in memory" if self._text is not None else "on disk"
+        return f"<SpilledValue {self._id} {state}>"
+
+
+class _Entry:
+    __slots__ = ("ref", "size", "offset", "length")
+
+    def __init__(self, ref: weakref.ref, size: int):
+        self.ref = ref
+        self.size = size
+        self.offset: Optional[int] = None
+        self.length = 0
+
+
+class SpillStore:
+    """
+    Keeps large values in memory up to a budget and spills the rest to a temporary file.
+
+    Values are written to disk only when they are evicted, and only once: a value read
+    back stays on disk and is simply dropped from memory when evicted again. Space of
+    values that are no longer referenced is reclaimed by compacting the file once it is
+    mostly garbage.
+
+    Attributes
+    ----------
+    budget : int
+        The number of bytes spilled values may occupy in memory.
+    threshold : int
+        The length from which strings are spilled.
+    resident_bytes : int
+        The memory currently held by spilled values.
+    disk_bytes : int
+        The bytes of live values in the temporary file.
+    spills : int
+        The number of values written to disk.
+    loads : int
+        The number of values read back from disk.
+
+    Methods
+    -------
+    put(text) -> Union[str, SpilledValue]:
+        Return the value to store for a text.
+    load(value) -> str:
+        Return the text of a spilled value.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        threshold: int = DEFAULT_THRESHOLD,
+        directory: Optional[str] = None,
+    ):
+        """
+        Initialize the SpillStore class.
+
+        Parameters
+        ----------
+        budget : int
+            The number of bytes spilled values may occupy in memory.
+        threshold : int, optional
+            The length from which strings are spilled, by default 64 KB.
+        directory : Optional[str], optional
+            The directory of the temporary file, by default the system's.
+        """
+        self.budget = budget
+        self.threshold = threshold
+        self.resident_bytes = 0
+        self.disk_bytes = 0
+        self.spills = 0
+        self.loads = 0
+        self._directory = directory
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._end = 0
+        self._dead_bytes = 0
+        self._entries: Dict[int, _Entry] = {}
+        self._resident: "OrderedDict[int, None]" = OrderedDict()
+        self._ids = itertools.count()
+        # Reentrant, as releasing a value can run while the lock is held
+        self._lock = threading.RLock()
+
+    def put(self, text: str) -> Union[str, SpilledValue]:
+        """
+        Return the value to store for a text: the text itself if it is small.
+
+        Parameters
+        ----------
+        text : str
+            The text to store.
+
+        Returns
+        -------
+        Union[str, SpilledValue]
+            The text, or a spilled value holding it if it reaches the threshold.
+        """
+        if len(text) < self.threshold:
+            return text
+        entry_id = next(self._ids)
+        value = SpilledValue(self, entry_id, text)
+        with self._lock:
+            self._entries[entry_id] = _Entry(
+                weakref.ref(value, lambda _, i=entry_id: self._release(i)),
+                sys.getsizeof(text),
+            )
+            self._admit(entry_id)
+        return value
+
+    def load(self, value: SpilledValue) -> str:
+        """
+        Return the text of a spilled value, reading it back from disk if needed.
+
+        Parameters
+        ----------
+        value : SpilledValue
+            A value returned by `put`.
+
+        Returns
+        -------
+        str
+            The text of the value.
+        """
+        with self._lock:
+            text = value._text
+            if text is not None:
+                self._resident.move_to_end(value._id)
+                return text
+            entry = self._entries[value._id]
+            assert entry.offset is not None
+            text = self._read(entry.offset, entry.length).decode("utf-8")
+            self.loads += 1
+            value._text = text
+            self._admit(value._id)
+            return text
+
+    def _admit(self, entry_id: int) -> None:
+        self._resident[entry_id] = None
+        self.resident_bytes += self._entries[entry_id].size
+        while self.resident_bytes > self.budget and self._resident:
+            self._evict(next(iter(self._resident)))
+
+    def _evict(self, entry_id: int) -> None:
+        entry = self._entries[entry_id]
+        value = entry.ref()
+        del self._resident[entry_id]
+        self.resident_bytes -= entry.size
+        if value is None:
+            return
+        if entry.offset is None:
+            data = value._text.encode("utf-8")
+            self._file.seek(self._end)
+            self._file.write(data)
+            entry.offset, entry.length = self._end, len(data)
+            self._end += len(data)
+            self.disk_bytes += len(data)
+            self.spills += 1
+        value._text = None
+
+    def _release(self, entry_id: int) -> None:
+        with self._lock:
+            entry = self._entries.pop(entry_id, None)
+            if entry is None:
+                return
+            if entry_id in self._resident:
+                del self._resident[entry_id]
+                self.resident_bytes -= entry.size
+            if entry.offset is not None:
+                self.disk_bytes -= entry.length
+                self._dead_bytes += entry.length
+                if self._dead_bytes > max(16 << 20, self.disk_bytes):
+                    self._compact()
+
+    def _read(self, offset: int, length: int) -> bytes:
+        # Plain reads rather than a memory map, so that the pages read back do not
+        # count towards the resident memory of the process; the caller holds the lock
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def _compact(self) -> None:
+        # Copy the live values to a new file; the caller holds the lock
+        new_file = tempfile.TemporaryFile(dir=self._directory)
+        end = 0
+        for entry in list(self._entries.values()):
+            if entry.offset is None:
+                continue
+            new_file.write(self._read(entry.offset, entry.length))
+            entry.offset = end
+            end += entry.length
+        self._file.close()
+        self._file, self._end, self._dead_bytes = new_file, end, 0
+
+    def close(self) -> None:
+        """
+        Release the temporary file. Values spilled to disk can no longer be loaded.
+        """
+        with self._lock:
+            self._file.close()
+
+
+_spill_store: Optional[SpillStore] = None
+_spill_store_lock = threading.Lock()
+
+
+def spill_store_from_env() -> Optional[SpillStore]:
+    """
+    Return the process-wide spill store configured through the environment.
+
+    Returns
+    -------
+    Optional[SpillStore]
+        The store with the budget in GPTE_SPILL_BUDGET_MB, or None if spilling is not
+        enabled.
+    """
+    global _spill_store
+    budget = os.getenv("GPTE_SPILL_BUDGET_MB")
+    if not budget:
+        return None
+    with _spill_store_lock:
+        if _spill_store is None:
+            threshold = float(os.getenv("GPTE_SPILL_THRESHOLD_KB", "64"))
+            _spill_store = SpillStore(
+                int(float(budget) * (1 << 20)), threshold=int(threshold * (1 << 10))
+            )
+        return _spill_store
@@ -23,6 +23,7 @@ Classes:
 Functions:
 - setup_sys_prompt(dbs: DBs) -> str: Creates a system prompt for the AI.
 - setup_sys_prompt_existing_code(dbs: DBs) -> str: System prompt creation using existing code base.
+- stream_files(dbs: DBs): Creates callbacks writing generated files to the workspace as they stream in.
 - curr_fn() -> str: Returns the name of the current function.
 - lite_gen(ai: AI, dbs: DBs) -> List[Message]: Runs the AI on the main prompt and saves results.
 - simple_gen(ai: AI, dbs: DBs) -> List[Message]: Runs the AI on default prompts and saves results.
@@ -39,30 +40,49 @@ Functions:
 
 Constants:
 - STEPS: A dictionary that maps the Config enum to lists of functions to execute for each configuration.
+- ASYNC_STEPS: A dictionary that maps steps to their asyncio variants (alite_gen, asimple_gen,
+  agen_entrypoint, aimprove_existing_code).
 
 Note:
 - This module is central to the GPT-engineer system and its functions are intended to be used in orchestrated
   workflows. As such, it should be used carefully, with attention to the correct order and sequence of operations.
 """
 
+import asyncio
 import inspect
+import json
 import re
 import subprocess
 
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from enum import Enum
-from typing import List, Union
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple, Union
 
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from termcolor import colored
 
-from gpt_engineer.core.ai import AI
+from gpt_engineer.core.ai import AI, TokenStreamCallbackHandler
 from gpt_engineer.core.chat_to_files import (
+    ChatFileStream,
+    apply_file_edits,
     format_file_to_input,
     get_code_strings,
     overwrite_files,
-    to_files,
+    parse_chat,
 )
+from gpt_engineer.core.context_packing import PackedContext, pack_context, prompt_budget
 from gpt_engineer.core.db import DBs
+from gpt_engineer.core.materialize import workspace_path
+from gpt_engineer.core.scheduler import CONSOLE, StepIO
+from gpt_engineer.core.sharding import (
+    Shard,
+    improve_workers_from_env,
+    merge_edits,
+    plan_shards,
+    shard_tokens_from_env,
+)
 from gpt_engineer.cli.file_selector import FILE_LIST_NAME, ask_for_files
 from gpt_engineer.cli.learning import human_review_input
 
@@ -84,12 +104,29 @@ def setup_sys_prompt(dbs: DBs) -> str:
 
     Returns:
     - str: The constructed system prompt for the AI.
+
+    Notes:
+    - The prompt is memoized by the contents of the preprompts, so every request with the
+      same preprompts sends the identical string (whose token count is then cached) and
+      edited preprompts are picked up without explicit invalidation.
     """
+    return _assemble_sys_prompt(
+        dbs.preprompts["roadmap"],
+        dbs.preprompts["generate"],
+        dbs.preprompts["file_format"],
+        dbs.preprompts["philosophy"],
+    )
+
+
+@lru_cache(maxsize=32)
+def _assemble_sys_prompt(
+    roadmap: str, generate: str, file_format: str, philosophy: str
+) -> str:
     return (
-        dbs.preprompts["roadmap"]
-        + dbs.preprompts["generate"].replace("FILE_FORMAT", dbs.preprompts["file_format"])
+        roadmap
+        + generate.replace("FILE_FORMAT", file_format)
         + "\nUseful to know:\n"
-        + dbs.preprompts["philosophy"]
+        + philosophy
     )
 
 
@@ -107,14 +144,41 @@ def setup_sys_prompt_existing_code(dbs: DBs) -> str:
 
     Returns:
     - str: The constructed system prompt focused on existing code improvement for the AI.
+
+    Notes:
+    - Like `setup_sys_prompt`, the prompt is memoized by the contents of the preprompts.
     """
+    return _assemble_existing_code_sys_prompt(
+        dbs.preprompts["improve"],
+        dbs.preprompts["file_format"],
+        dbs.preprompts["philosophy"],
+    )
+
+
+@lru_cache(maxsize=32)
+def _assemble_existing_code_sys_prompt(
+    improve: str, file_format: str, philosophy: str
+) -> str:
     return (
-        dbs.preprompts["improve"].replace("FILE_FORMAT", dbs.preprompts["file_format"])
-        + "\nUseful to know:\n"
-        + dbs.preprompts["philosophy"]
+        improve.replace("FILE_FORMAT", file_format) + "\nUseful to know:\n" + philosophy
     )
 
 
+def stream_files(dbs: DBs) -> Tuple[ChatFileStream, List[TokenStreamCallbackHandler]]:
+    """
+    Prepares writing the files of a completion to the workspace while it streams in.
+
+    Parameters:
+    - dbs (DBs): The database object containing the workspace.
+
+    Returns:
+    - Tuple[ChatFileStream, List[TokenStreamCallbackHandler]]: The file stream, whose
+      `finish` must be called with the complete chat, and the callbacks that feed it.
+    """
+    files = ChatFileStream(dbs.workspace)
+    return files, [TokenStreamCallbackHandler(files.feed, files.reset)]
+
+
 def curr_fn() -> str:
     """
     Retrieves the name of the calling function.
@@ -150,11 +214,16 @@ def lite_gen(ai: AI, dbs: DBs) -> List[Message]:
     Note:
     The function assumes the `ai.start` method and the `to_files` utility to be correctly
     set up and functional. Ensure these prerequisites before invoking `lite_gen`.
+    Files are written to the workspace as soon as their code block has streamed in.
     """
+    files, callbacks = stream_files(dbs)
     messages = ai.start(
-        dbs.input["prompt"], dbs.preprompts["file_format"], step_name=curr_fn()
+        dbs.input["prompt"],
+        dbs.preprompts["file_format"],
+        step_name=curr_fn(),
+        callbacks=callbacks,
     )
-    to_files(messages[-1].content.strip(), dbs.workspace)
+    files.finish(messages[-1].content.strip())
     return messages
 
 
@@ -178,11 +247,19 @@ def simple_gen(ai: AI, dbs: DBs) -> List[Message]:
     Note:
     The function assumes the `ai.start` method and the `to_files` utility are correctly
     set up and functional. Ensure these prerequisites are in place before invoking `simple_gen`.
+    Files are written to the workspace as soon as their code block has streamed in.
     """
-    messages = ai.start(setup_sys_prompt(dbs), dbs.input["prompt"], step_name=curr_fn())
-    to_files(messages[-1].content.strip(), dbs.workspace)
+    files, callbacks = stream_files(dbs)
+    messages = ai.start(
+        setup_sys_prompt(dbs),
+        dbs.input["prompt"],
+        step_name=curr_fn(),
+        callbacks=callbacks,
+    )
+    files.finish(messages[-1].content.strip())
     return messages
 
+
 def clarify(ai: AI, dbs: DBs) -> List[Message]:
     """
     Ask the user if they want to clarify anything and save the results to the workspace
@@ -190,7 +267,7 @@ def clarify(ai: AI, dbs: DBs) -> List[Message]:
     messages = None
     user_input = None
 
-    if 'clarify' not in dbs.logs:
+    if "clarify" not in dbs.logs:
         messages: List[Message] = [ai.fsystem(dbs.preprompts["clarify"])]
         user_input = dbs.input["prompt"]
     else:
@@ -201,6 +278,7 @@ def clarify(ai: AI, dbs: DBs) -> List[Message]:
     messages = ai.next(messages, user_input, step_name=curr_fn())
     return messages
 
+
 def clarify_orig(ai: AI, dbs: DBs) -> List[Message]:
     """
     Interactively queries the user for clarifications on the prompt and saves the AI's responses.
@@ -293,13 +371,15 @@ def gen_clarified_code(ai: AI, dbs: DBs) -> List[dict]:
     ] + messages[
         1:
     ]  # skip the first clarify message, which was the original clarify priming prompt
+    files, callbacks = stream_files(dbs)
     messages = ai.next(
         messages,
         dbs.preprompts["generate"].replace("FILE_FORMAT", dbs.preprompts["file_format"]),
         step_name=curr_fn(),
+        callbacks=callbacks,
     )
 
-    to_files(messages[-1].content.strip(), dbs.workspace)
+    files.finish(messages[-1].content.strip())
     return messages
 
 
@@ -326,7 +406,8 @@ def execute_entrypoint(ai: AI, dbs: DBs) -> List[dict]:
     Note:
     The function assumes the presence of a 'run.sh' script in the specified workspace.
     Ensure the script is available and that it has the appropriate permissions
-    (e.g., executable) before invoking this function.
+    (e.g., executable) before invoking this function. Workspaces that are not stored
+    in a directory are materialized on disk first.
     """
 
     command = dbs.workspace["run.sh"]
@@ -357,7 +438,7 @@ def execute_entrypoint(ai: AI, dbs: DBs) -> List[dict]:
     print("You can press ctrl+c *once* to stop the execution.")
     print()
 
-    p = subprocess.Popen("bash run.sh", shell=True, cwd=dbs.workspace.path)
+    p = subprocess.Popen("bash run.sh", shell=True, cwd=workspace_path(dbs.workspace))
     try:
         p.wait()
     except KeyboardInterrupt:
@@ -370,6 +451,20 @@ def execute_entrypoint(ai: AI, dbs: DBs) -> List[dict]:
     return []
 
 
+ENTRYPOINT_SYSTEM_PROMPT = (
+    "You will get information about a codebase that is currently on disk in "
+    "the current folder.\n"
+    "From this you will answer with code blocks that includes all the necessary "
+    "unix terminal commands to "
+    "a) install dependencies "
+    "b) run all necessary parts of the codebase (in parallel if necessary).\n"
+    "Do not install globally. Do not use sudo.\n"
+    "Do not explain the code, just give the commands.\n"
+    "Do not use placeholders, use example values (like . for a folder argument) "
+    "if necessary.\n"
+)
+
+
 def gen_entrypoint(ai: AI, dbs: DBs) -> List[dict]:
     """
     Generates an entry point script based on a given codebase's information.
@@ -399,29 +494,22 @@ def gen_entrypoint(ai: AI, dbs: DBs) -> List[dict]:
     """
 
     messages = ai.start(
-        system=(
-            "You will get information about a codebase that is currently on disk in "
-            "the current folder.\n"
-            "From this you will answer with code blocks that includes all the necessary "
-            "unix terminal commands to "
-            "a) install dependencies "
-            "b) run all necessary parts of the codebase (in parallel if necessary).\n"
-            "Do not install globally. Do not use sudo.\n"
-            "Do not explain the code, just give the commands.\n"
-            "Do not use placeholders, use example values (like . for a folder argument) "
-            "if necessary.\n"
-        ),
+        system=ENTRYPOINT_SYSTEM_PROMPT,
         user="Information about the codebase:\n\n" + dbs.workspace["all_output.txt"],
         step_name=curr_fn(),
     )
     print()
 
-    regex = r"```\S*\n(.+?)```"
-    matches = re.finditer(regex, messages[-1].content.strip(), re.DOTALL)
-    dbs.workspace["run.sh"] = "\n".join(match.group(1) for match in matches)
+    dbs.workspace["run.sh"] = _extract_entrypoint(messages[-1].content)
     return messages
 
 
+def _extract_entrypoint(chat: str) -> str:
+    regex = r"```\S*\n(.+?)```"
+    matches = re.finditer(regex, chat.strip(), re.DOTALL)
+    return "\n".join(match.group(1) for match in matches)
+
+
 def use_feedback(ai: AI, dbs: DBs):
     """
     Uses the provided feedback to improve the generated code.
@@ -454,8 +542,11 @@ def use_feedback(ai: AI, dbs: DBs):
         ),  # reload previously generated code
     ]
     if dbs.input["feedback"]:
-        messages = ai.next(messages, dbs.input["feedback"], step_name=curr_fn())
-        to_files(messages[-1].content.strip(), dbs.workspace)
+        files, callbacks = stream_files(dbs)
+        messages = ai.next(
+            messages, dbs.input["feedback"], step_name=curr_fn(), callbacks=callbacks
+        )
+        files.finish(messages[-1].content.strip())
         return messages
     else:
         print(
@@ -614,6 +705,13 @@ def improve_existing_code(ai: AI, dbs: DBs):
     - Ensure that the user has correctly set up the desired files for improvement and provided an
       appropriate prompt before calling this function.
     - The function expects the files to be formatted in a specific way to be properly processed by the LLM.
+    - Selections that do not fit the model's context window (or GPTE_IMPROVE_SHARD_TOKENS,
+      if set) are split into shards that are improved by concurrent requests, and their
+      edits merged (see `gpt_engineer.core.sharding`). The messages of all shards are
+      returned.
+    - Requests that do not fit the model's context window (or GPTE_CONTEXT_TOKENS) send
+      the files least relevant to the prompt in part or not at all, and leave them
+      unchanged (see `gpt_engineer.core.context_packing`).
     """
 
     """
@@ -625,22 +723,177 @@ def improve_existing_code(ai: AI, dbs: DBs):
         dbs.input, dbs.project_metadata
     )  # this has file names relative to the workspace path
 
-    messages = [
-        ai.fsystem(setup_sys_prompt_existing_code(dbs)),
-    ]
-    # Add files as input
-    for file_name, file_str in files_info.items():
-        code_input = format_file_to_input(file_name, file_str)
-        messages.append(ai.fuser(f"{code_input}"))
-
-    messages.append(ai.fuser(f"Request: {dbs.input['prompt']}"))
+    shards = _plan_improve_shards(ai, dbs, files_info)
+    if len(shards) > 1:
+        return _improve_in_shards(ai, dbs, files_info, shards)
 
+    messages, packed = _improve_messages(ai, dbs, files_info, shards[0])
+    _report_packing(dbs, [packed])
     messages = ai.next(messages, step_name=curr_fn())
 
-    overwrite_files(messages[-1].content.strip(), dbs)
+    overwrite_files(messages[-1].content.strip(), dbs, skip=packed.trimmed)
     return messages
 
 
+def _plan_improve_shards(ai: AI, dbs: DBs, files_info: Dict[str, str]) -> List[Shard]:
+    tokens = {
+        file_name: _improve_file_tokens(ai, file_name, file_str)
+        for file_name, file_str in files_info.items()
+    }
+    system = ai.fsystem(setup_sys_prompt_existing_code(dbs))
+    request = ai.fuser(f"Request: {dbs.input['prompt']}")
+    shard_tokens = shard_tokens_from_env()
+
+    def budget(notes: List[Message]) -> int:
+        # Shards are sized to fit the window as `_improve_messages` counts it, so that
+        # only GPTE_CONTEXT_TOKENS or files larger than the window make packing drop
+        # content
+        overhead = ai.num_tokens_from_messages([system, *notes, request])
+        available = prompt_budget(ai.model_name, limited=False) - overhead
+        return available if shard_tokens is None else min(shard_tokens, available)
+
+    shards = plan_shards(tokens, budget([]))
+    if len(shards) > 1:
+        # Sharded requests also list the other files, at most all of them
+        shards = plan_shards(tokens, budget([_shard_note(ai, sorted(files_info))]))
+    return shards
+
+
+def _improve_file_tokens(ai: AI, file_name: str, file_str: str) -> int:
+    # Every file is a message of its own, with 4 tokens of overhead
+    return ai.num_tokens(format_file_to_input(file_name, file_str)) + 4
+
+
+def _shard_note(ai: AI, others: List[str]) -> Message:
+    return ai.fuser(
+        "The other files of the codebase are improved in separate requests. "
+        "Do not modify them, edits to them are discarded:\n" + "\n".join(others)
+    )
+
+
+def _improve_messages(
+    ai: AI, dbs: DBs, files_info: Dict[str, str], shard: Shard, sharded: bool = False
+) -> Tuple[List[Message], PackedContext]:
+    system = ai.fsystem(setup_sys_prompt_existing_code(dbs))
+    request = ai.fuser(f"Request: {dbs.input['prompt']}")
+    notes: List[Message] = []
+    if sharded:
+        notes.append(_shard_note(ai, sorted(set(files_info) - set(shard.files))))
+    packed = pack_context(
+        {file_name: files_info[file_name] for file_name in shard.files},
+        dbs.input["prompt"],
+        prompt_budget(ai.model_name)
+        - ai.num_tokens_from_messages([system, *notes, request]),
+        lambda name, text: _improve_file_tokens(ai, name, text),
+    )
+
+    messages: List[Message] = [system]
+    # Add files as input, in a stable order so repeated requests share a prompt prefix
+    for file_name in shard.files:
+        if file_name in packed.files:
+            code_input = format_file_to_input(file_name, files_info[file_name])
+            messages.append(ai.fuser(f"{code_input}"))
+    for file_name, excerpt in sorted(packed.excerpts.items()):
+        code_input = format_file_to_input(file_name, excerpt)
+        messages.append(
+            ai.fuser(
+                f"Excerpt of {file_name}, with omitted lines marked by '...'. "
+                f"It is shown for reference only, do not return it:\n{code_input}"
+            )
+        )
+    if packed.dropped:
+        notes.append(
+            ai.fuser(
+                "These files of the codebase were left out to fit the context window, "
+                "do not return them:\n" + "\n".join(sorted(packed.dropped))
+            )
+        )
+    messages.extend(notes)
+    messages.append(request)
+    return messages, packed
+
+
+def _report_packing(dbs: DBs, packed: Sequence[PackedContext]) -> None:
+    # Records which files were not sent in full, if any
+    excerpts = sorted(name for p in packed for name in p.excerpts)
+    dropped = sorted(name for p in packed for name in p.dropped)
+    if not excerpts and not dropped:
+        return
+    dbs.memory["improve_context.json"] = json.dumps(
+        {"excerpts": excerpts, "dropped": dropped}, indent=2
+    )
+    print(
+        colored(
+            f"To fit the context window, {len(excerpts)} file(s) were sent in part and "
+            f"{len(dropped)} left out; they will not be modified: "
+            + ", ".join(excerpts + dropped),
+            "yellow",
+        )
+    )
+
+
+def _improve_in_shards(
+    ai: AI, dbs: DBs, files_info: Dict[str, str], shards: List[Shard]
+) -> List[Message]:
+    requests = [
+        _improve_messages(ai, dbs, files_info, shard, sharded=True) for shard in shards
+    ]
+    _report_packing(dbs, [packed for _, packed in requests])
+
+    def improve_shard(messages: List[Message]) -> List[Message]:
+        return ai.next(messages, step_name=improve_existing_code.__name__)
+
+    with ThreadPoolExecutor(max_workers=improve_workers_from_env()) as pool:
+        # Each request runs in a copy of this context, so its spans nest under the step
+        futures = [
+            pool.submit(copy_context().run, improve_shard, messages)
+            for messages, _ in requests
+        ]
+        conversations = [future.result() for future in futures]
+    return _merge_shard_edits(
+        dbs, files_info, shards, conversations, [packed for _, packed in requests]
+    )
+
+
+def _merge_shard_edits(
+    dbs: DBs,
+    files_info: Dict[str, str],
+    shards: List[Shard],
+    conversations: Sequence[List[Message]],
+    packed: Sequence[PackedContext],
+) -> List[Message]:
+    chats = [messages[-1].content.strip() for messages in conversations]
+    dbs.memory["all_output_overwrite.txt"] = "\n\n".join(chats)
+    merged = merge_edits(
+        files_info,
+        [parse_chat(chat) for chat in chats],
+        [set(shard.files) for shard in shards],
+    )
+    if merged.conflicts:
+        dbs.memory["improve_conflicts.json"] = json.dumps(merged.conflicts, indent=2)
+        for file_name, shard_ids in merged.conflicts.items():
+            print(
+                colored(
+                    f"Shards {shard_ids} made overlapping edits to {file_name}, "
+                    "keeping the edit of the first shard.",
+                    "yellow",
+                )
+            )
+    if merged.dropped:
+        dbs.memory["improve_dropped.json"] = json.dumps(merged.dropped, indent=2)
+        for file_name, shard_ids in merged.dropped.items():
+            print(
+                colored(
+                    f"Shards {shard_ids} edited {file_name} without being sent it, "
+                    "dropping their edits.",
+                    "yellow",
+                )
+            )
+    trimmed = set().union(*(p.trimmed for p in packed))
+    apply_file_edits(list(merged.files.items()), dbs, skip=trimmed)
+    return [message for messages in conversations for message in messages]
+
+
 def human_review(ai: AI, dbs: DBs):
     """
     Collects human feedback on the code and stores it in memory.
@@ -672,6 +925,136 @@ def human_review(ai: AI, dbs: DBs):
     return []
 
 
+async def alite_gen(ai: AI, dbs: DBs) -> List[Message]:
+    """
+    Asynchronous variant of `lite_gen`, awaiting the model instead of blocking on it.
+    """
+    files, callbacks = stream_files(dbs)
+    messages = await ai.astart(
+        dbs.input["prompt"],
+        dbs.preprompts["file_format"],
+        step_name=lite_gen.__name__,
+        callbacks=callbacks,
+    )
+    files.finish(messages[-1].content.strip())
+    return messages
+
+
+async def asimple_gen(ai: AI, dbs: DBs) -> List[Message]:
+    """
+    Asynchronous variant of `simple_gen`, awaiting the model instead of blocking on it.
+    """
+    files, callbacks = stream_files(dbs)
+    messages = await ai.astart(
+        setup_sys_prompt(dbs),
+        dbs.input["prompt"],
+        step_name=simple_gen.__name__,
+        callbacks=callbacks,
+    )
+    files.finish(messages[-1].content.strip())
+    return messages
+
+
+async def agen_entrypoint(ai: AI, dbs: DBs) -> List[dict]:
+    """
+    Asynchronous variant of `gen_entrypoint`, awaiting the model instead of blocking on it.
+    """
+    messages = await ai.astart(
+        system=ENTRYPOINT_SYSTEM_PROMPT,
+        user="Information about the codebase:\n\n" + dbs.workspace["all_output.txt"],
+        step_name=gen_entrypoint.__name__,
+    )
+    dbs.workspace["run.sh"] = _extract_entrypoint(messages[-1].content)
+    return messages
+
+
+async def aimprove_existing_code(ai: AI, dbs: DBs) -> List[Message]:
+    """
+    Asynchronous variant of `improve_existing_code`, awaiting the shard requests.
+    """
+    files_info = get_code_strings(dbs.input, dbs.project_metadata)
+    shards = _plan_improve_shards(ai, dbs, files_info)
+    sharded = len(shards) > 1
+    requests = [
+        _improve_messages(ai, dbs, files_info, shard, sharded=sharded) for shard in shards
+    ]
+    packed = [packed for _, packed in requests]
+    _report_packing(dbs, packed)
+    semaphore = asyncio.Semaphore(improve_workers_from_env())
+
+    async def improve_shard(messages: List[Message]) -> List[Message]:
+        async with semaphore:
+            return await ai.anext(messages, step_name=improve_existing_code.__name__)
+
+    conversations = await asyncio.gather(
+        *(improve_shard(messages) for messages, _ in requests)
+    )
+    if not sharded:
+        chat = conversations[0][-1].content.strip()
+        overwrite_files(chat, dbs, skip=packed[0].trimmed)
+        return conversations[0]
+    return _merge_shard_edits(dbs, files_info, shards, conversations, packed)
+
+
+ASYNC_STEPS = {
+    lite_gen: alite_gen,
+    simple_gen: asimple_gen,
+    gen_entrypoint: agen_entrypoint,
+    improve_existing_code: aimprove_existing_code,
+}
+"""
+Maps steps to their asynchronous variants.
+
+The async step runner awaits the variant when one exists and runs every other step
+in a worker thread, so pure generation pipelines never tie up a thread per request.
+"""
+
+
+STEP_IO = {
+    lite_gen: StepIO(reads=("input/prompt", "preprompts"), writes=("workspace",)),
+    simple_gen: StepIO(reads=("input/prompt", "preprompts"), writes=("workspace",)),
+    clarify: StepIO(
+        reads=("input/prompt", "preprompts", "logs/clarify"), writes=(CONSOLE,)
+    ),
+    gen_clarified_code: StepIO(
+        reads=("logs/clarify", "preprompts"), writes=("workspace",)
+    ),
+    gen_entrypoint: StepIO(
+        reads=("workspace/all_output.txt",), writes=("workspace/run.sh",)
+    ),
+    execute_entrypoint: StepIO(reads=("workspace",), writes=(CONSOLE,)),
+    use_feedback: StepIO(
+        reads=("input", "preprompts", "workspace/all_output.txt"),
+        writes=("workspace",),
+    ),
+    set_improve_filelist: StepIO(reads=("input",), writes=("project_metadata", CONSOLE)),
+    get_improve_prompt: StepIO(
+        reads=("project_metadata",), writes=("input/prompt", CONSOLE)
+    ),
+    improve_existing_code: StepIO(
+        reads=("input", "project_metadata", "preprompts"),
+        writes=(
+            "workspace",
+            "memory/all_output_overwrite.txt",
+            "memory/LAST_MODIFICATION_README.md",
+            "memory/improve_conflicts.json",
+            "memory/improve_dropped.json",
+            "memory/improve_context.json",
+        ),
+    ),
+    human_review: StepIO(writes=("memory/review", CONSOLE)),
+}
+"""
+The databases and files each step reads and writes.
+
+The step runner builds a dependency graph from these declarations and runs steps that
+do not depend on each other concurrently (see `gpt_engineer.core.scheduler`). Steps
+that prompt the user or print to the terminal declare the console, which keeps them
+in order. Steps without an entry, like the `assert_files_ready` check that has to pass
+before anything else runs, are never run concurrently with other steps.
+"""
+
+
 class Config(str, Enum):
     """
     Enumeration representing different configuration modes for the code processing system.
@@ -0,0 +1,612 @@
+"""
+Tracing of where the time of a run goes.
+
+A run is recorded as a tree of spans: one per step, per chat completion (with the
+network request, retries and the latency of the first streamed token), per parse of a
+chat into files, and per archive or flush of the databases. Spans carry attributes
+such as the token counts and cost of a completion, and the time spent reading and
+writing databases is added up on the span of the step doing it.
+
+Finished spans are handed to exporters: `JsonLinesExporter` appends them to a file,
+one JSON object per line, and `OTLPExporter` sends them in batches to an OpenTelemetry
+collector using OTLP/HTTP with JSON encoding, so they show up in Jaeger, Tempo or any
+other OTLP backend without the OpenTelemetry SDK installed. Without exporters, tracing
+is off and opening a span costs little more than a function call.
+
+The current span is kept in a context variable. Steps running in a thread pool are
+started in a copy of the caller's context, so their spans nest under the run.
+
+Classes:
+- Span: A timed operation with attributes and events.
+- SpanExporter: Base class of the destinations of finished spans.
+- JsonLinesExporter: Appends spans to a JSON lines file.
+- OTLPExporter: Sends spans to an OpenTelemetry collector over OTLP/HTTP.
+- Tracer: Creates spans and hands them to exporters when they end.
+
+Functions:
+- span: Opens a span on the current tracer, as a context manager.
+- current_span: Returns the innermost open span.
+- add_to_span: Adds to a numeric attribute of the innermost open span.
+- get_tracer: Returns the current tracer, configured through the environment.
+- set_tracer: Replaces the current tracer.
+
+Environment:
+- GPTE_TRACE_FILE: File that spans are appended to as JSON lines.
+- GPTE_OTLP_ENDPOINT: Base URL of an OTLP/HTTP collector, e.g. http://localhost:4318
+  (falls back to OTEL_EXPORTER_OTLP_ENDPOINT).
+- GPTE_SERVICE_NAME: The service name reported to the collector (default
+  "gpt-engineer").
+"""
+
+import atexit
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+AttributeValue = Union[str, int, float, bool]
+
+
+class Span:
+    """
+    A timed operation with attributes and events.
+
+    Attributes
+    ----------
+    name : str
+        The name of the operation, e.g. "step" or "llm.chat".
+    trace_id : str
+        The 32 hex digit id shared by all spans of a trace.
+    span_id : str
+        The 16 hex digit id of the span.
+    parent_id : Optional[str]
+        The id of the enclosing span, if any.
+    start_ns : int
+        The start in nanoseconds since the epoch.
+    end_ns : Optional[int]
+        The end in nanoseconds since the epoch, once the span ended.
+    attributes : Dict[str, AttributeValue]
+        The attributes of the span.
+    events : List[Tuple[int, str, Dict[str, AttributeValue]]]
+        The time, name and attributes of the events recorded in the span.
+    error : Optional[str]
+        The error the span ended with, if any.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "events",
+        "error",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        attributes: Optional[Dict[str, AttributeValue]] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, AttributeValue] = dict(attributes or {})
+        self.events: List[Tuple[int, str, Dict[str, AttributeValue]]] = []
+        self.error: Optional[str] = None
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    @property
+    def duration(self) -> float:
+        """
+        The duration in seconds, up to now if the span did not end yet.
+        """
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: AttributeValue) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: Union[int, float]) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount  # type: ignore
+
+    def add_event(self, name: str, **attributes: AttributeValue) -> None:
+        self.events.append((time.time_ns(), name, attributes))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Return the span as the JSON object written by `JsonLinesExporter`.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The ids, the start in seconds since the epoch, the duration in
+            milliseconds, the attributes, events and error of the span.
+        """
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_ns / 1e9,
+            "duration_ms": self.duration * 1000,
+            "attributes": self.attributes,
+            "events": [
+                {
+                    "name": name,
+                    "offset_ms": (at - self.start_ns) / 1e6,
+                    "attributes": attributes,
+                }
+                for at, name, attributes in self.events
+            ],
+            "error": self.error,
+        }
+
+
+class _NonRecordingSpan:
+    # Stands in for spans while tracing is off, so callers need no checks
+    recording = False
+    duration = 0.0
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        pass
+
+    def set_attributes(self, **attributes: AttributeValue) -> None:
+        pass
+
+    def add(self, key: str, amount: Union[int, float]) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes: AttributeValue) -> None:
+        pass
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanExporter(ABC):
+    """
+    Base class of the destinations of finished spans.
+
+    Methods
+    -------
+    export(spans):
+        Take finished spans.
+    flush():
+        Write out buffered spans.
+    close():
+        Flush and release the exporter.
+    """
+
+    @abstractmethod
+    def export(self, spans: Sequence[Span]) -> None:
+        ...
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class JsonLinesExporter(SpanExporter):
+    """
+    Appends every finished span to a file as a line of JSON.
+
+    Attributes
+    ----------
+    path : str
+        The file the spans are appended to.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = os.fspath(path)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def export(self, spans: Sequence[Span]) -> None:
+        lines = "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+        with self._lock:
+            self._file.write(lines)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class OTLPExporter(SpanExporter):
+    """
+    Sends spans to an OpenTelemetry collector over OTLP/HTTP with JSON encoding.
+
+    Spans are buffered and sent by a background thread every `interval` seconds, or
+    as soon as `batch_size` spans are waiting. Failing requests are logged and the
+    spans dropped, so an unavailable collector never fails a run.
+
+    Attributes
+    ----------
+    endpoint : str
+        The URL spans are posted to, e.g. http://localhost:4318/v1/traces.
+    service_name : str
+        The service name in the resource of the spans.
+    batch_size : int
+        The number of spans that triggers a send.
+    interval : float
+        The maximum number of seconds spans wait before they are sent.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        service_name: str = "gpt-engineer",
+        batch_size: int = 512,
+        interval: float = 5.0,
+        timeout: float = 10.0,
+    ):
+        """
+        Initialize the OTLPExporter class.
+
+        Parameters
+        ----------
+        endpoint : str
+            The base URL of the collector, e.g. http://localhost:4318, or the full URL
+            of its traces endpoint.
+        service_name : str, optional
+            The service name reported to the collector, by default "gpt-engineer".
+        batch_size : int, optional
+            The number of spans that triggers a send, by default 512.
+        interval : float, optional
+            The maximum number of seconds before buffered spans are sent, by default 5.
+        timeout : float, optional
+            The timeout of a request in seconds, by default 10.
+        """
+        endpoint = endpoint.rstrip("/")
+        if not endpoint.endswith("/v1/traces"):
+            endpoint += "/v1/traces"
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self._pending: List[Span] = []
+        self._closed = False
+        self._sending = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="gpte-otlp", daemon=True)
+        self._thread.start()
+
+    def export(self, spans: Sequence[Span]) -> None:
+        with self._cond:
+            self._pending.extend(spans)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self) -> None:
+        with self._cond:
+            spans, self._pending = self._pending, []
+            # Wait for a send in progress, so flush returns once all spans are out
+            self._cond.wait_for(lambda: not self._sending)
+        self._send(spans)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def payload(self, spans: Sequence[Span]) -> Dict[str, Any]:
+        """
+        Return the OTLP JSON request body for spans.
+
+        Parameters
+        ----------
+        spans : Sequence[Span]
+            The finished spans.
+
+        Returns
+        -------
+        Dict[str, Any]
+            An `ExportTraceServiceRequest` in the OTLP JSON encoding.
+        """
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _otlp_attributes(
+                            {"service.name": self.service_name}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "gpt_engineer"},
+                            "spans": [_otlp_span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or len(self._pending) >= self.batch_size,
+                    timeout=self.interval,
+                )
+                if self._closed:
+                    return
+                spans, self._pending = self._pending, []
+                self._sending += 1
+            try:
+                self._send(spans)
+            finally:
+                with self._cond:
+                    self._sending -= 1
+                    self._cond.notify_all()
+
+    def _send(self, spans: Sequence[Span]) -> None:
+        if not spans:
+            return
+        # Imported here, as the databases import this module and rarely export
+        import urllib.request
+
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(self.payload(spans)).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except Exception as e:
+            logger.warning(f"Dropped {len(spans)} spans, sending to {self.endpoint}: {e}")
+
+
+def _otlp_value(value: AttributeValue) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # 64 bit integers are strings in the JSON encoding
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, AttributeValue]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(val)} for key, val in attributes.items()]
+
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    kind = span.attributes.get("span.kind")
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        # 1 is SPAN_KIND_INTERNAL, 3 is SPAN_KIND_CLIENT
+        "kind": 3 if kind == "client" else 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(
+            {key: val for key, val in span.attributes.items() if key != "span.kind"}
+        ),
+        "events": [
+            {
+                "timeUnixNano": str(at),
+                "name": name,
+                "attributes": _otlp_attributes(attributes),
+            }
+            for at, name, attributes in span.events
+        ],
+        # 1 is STATUS_CODE_OK, 2 is STATUS_CODE_ERROR
+        "status": {"code": 2, "message": span.error}
+        if span.error is not None
+        else {"code": 1},
+    }
+    if span.parent_id is not None:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+class Tracer:
+    """
+    Creates spans and hands them to exporters when they end.
+
+    Attributes
+    ----------
+    exporters : List[SpanExporter]
+        The destinations of finished spans. Tracing is off without exporters.
+
+    Methods
+    -------
+    span(name, **attributes) -> ContextManager[Span]:
+        Open a span as a child of the current span.
+    flush():
+        Write out the spans buffered by the exporters.
+    close():
+        Flush and release the exporters.
+    """
+
+    def __init__(self, exporters: Sequence[SpanExporter] = ()):
+        self.exporters = list(exporters)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    @contextmanager
+    def span(self, name: str, **attributes: AttributeValue) -> Iterator[Any]:
+        """
+        Open a span as a child of the current span, ending it when the block exits.
+
+        Parameters
+        ----------
+        name : str
+            The name of the operation.
+        **attributes : AttributeValue
+            The initial attributes of the span.
+
+        Yields
+        ------
+        Span
+            The span, or a span that records nothing if tracing is off.
+        """
+        if not self.exporters:
+            yield NON_RECORDING_SPAN
+            return
+        parent = _current_span.get()
+        if parent is None:
+            span = Span(name, secrets.token_hex(16), None, attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            for exporter in self.exporters:
+                try:
+                    exporter.export([span])
+                except Exception:
+                    logger.exception(f"Failed to export span {span.name}")
+
+    def flush(self) -> None:
+        for exporter in self.exporters:
+            exporter.flush()
+
+    def close(self) -> None:
+        for exporter in self.exporters:
+            exporter.close()
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """
+    Return the current tracer, creating it from the environment on first use.
+
+    Returns
+    -------
+    Tracer
+        The tracer set with `set_tracer`, or one exporting to GPTE_TRACE_FILE and
+        GPTE_OTLP_ENDPOINT (tracing is off if neither is set).
+    """
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = _tracer_from_env()
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    """
+    Replace the current tracer, e.g. to collect the spans of a run in a test.
+
+    Parameters
+    ----------
+    tracer : Tracer
+        The new tracer.
+
+    Returns
+    -------
+    Tracer
+        The previous tracer.
+    """
+    global _tracer
+    previous = get_tracer()
+    _tracer = tracer
+    return previous
+
+
+def _tracer_from_env() -> Tracer:
+    exporters: List[SpanExporter] = []
+    path = os.getenv("GPTE_TRACE_FILE")
+    if path:
+        exporters.append(JsonLinesExporter(path))
+    endpoint = os.getenv("GPTE_OTLP_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if endpoint:
+        service_name = os.getenv("GPTE_SERVICE_NAME", "gpt-engineer")
+        exporters.append(OTLPExporter(endpoint, service_name=service_name))
+    tracer = Tracer(exporters)
+    if exporters:
+        atexit.register(tracer.close)
+    return tracer
+
+
+def span(name: str, **attributes: AttributeValue):
+    """
+    Open a span on the current tracer, as a context manager.
+
+    Parameters
+    ----------
+    name : str
+        The name of the operation.
+    **attributes : AttributeValue
+        The initial attributes of the span.
+
+    Returns
+    -------
+    ContextManager[Span]
+        The context manager yielding the span.
+    """
+    return get_tracer().span(name, **attributes)
+
+
+def current_span() -> Any:
+    """
+    Return the innermost open span, or a span that records nothing if there is none.
+    """
+    span = _current_span.get()
+    return NON_RECORDING_SPAN if span is None else span
+
+
+def add_to_span(key: str, amount: Union[int, float]) -> None:
+    """
+    Add to a numeric attribute of the innermost open span, if any.
+
+    Parameters
+    ----------
+    key : str
+        The attribute, e.g. "db.write_seconds".
+    amount : Union[int, float]
+        The amount to add.
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.add(key, amount)
@@ -1,73 +1,299 @@
-# list all folders in benchmark folder
-# for each folder, run the benchmark
+"""
+Run the benchmarks in `benchmark/` concurrently, then evaluate them one by one.
+
+By default every benchmark is generated by its own `gpt_engineer.cli.main` process.
+A pool of `--workers` processes runs at once, each killed after `--timeout` seconds,
+and progress is printed as benchmarks finish. With `--rate-limit`, all processes take
+their requests from one token bucket (see `gpt_engineer.core.rate_limit`), so that a
+wide pool spaces its requests out instead of running into the API's rate limit and
+backing off. The evaluation asks for a human review of every benchmark and stays
+sequential.
+
+With `--mode in-process`, the benchmarks run on threads of this process instead, with
+the databases of their folders (see `gpt_engineer.cli.main.run_project`): langchain,
+openai and tiktoken are imported once, and all benchmarks share the warm AI client and
+model catalog. The output of each benchmark still goes to its log file, but timeouts
+are only reported, as threads cannot be killed. `--mode compare` runs the generation
+in both modes and reports their wall time and startup overhead: the time a benchmark
+spends before its steps start, from the run span in subprocess mode and from setting
+up the run in process.
+
+Usage: python scripts/benchmark.py --workers 10 --timeout 900 --rate-limit 60
+"""
 import contextlib
+import io
 import json
 import os
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
+from enum import Enum
 from itertools import islice
 from pathlib import Path
-from typing import Iterable, Union
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
 
 from tabulate import tabulate
 from typer import run
 
+from gpt_engineer.cli.main import prepare_run, project_dbs, run_project, run_steps
+from gpt_engineer.core.steps import Config as StepsConfig
+
+
+class Mode(str, Enum):
+    SUBPROCESS = "subprocess"
+    IN_PROCESS = "in-process"
+    COMPARE = "compare"
+
+
+@dataclass
+class BenchmarkRun:
+    folder: Path
+    returncode: Optional[int]
+    seconds: float
+    timed_out: bool
+    startup_seconds: Optional[float] = None
+
+
+class ThreadStdout(io.TextIOBase):
+    """Standard output that threads can redirect to a file of their own."""
+
+    def __init__(self, stdout: TextIO):
+        self.stdout = stdout
+        self._local = threading.local()
+
+    def _target(self) -> TextIO:
+        return getattr(self._local, "file", None) or self.stdout
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    @contextlib.contextmanager
+    def redirect(self, file: TextIO) -> Iterator[None]:
+        self._local.file = file
+        try:
+            yield
+        finally:
+            self._local.file = None
+
+
+def run_span_seconds(trace_path: Path) -> Optional[float]:
+    if not trace_path.exists():
+        return None
+    for line in trace_path.read_text().splitlines():
+        span = json.loads(line)
+        if span["name"] == "run":
+            return span["duration_ms"] / 1000
+    return None
+
+
+def run_subprocess(
+    bench_folder: Path,
+    timeout: Optional[float],
+    stop: threading.Event,
+) -> BenchmarkRun:
+    log_path = bench_folder / "log.txt"
+    trace_path = bench_folder / "trace.jsonl"
+    trace_path.unlink(missing_ok=True)
+    start = time.perf_counter()
+    with open(log_path, "w") as log_file:
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-u",  # Unbuffered output
+                "-m",
+                "gpt_engineer.cli.main",
+                bench_folder,
+                "--steps",
+                "benchmark",
+            ],
+            stdout=log_file,
+            stderr=log_file,
+            bufsize=0,
+            # The run span tells the time spent in the steps from the startup
+            env=dict(os.environ, GPTE_TRACE_FILE=str(trace_path)),
+        )
+        timed_out = False
+        deadline = None if timeout is None else start + timeout
+        # Polled, so that an interrupted run stops its processes
+        while process.poll() is None:
+            if stop.is_set() or (deadline is not None and time.perf_counter() > deadline):
+                timed_out = not stop.is_set()
+                process.kill()
+                process.wait()
+                break
+            time.sleep(0.1)
+    seconds = time.perf_counter() - start
+    run_seconds = run_span_seconds(trace_path)
+    return BenchmarkRun(
+        bench_folder,
+        process.returncode,
+        seconds,
+        timed_out,
+        None if run_seconds is None else seconds - run_seconds,
+    )
+
+
+def run_in_process(
+    bench_folder: Path, timeout: Optional[float], stdout: ThreadStdout
+) -> BenchmarkRun:
+    start = time.perf_counter()
+    startup = None
+    with open(bench_folder / "log.txt", "w") as log_file, stdout.redirect(log_file):
+        try:
+            ai, dbs, steps = prepare_run(
+                steps_config=StepsConfig.BENCHMARK, dbs=project_dbs(bench_folder)
+            )
+            startup = time.perf_counter() - start
+            run_steps(ai, dbs, steps)
+            returncode = 0
+        except Exception:
+            traceback.print_exc(file=log_file)
+            returncode = 1
+    seconds = time.perf_counter() - start
+    timed_out = timeout is not None and seconds > timeout
+    return BenchmarkRun(bench_folder, returncode, seconds, timed_out, startup)
+
+
+def run_suite(
+    benchmarks: List[Path], mode: Mode, workers: int, timeout: Optional[float]
+) -> Tuple[List[BenchmarkRun], float]:
+    print(f"Running {len(benchmarks)} benchmarks {mode.value}, {workers} at a time")
+    for bench_folder in benchmarks:
+        print(f"tail -f {bench_folder / 'log.txt'}")
+    print()
+
+    start = time.perf_counter()
+    runs: List[BenchmarkRun] = []
+    stop = threading.Event()
+    stdout = ThreadStdout(sys.stdout)
+    with contextlib.redirect_stdout(stdout), ThreadPoolExecutor(workers) as pool:
+        if mode == Mode.IN_PROCESS:
+            futures = [
+                pool.submit(run_in_process, bench_folder, timeout, stdout)
+                for bench_folder in benchmarks
+            ]
+        else:
+            futures = [
+                pool.submit(run_subprocess, bench_folder, timeout, stop)
+                for bench_folder in benchmarks
+            ]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                runs.append(result)
+                status = (
+                    "timed out"
+                    if result.timed_out
+                    else f"finished with code {result.returncode}"
+                )
+                print(
+                    f"[{len(runs)}/{len(benchmarks)}] {result.folder.name} {status} "
+                    f"after {result.seconds:.1f}s"
+                )
+        except KeyboardInterrupt:
+            stop.set()
+            raise
+    seconds = time.perf_counter() - start
+    print(f"\nAll benchmarks ran in {seconds:.1f}s\n")
+    return runs, seconds
+
+
+def compare_report(suites: Dict[Mode, Tuple[List[BenchmarkRun], float]]) -> None:
+    rows = []
+    for mode, (runs, seconds) in suites.items():
+        startups = [r.startup_seconds for r in runs if r.startup_seconds is not None]
+        mean_startup = sum(startups) / len(startups) if startups else None
+        mean_seconds = sum(r.seconds for r in runs) / len(runs) if runs else 0.0
+        rows.append(
+            [
+                mode.value,
+                len(runs),
+                sum(r.returncode == 0 and not r.timed_out for r in runs),
+                f"{seconds:.1f}",
+                f"{mean_seconds:.2f}",
+                "" if mean_startup is None else f"{mean_startup:.2f}",
+                ""
+                if mean_startup is None or not mean_seconds
+                else f"{mean_startup / mean_seconds:.0%}",
+            ]
+        )
+    headers = [
+        "Mode",
+        "Benchmarks",
+        "Succeeded",
+        "Wall s",
+        "Mean s",
+        "Mean startup s",
+        "Startup share",
+    ]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
 
 def main(
     n_benchmarks: Union[int, None] = None,
+    workers: int = 4,
+    timeout: float = 1800,
+    rate_limit: float = 0,
+    evaluate: bool = True,
+    mode: Mode = Mode.SUBPROCESS,
 ):
     path = Path("benchmark")
 
-    folders: Iterable[Path] = path.iterdir()
+    folders: Iterable[Path] = sorted(path.iterdir())
 
     if n_benchmarks:
         folders = islice(folders, n_benchmarks)
 
-    benchmarks = []
-    results = []
-    for bench_folder in folders:
-        if os.path.isdir(bench_folder):
-            print(f"Running benchmark for {bench_folder}")
+    benchmarks = [folder for folder in folders if os.path.isdir(folder)]
 
-            log_path = bench_folder / "log.txt"
-            log_file = open(log_path, "w")
-            process = subprocess.Popen(
-                [
-                    "python",
-                    "-u",  # Unbuffered output
-                    "-m",
-                    "gpt_engineer.cli.main",
-                    bench_folder,
-                    "--steps",
-                    "benchmark",
-                ],
-                stdout=log_file,
-                stderr=log_file,
-                bufsize=0,
-            )
-            benchmarks.append(bench_folder)
-            results.append((process, log_file))
+    if rate_limit:
+        # One bucket for all benchmarks, shared with the processes through a file
+        state_dir = tempfile.mkdtemp(prefix="gpte-benchmark-")
+        os.environ["GPTE_RATE_LIMIT"] = str(rate_limit)
+        os.environ["GPTE_RATE_LIMIT_FILE"] = str(Path(state_dir) / "rate_limit.json")
 
-            print("You can stream the log file by running:")
-            print(f"tail -f {log_path}")
-            print()
+    if mode == Mode.COMPARE:
+        compare_report(
+            {
+                suite_mode: run_suite(benchmarks, suite_mode, workers, timeout or None)
+                for suite_mode in (Mode.SUBPROCESS, Mode.IN_PROCESS)
+            }
+        )
+        return
 
-    for bench_folder, (process, file) in zip(benchmarks, results):
-        process.wait()
-        file.close()
+    runs, _ = run_suite(benchmarks, mode, workers, timeout or None)
+
+    if not evaluate:
+        return
 
-        print("process", bench_folder.name, "finished with code", process.returncode)
-        print("Running it. Original benchmark prompt:")
+    for result in sorted(runs, key=lambda result: result.folder.name):
+        bench_folder = result.folder
+        if result.timed_out:
+            print("Skipping the evaluation of", bench_folder.name, "which timed out")
+            continue
+        print("Running", bench_folder.name, "Original benchmark prompt:")
         print()
         with open(bench_folder / "prompt") as f:
             print(f.read())
         print()
 
         with contextlib.suppress(KeyboardInterrupt):
+            if mode == Mode.IN_PROCESS:
+                run_project(bench_folder, StepsConfig.EVALUATE)
+                continue
             subprocess.run(
                 [
-                    "python",
+                    sys.executable,
                     "-m",
                     "gpt_engineer.cli.main",
                     bench_folder,
@@ -76,7 +302,9 @@ def main(
                 ],
             )
 
-    generate_report(benchmarks, path)
+    generate_report(
+        sorted(result.folder for result in runs if not result.timed_out), path
+    )
 
 
 def generate_report(benchmarks, benchmark_path):
@@ -0,0 +1,63 @@
+"""
+Measure the cost of constructing `AI` instances against a local stub OpenAI server.
+
+Runs the same number of constructions with a cold model catalog (invalidated before
+every construction, as every request used to behave) and with a warm one, and reports
+the model-catalog API calls and construction latency of both.
+
+Usage: python scripts/benchmark_ai_construction.py --n-constructions 50 --latency 0.05
+"""
+import os
+import statistics
+import time
+
+import openai
+
+from stub_openai_server import StubOpenAIServer
+from tabulate import tabulate
+from typer import run
+
+from gpt_engineer.core.ai import AI
+from gpt_engineer.core.model_catalog import default_catalog
+
+
+def construct(n: int, model: str, invalidate: bool) -> list:
+    latencies = []
+    for _ in range(n):
+        if invalidate:
+            default_catalog().invalidate()
+        start = time.perf_counter()
+        AI(model_name=model, temperature=0.1)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main(n_constructions: int = 20, latency: float = 0.05, model: str = "gpt-4"):
+    os.environ.pop("GPTE_MODEL_CATALOG_PATH", None)
+    with StubOpenAIServer(latency=latency) as server:
+        os.environ["OPENAI_API_BASE"] = openai.api_base = server.url
+        os.environ["OPENAI_API_KEY"] = openai.api_key = "sk-stub"
+
+        # Load the tokenizer once so that it does not count against the first run
+        AI(model_name=model)
+
+        rows = []
+        for label, invalidate in [("cold catalog", True), ("warm catalog", False)]:
+            server.calls.clear()
+            latencies = construct(n_constructions, model, invalidate)
+            rows.append(
+                [
+                    label,
+                    n_constructions,
+                    sum(server.calls.values()),
+                    f"{statistics.median(latencies) * 1000:.2f}",
+                    f"{max(latencies) * 1000:.2f}",
+                ]
+            )
+
+    headers = ["Mode", "Constructions", "Catalog calls", "p50 ms", "max ms"]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
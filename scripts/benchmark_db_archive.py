@@ -0,0 +1,142 @@
+"""
+Measure the memory and time spent on archiving databases with many files.
+
+Simulates a project with `n_files` files that is archived `n_archives` times, with
+`n_changed` files rewritten between archives, and compares three ways to archive:
+
+- reference: store the live dicts, as archiving used to (later writes leak into the
+  archived snapshots);
+- deepcopy: store deep copies of the dicts, the straightforward fix;
+- snapshot: store copy-on-write snapshots, as `archive` does now.
+
+Memory is the growth of the traced heap over the run, measured with tracemalloc.
+
+Usage: python scripts/benchmark_db_archive.py --n-files 5000 --n-archives 50
+"""
+import copy
+import datetime
+import time
+import tracemalloc
+
+from typing import Callable
+
+from tabulate import tabulate
+from typer import run
+
+from gpt_engineer.core.db import DB, DBs
+
+
+def live_files(db: DB) -> dict:
+    return db.backend.data[db.backend.identifier]
+
+
+def reference_archive(dbs: DBs, timestamp: str) -> None:
+    dbs.archive[timestamp] = {
+        "memory": live_files(dbs.memory),
+        "workspace": live_files(dbs.workspace),
+    }
+
+
+def deepcopy_archive(dbs: DBs, timestamp: str) -> None:
+    dbs.archive[timestamp] = {
+        "memory": copy.deepcopy(live_files(dbs.memory)),
+        "workspace": copy.deepcopy(live_files(dbs.workspace)),
+    }
+
+
+def snapshot_archive(dbs: DBs, timestamp: str) -> None:
+    # What `archive` does, under the simulated timestamp
+    dbs.archive[timestamp] = {
+        "memory": dbs.memory.snapshot(),
+        "workspace": dbs.workspace.snapshot(),
+    }
+
+
+def make_dbs(n_files: int, file_kb: int) -> DBs:
+    body: dict = {}
+    dbs = DBs(
+        **{
+            name: DB(data=body, identifier=name)
+            for name in [
+                "memory",
+                "logs",
+                "preprompts",
+                "input",
+                "workspace",
+                "archive",
+                "project_metadata",
+            ]
+        }
+    )
+    for i in range(n_files):
+        dbs.workspace[f"src/file_{i}.py"] = f"# file {i}\n" + "x" * (file_kb * 1024)
+    dbs.memory["all_output.txt"] = "output"
+    return dbs
+
+
+def run_archives(
+    archive_fn: Callable[[DBs, str], None],
+    dbs: DBs,
+    n_archives: int,
+    n_changed: int,
+    file_kb: int,
+):
+    start = datetime.datetime(2023, 1, 1)
+    archive_time = 0.0
+    for i in range(n_archives):
+        timestamp = (start + datetime.timedelta(seconds=i)).strftime("%Y%m%d_%H%M%S")
+        begin = time.perf_counter()
+        archive_fn(dbs, timestamp)
+        archive_time += time.perf_counter() - begin
+        for j in range(n_changed):
+            dbs.workspace[f"src/file_{j}.py"] = f"# rev {i}\n" + "y" * (file_kb * 1024)
+    return archive_time
+
+
+def snapshots_intact(dbs: DBs) -> bool:
+    first = next(iter(live_files(dbs.archive).values()))
+    return first["workspace"]["src/file_0.py"].startswith("# file 0")
+
+
+def main(
+    n_files: int = 5000,
+    file_kb: int = 4,
+    n_archives: int = 50,
+    n_changed: int = 20,
+):
+    rows = []
+    for label, archive_fn in [
+        ("reference", reference_archive),
+        ("deepcopy", deepcopy_archive),
+        ("snapshot", snapshot_archive),
+    ]:
+        dbs = make_dbs(n_files, file_kb)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        archive_time = run_archives(archive_fn, dbs, n_archives, n_changed, file_kb)
+        growth = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        rows.append(
+            [
+                label,
+                n_files,
+                n_archives,
+                f"{growth / 2**20:.1f}",
+                f"{archive_time / n_archives * 1000:.3f}",
+                "yes" if snapshots_intact(dbs) else "no",
+            ]
+        )
+
+    headers = [
+        "Archive",
+        "Files",
+        "Archives",
+        "Heap growth MB",
+        "ms per archive",
+        "Snapshots intact",
+    ]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,87 @@
+"""
+Measure read, write and scan throughput of the `DB` storage backends.
+
+Writes `n_files` files of about `file_kb` kilobytes to each backend in a temporary
+directory, then reads them back in random order and scans all of them with `items`,
+as `get_code_strings` and `archive` do. Backends are given in the `GPTE_DB_BACKENDS`
+spec format, with the directory of the benchmark as their location.
+
+Usage: python scripts/benchmark_db_backends.py --n-files 10000 --file-kb 2
+"""
+import random
+import tempfile
+import time
+
+from pathlib import Path
+from typing import List
+
+from tabulate import tabulate
+from typer import run
+
+from gpt_engineer.core.db import DB
+from gpt_engineer.core.db_backends import open_backend
+
+SPECS = {
+    "dict": "dict",
+    "directory": "directory:{tmp}",
+    "sqlite": "sqlite:{tmp}/dbs.sqlite",
+    "pack": "pack:{tmp}",
+}
+
+
+def throughput(n: int, elapsed: float) -> str:
+    return f"{n / elapsed:,.0f}"
+
+
+def main(
+    n_files: int = 10000,
+    file_kb: int = 2,
+    backends: List[str] = list(SPECS),
+    seed: int = 0,
+):
+    rng = random.Random(seed)
+    names = [f"src/pkg_{i % 100}/module_{i}.py" for i in range(n_files)]
+    contents = [f"# {name}\n" + "x" * (file_kb * 1024) for name in names]
+    order = rng.sample(range(n_files), n_files)
+
+    rows = []
+    for label in backends:
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = open_backend(SPECS[label].format(tmp=tmp), "workspace")
+            db = DB({}, "workspace") if backend is None else DB(backend=backend)
+
+            start = time.perf_counter()
+            for name, content in zip(names, contents):
+                db[name] = content
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in order:
+                assert db[names[i]] == contents[i]
+            read_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            scanned = sum(len(content) for _, content in db.items())
+            scan_time = time.perf_counter() - start
+            assert scanned == sum(len(content) for content in contents)
+
+            size = sum(f.stat().st_size for f in Path(tmp).rglob("*") if f.is_file())
+            db.backend.close()
+
+        rows.append(
+            [
+                label,
+                n_files,
+                throughput(n_files, write_time),
+                throughput(n_files, read_time),
+                throughput(n_files, scan_time),
+                f"{size / 2**20:.1f}",
+            ]
+        )
+
+    headers = ["Backend", "Files", "Writes/s", "Reads/s", "Scanned files/s", "Disk MB"]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,84 @@
+"""
+Guard the cold-start import budget of gpt-engineer entry points.
+
+Each module is imported in a fresh interpreter with `python -X importtime`, and the
+cumulative import time of the module is compared against its budget. The process
+exits with a non-zero status if any median exceeds its budget, so the script can be
+used as a CI check.
+
+Usage: python scripts/benchmark_import_time.py --runs 5
+"""
+import statistics
+import subprocess
+import sys
+
+from typing import Dict, List
+
+from tabulate import tabulate
+from typer import Exit, run
+
+# Cumulative import time budgets in milliseconds
+BUDGETS: Dict[str, float] = {
+    # used by evals/ scripts that only need parse_chat
+    "gpt_engineer.core.chat_to_files": 150.0,
+    "gpt_engineer.core.db": 100.0,
+    # the CLI needs langchain, openai and tiktoken, which dominate its cold start
+    "gpt_engineer.cli.main": 5000.0,
+}
+
+HEAVY_DEPENDENCIES = ["langchain", "openai", "tiktoken"]
+
+
+def import_time_ms(module: str) -> float:
+    """Return the cumulative import time of `module` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def heavy_dependencies(module: str) -> List[str]:
+    """Return the heavy dependencies that importing `module` pulls in."""
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_DEPENDENCIES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def main(runs: int = 5):
+    rows = []
+    over_budget = []
+    for module, budget in BUDGETS.items():
+        median = statistics.median(import_time_ms(module) for _ in range(runs))
+        if median > budget:
+            over_budget.append(module)
+        rows.append(
+            [
+                module,
+                f"{median:.1f}",
+                f"{budget:.0f}",
+                ", ".join(heavy_dependencies(module)) or "-",
+                "ok" if median <= budget else "OVER BUDGET",
+            ]
+        )
+
+    headers = ["Module", "Median ms", "Budget ms", "Heavy imports", "Status"]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+    if over_budget:
+        raise Exit(code=1)
+
+
+if __name__ == "__main__":
+    run(main)
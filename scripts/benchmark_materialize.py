@@ -0,0 +1,123 @@
+"""
+Measure how long making a generated workspace runnable on disk takes.
+
+Writes `n_files` files of about `file_kb` kilobytes, as the steps of a run do, and
+compares getting them into a directory by:
+
+- directory: writing every file synchronously through a directory-backed DB;
+- materialize: writing to the request body and materializing the workspace in bulk
+  once the run is done, with one and with `workers` threads;
+- write-behind: writing to the request body while a background thread flushes the
+  files, waiting for the flush at the end of the run;
+- rematerialize: materializing again after `n_changed` files were rewritten.
+
+"In run" is the time spent writing files during the run, "total" includes the final
+flush. Every strategy writes into a new directory `repeat` times and the best run is
+reported, as file creation times vary a lot while the file system warms up.
+
+Usage: python scripts/benchmark_materialize.py --n-files 2000 --file-kb 4
+"""
+import tempfile
+import time
+
+from pathlib import Path
+from typing import List, Tuple
+
+from tabulate import tabulate
+from typer import run
+
+from gpt_engineer.core.db import DB
+from gpt_engineer.core.materialize import Materializer, WriteBehindBackend
+
+Files = List[Tuple[str, str]]
+
+
+def make_files(n_files: int, file_kb: int) -> Files:
+    return [
+        (f"src/pkg_{i % 20}/module_{i}.py", f"# module {i}\n" + "x" * (file_kb * 1024))
+        for i in range(n_files)
+    ]
+
+
+def write_all(db: DB, files: Files) -> float:
+    start = time.perf_counter()
+    for key, val in files:
+        db[key] = val
+    return time.perf_counter() - start
+
+
+def directory(target: Path, files: Files, workers: int, fsync: bool):
+    in_run = write_all(DB(target), files)
+    return in_run, in_run
+
+
+def materialize(target: Path, files: Files, workers: int, fsync: bool):
+    db = DB({}, "workspace")
+    in_run = write_all(db, files)
+    start = time.perf_counter()
+    Materializer(target, workers=workers, fsync=fsync).flush(db)
+    return in_run, in_run + time.perf_counter() - start
+
+
+def write_behind(target: Path, files: Files, workers: int, fsync: bool):
+    db = DB({}, "workspace")
+    db.backend = WriteBehindBackend(
+        db.backend, Materializer(target, workers=workers, fsync=fsync)
+    )
+    start = time.perf_counter()
+    in_run = write_all(db, files)
+    db.flush()
+    total = time.perf_counter() - start
+    db.backend.close()
+    return in_run, total
+
+
+def rematerialize(target: Path, files: Files, workers: int, fsync: bool, n_changed: int):
+    db = DB({}, "workspace")
+    write_all(db, files)
+    materializer = Materializer(target, workers=workers, fsync=fsync)
+    materializer.flush(db)
+    in_run = write_all(db, [(key, val + "\n# changed") for key, val in files[:n_changed]])
+    start = time.perf_counter()
+    stats = materializer.flush(db)
+    assert stats.written == n_changed
+    return in_run, in_run + time.perf_counter() - start
+
+
+def main(
+    n_files: int = 2000,
+    file_kb: int = 4,
+    workers: int = 4,
+    n_changed: int = 20,
+    fsync: bool = False,
+    repeat: int = 5,
+):
+    files = make_files(n_files, file_kb)
+    strategies = [
+        ("directory", directory, 1),
+        ("materialize, 1 thread", materialize, 1),
+        (f"materialize, {workers} threads", materialize, workers),
+        ("write-behind", write_behind, workers),
+        (
+            f"rematerialize, {n_changed} changed",
+            lambda *args: rematerialize(*args, n_changed=n_changed),
+            workers,
+        ),
+    ]
+
+    results = {label: [] for label, *_ in strategies}
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(repeat):
+            for label, strategy, n_workers in strategies:
+                target = Path(tmp) / f"{i}-{len(results[label])}-{label}"
+                results[label].append(strategy(target, files, n_workers, fsync))
+
+    rows = []
+    for label, timings in results.items():
+        in_run, total = min(timings, key=lambda timing: timing[1])
+        rows.append([label, f"{in_run * 1000:.1f}", f"{total * 1000:.1f}"])
+    print(tabulate(rows, ["Strategy", "In run ms", "Total ms"], tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,97 @@
+"""
+Measure `parse_chat` on large synthetic multi-file completions.
+
+Builds a chat of about `size_kb` kilobytes made of files in the format the models are
+prompted for (a file name line followed by a fenced code block), checks that the
+single-pass parser returns the same files as the previous regex-based implementation,
+and times both, as well as feeding the chat to the parser in streamed tokens.
+
+Usage: python scripts/benchmark_parse_chat.py --size-kb 1024 --file-kb 16
+"""
+import random
+import re
+import string
+import time
+
+from typing import Callable, List, Tuple
+
+from tabulate import tabulate
+from typer import run
+
+from gpt_engineer.core.chat_to_files import ChatParser, parse_chat
+
+
+def regex_parse_chat(chat) -> List[Tuple[str, str]]:
+    """The regex-based `parse_chat` this benchmark compares against."""
+    regex = r"(\S+)\n\s*```[^\n]*\n(.+?)```"
+    files = []
+    for match in re.finditer(regex, chat, re.DOTALL):
+        path = re.sub(r'[\:<>"|?*]', "", match.group(1))
+        path = re.sub(r"^\[(.*)\]$", r"\1", path)
+        path = re.sub(r"^`(.*)`$", r"\1", path)
+        path = re.sub(r"[\]\:]$", "", path)
+        files.append((path, match.group(2)))
+    files.append(("README.md", chat.split("```")[0]))
+    return files
+
+
+def streamed_parse_chat(chat: str, token_size: int = 16) -> List[Tuple[str, str]]:
+    parser = ChatParser()
+    files = []
+    for i in range(0, len(chat), token_size):
+        files += parser.feed(chat[i : i + token_size])
+    return files + parser.close() + [("README.md", parser.readme)]
+
+
+def random_chat(size_kb: int, file_kb: int, rng: random.Random) -> str:
+    words = ["def", "return", "class", "self", "import", "for", "in", "if", "=", "("]
+    parts = ["Here is the implementation of the requested program.\n\n"]
+    size = 0
+    n_files = 0
+    while size < size_kb * 1024:
+        lines = []
+        file_size = 0
+        while file_size < file_kb * 1024:
+            ident = "".join(rng.choice(string.ascii_lowercase) for _ in range(8))
+            line = f"    {rng.choice(words)} {ident}_{rng.randint(0, 999)}"
+            lines.append(line)
+            file_size += len(line) + 1
+        code = "\n".join(lines)
+        parts.append(f"src/module_{n_files}.py\n```python\n{code}\n```\n\n")
+        size += file_size
+        n_files += 1
+    return "".join(parts)
+
+
+def time_parser(parse: Callable, chat: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(chat)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(size_kb: int = 1024, file_kb: int = 16, repeat: int = 5, seed: int = 0):
+    chat = random_chat(size_kb, file_kb, random.Random(seed))
+    expected = regex_parse_chat(chat)
+    assert parse_chat(chat) == expected, "single-pass parser disagrees with the regex"
+    assert streamed_parse_chat(chat) == expected, "streamed parser disagrees"
+
+    rows = []
+    for label, parse in [
+        ("regex", regex_parse_chat),
+        ("single pass", parse_chat),
+        ("single pass, 16 char tokens", streamed_parse_chat),
+    ]:
+        elapsed = time_parser(parse, chat, repeat)
+        rows.append(
+            [label, len(chat) // 1024, len(expected) - 1, f"{elapsed * 1000:.2f}"]
+        )
+
+    headers = ["Parser", "Chat KB", "Files", "Best ms"]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
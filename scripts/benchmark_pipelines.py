@@ -0,0 +1,228 @@
+"""
+Measure the latency, throughput and memory of the step pipelines, without network.
+
+Runs the DEFAULT, LITE, IMPROVE_CODE and EVAL_NEW_CODE step configurations on fresh
+projects against a local stub of the OpenAI API (see `stub_openai_server.py`), which
+replays recorded completions at a configurable time to first token and token rate.
+For every configuration, the p50 and p95 latency of a run are reported, along with
+the harness overhead (the latency less the time the stub spent answering), runs and
+chat requests per second, and the RSS of the process, so that regressions in
+gpt-engineer's own overhead show up separately from model latency.
+
+The completions are those of `--recording`, a JSON object with a "generate",
+"entrypoint" and "improve" completion, or synthetic ones of `--n-files` generated
+files. Improve requests are answered with the files they were sent, edited. The
+projects run headless: every question to the user is answered with "n", so no
+generated code is executed.
+
+Nothing is fetched from the network, except for tiktoken's encoding if it is not in
+its cache yet (see TIKTOKEN_CACHE_DIR).
+
+Usage: python scripts/benchmark_pipelines.py --n-runs 20 --tokens-per-second 200
+"""
+import builtins
+import contextlib
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import openai
+
+from stub_openai_server import StubOpenAIServer
+from tabulate import tabulate
+from typer import run
+
+from gpt_engineer.cli.main import run_project
+from gpt_engineer.core.chat_to_files import parse_chat
+from gpt_engineer.core.steps import ENTRYPOINT_SYSTEM_PROMPT, Config as StepsConfig
+
+CONFIGS = [
+    StepsConfig.DEFAULT,
+    StepsConfig.LITE,
+    StepsConfig.IMPROVE_CODE,
+    StepsConfig.EVAL_NEW_CODE,
+]
+IMPROVE_PREPROMPT = (
+    Path(__file__).parent.parent / "gpt_engineer" / "preprompts" / "improve"
+).read_text()
+
+
+def synthetic_recording(n_files: int, n_lines: int) -> Dict[str, str]:
+    files = []
+    for i in range(n_files):
+        body = "\n".join(
+            f"    value_{j} = compute_{j}(value_{j - 1})" for j in range(n_lines)
+        )
+        files.append(f"module_{i}.py\n```python\ndef run_{i}():\n{body}\n```")
+    return {
+        "generate": "The core modules are the following.\n\n" + "\n\n".join(files),
+        "entrypoint": "```sh\npython module_0.py\n```",
+    }
+
+
+def improve_completion(messages: List[dict]) -> str:
+    # The files of the request, each with a line added
+    files = []
+    for message in messages[1:]:
+        lines = message["content"].strip().splitlines()
+        fences = [i for i, line in enumerate(lines) if line.strip() == "```"]
+        if len(fences) >= 2:
+            start, end = fences[0], fences[-1]
+            # The first line of a file is indented along with its name, see
+            # format_file_to_input
+            body = "\n".join(lines[start + 1 : end])[4:]
+            files.append(f"{lines[start - 1].strip()}\n```\n# improved\n{body}\n```")
+    return "Improved the files.\n\n" + "\n\n".join(files)
+
+
+def replay(recording: Dict[str, str]):
+    def completion(messages: List[dict]) -> str:
+        system = messages[0]["content"]
+        if system.startswith(ENTRYPOINT_SYSTEM_PROMPT):
+            return recording["entrypoint"]
+        if system.startswith(IMPROVE_PREPROMPT.split("FILE_FORMAT")[0]):
+            return recording.get("improve") or improve_completion(messages)
+        return recording["generate"]
+
+    return completion
+
+
+def setup_project(path: Path, config: StepsConfig, recording: Dict[str, str]) -> None:
+    path.mkdir(parents=True)
+    if config != StepsConfig.IMPROVE_CODE:
+        (path / "prompt").write_text("Make a calculator app")
+        return
+    (path / "prompt").write_text("Add type annotations")
+    file_list = []
+    for name, content in parse_chat(recording["generate"])[:-1]:
+        (path / name).write_text(content)
+        file_list.append(str(path / name))
+    (path / ".gpteng").mkdir()
+    (path / ".gpteng" / "file_list.txt").write_text("\n".join(file_list))
+
+
+def rss_mb() -> float:
+    with contextlib.suppress(OSError):
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    # The peak RSS, in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def run_config(
+    config: StepsConfig,
+    root: Path,
+    recording: Dict[str, str],
+    server: StubOpenAIServer,
+    n_runs: int,
+    concurrency: int,
+) -> list:
+    def one_run(i: int) -> float:
+        project = root / f"{config.value}_{i}"
+        setup_project(project, config, recording)
+        start = time.perf_counter()
+        if config == StepsConfig.IMPROVE_CODE:
+            run_project(project, improve_mode=True, temperature=0)
+        else:
+            run_project(project, config, temperature=0)
+        return time.perf_counter() - start
+
+    requests_before = server.calls["chat.completions"]
+    busy_before = server.busy_seconds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(one_run, range(n_runs)))
+    seconds = time.perf_counter() - start
+    requests = server.calls["chat.completions"] - requests_before
+    # The stub's time per run, to tell the harness overhead from the model latency
+    model_seconds = (server.busy_seconds - busy_before) / n_runs
+    overheads = [latency - model_seconds for latency in latencies]
+    quantiles = statistics.quantiles(latencies, n=20) if n_runs > 1 else latencies * 19
+    return [
+        config.value,
+        n_runs,
+        f"{1000 * statistics.median(latencies):.0f}",
+        f"{1000 * quantiles[18]:.0f}",
+        f"{1000 * statistics.median(overheads):.0f}",
+        f"{n_runs / seconds:.2f}",
+        f"{requests / seconds:.2f}",
+        f"{rss_mb():.0f}",
+    ]
+
+
+def main(
+    n_runs: int = 10,
+    concurrency: int = 1,
+    latency: float = 0.2,
+    tokens_per_second: float = 0.0,
+    recording: Optional[str] = None,
+    n_files: int = 3,
+    n_lines: int = 40,
+    model: str = "gpt-4",
+    configs: str = ",".join(config.value for config in CONFIGS),
+):
+    completions = (
+        json.loads(Path(recording).read_text())
+        if recording
+        else synthetic_recording(n_files, n_lines)
+    )
+    with StubOpenAIServer(
+        latency=latency,
+        completion=replay(completions),
+        tokens_per_second=tokens_per_second,
+    ) as server, tempfile.TemporaryDirectory() as root:
+        # OPENAI_API_BASE would select the Azure API, so only the client points at the stub
+        os.environ.pop("OPENAI_API_BASE", None)
+        os.environ["OPENAI_API_KEY"] = openai.api_key = "sk-stub"
+        os.environ["OPENAI_API_DEPLOYMENT"] = model
+        openai.api_base = server.url
+
+        rows = []
+        cwd = os.getcwd()
+        # Headless: the consent file is written to the temporary directory, and every
+        # question, including whether to execute the generated code, is answered "n"
+        os.chdir(root)
+        ask = builtins.input
+        builtins.input = lambda *args: "n"
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                for name in configs.split(","):
+                    rows.append(
+                        run_config(
+                            StepsConfig(name.strip()),
+                            Path(root),
+                            completions,
+                            server,
+                            n_runs,
+                            concurrency,
+                        )
+                    )
+        finally:
+            builtins.input = ask
+            os.chdir(cwd)
+
+    headers = [
+        "Config",
+        "Runs",
+        "p50 ms",
+        "p95 ms",
+        "Overhead p50 ms",
+        "Runs/s",
+        "Requests/s",
+        "RSS MB",
+    ]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,127 @@
+"""
+Stress the memory use of many concurrent runs with large outputs in one process.
+
+Simulates `n_projects` concurrent runs with dict-backed databases, each writing an
+`all_output.txt` and logs of about `output_kb` kilobytes and a workspace of `n_files`
+files of `file_kb` kilobytes, then reading the workspace back (as executing or
+archiving it does). The request bodies are kept until all runs are done, as a
+service holds them until they are returned.
+
+Every configuration runs in a fresh process, and reports the peak resident set size
+of that process and the wall time, with spilling disabled and with a budget.
+
+Usage: python scripts/benchmark_spill.py --n-projects 32 --budget-mb 64
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from tabulate import tabulate
+from typer import run
+
+
+def run_project(i: int, n_files: int, file_kb: int, output_kb: int) -> dict:
+    from gpt_engineer.core.db import DB
+
+    body: dict = {}
+    memory = DB(body, "memory")
+    logs = DB(body, "logs")
+    workspace = DB(body, "workspace")
+    files = []
+    for j in range(n_files):
+        content = f"# project {i} file {j}\n" + "x" * (file_kb << 10)
+        workspace[f"src/file_{j}.py"] = content
+        files.append(f"src/file_{j}.py\n```\n{content}\n```")
+    memory["all_output.txt"] = "\n".join(files) + "y" * (output_kb << 10)
+    logs["gen_code"] = "z" * (output_kb << 10)
+    size = sum(len(content) for _, content in workspace.items())
+    assert size >= n_files * (file_kb << 10)
+    return body
+
+
+def measure(config: dict, queue) -> None:
+    if config["budget_mb"] is not None:
+        os.environ["GPTE_SPILL_BUDGET_MB"] = str(config["budget_mb"])
+        os.environ["GPTE_SPILL_THRESHOLD_KB"] = str(config["threshold_kb"])
+    from gpt_engineer.core.spill import spill_store_from_env
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=config["workers"]) as pool:
+        bodies = list(
+            pool.map(
+                lambda i: run_project(
+                    i, config["n_files"], config["file_kb"], config["output_kb"]
+                ),
+                range(config["n_projects"]),
+            )
+        )
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+    store = spill_store_from_env()
+    queue.put(
+        (
+            peak_mb,
+            elapsed,
+            len(bodies),
+            store.spills if store else 0,
+            store.disk_bytes / (1 << 20) if store else 0.0,
+        )
+    )
+
+
+def main(
+    n_projects: int = 32,
+    n_files: int = 50,
+    file_kb: int = 64,
+    output_kb: int = 1024,
+    workers: int = 8,
+    budget_mb: float = 64,
+    threshold_kb: float = 16,
+):
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for label, budget in [("no spilling", None), (f"{budget_mb:g} MB budget", budget_mb)]:
+        config = dict(
+            n_projects=n_projects,
+            n_files=n_files,
+            file_kb=file_kb,
+            output_kb=output_kb,
+            workers=workers,
+            budget_mb=budget,
+            threshold_kb=threshold_kb,
+        )
+        queue = context.Queue()
+        process = context.Process(target=measure, args=(config, queue))
+        process.start()
+        peak_mb, elapsed, n_bodies, spills, disk_mb = queue.get()
+        process.join()
+        rows.append(
+            [
+                label,
+                n_bodies,
+                f"{peak_mb:.0f}",
+                spills,
+                f"{disk_mb:.0f}",
+                f"{elapsed:.2f}",
+            ]
+        )
+
+    headers = [
+        "Mode",
+        "Projects",
+        "Peak RSS MB",
+        "Spilled values",
+        "On disk MB",
+        "Seconds",
+    ]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
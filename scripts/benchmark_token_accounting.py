@@ -0,0 +1,82 @@
+"""
+Measure the cost of token accounting over long conversations with large file payloads.
+
+Builds a conversation of `n_turns` user/assistant exchanges, where every user message
+carries `file_kb` kilobytes of source code, and times `AI.update_token_usage_log` for
+each turn, once with a fresh tokenizer on every turn (the old behaviour) and once with
+the cached `TokenCounter`.
+
+Usage: python scripts/benchmark_token_accounting.py --n-turns 50 --file-kb 32
+"""
+import random
+import string
+import time
+
+from tabulate import tabulate
+from typer import run
+
+from gpt_engineer.core.ai import AI, TokenCounter, get_tokenizer
+
+
+def random_code(n_bytes: int, rng: random.Random) -> str:
+    words = ["def", "return", "class", "self", "import", "for", "in", "if", "=", "("]
+    lines = []
+    size = 0
+    while size < n_bytes:
+        ident = "".join(rng.choice(string.ascii_lowercase) for _ in range(8))
+        line = f"    {rng.choice(words)} {ident}_{rng.randint(0, 999)}"
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def accounting_ai(model: str, counter: TokenCounter) -> AI:
+    ai = AI.__new__(AI)
+    ai.model_name = model
+    ai.token_counter = counter
+    ai.reset_token_usage()
+    return ai
+
+
+def time_conversation(ai: AI, turns: list, cached: bool) -> float:
+    messages = [ai.fsystem("You are a helpful programming assistant.")]
+    elapsed = 0.0
+    for question, answer in turns:
+        messages.append(ai.fuser(question))
+        if not cached:
+            ai.token_counter = TokenCounter(ai.tokenizer)
+        start = time.perf_counter()
+        ai.update_token_usage_log(messages, answer, step_name="benchmark")
+        elapsed += time.perf_counter() - start
+        messages.append(ai.fassistant(answer))
+    return elapsed
+
+
+def main(n_turns: int = 50, file_kb: int = 32, model: str = "gpt-4", seed: int = 0):
+    rng = random.Random(seed)
+    turns = [
+        (random_code(file_kb * 1024, rng), random_code(file_kb * 256, rng))
+        for _ in range(n_turns)
+    ]
+    tokenizer = get_tokenizer(model)
+
+    rows = []
+    for label, cached in [("re-encode history", False), ("cached counts", True)]:
+        ai = accounting_ai(model, TokenCounter(tokenizer))
+        elapsed = time_conversation(ai, turns, cached)
+        rows.append(
+            [
+                label,
+                n_turns,
+                ai.cumulative_total_tokens,
+                f"{elapsed * 1000:.1f}",
+                f"{elapsed / n_turns * 1000:.2f}",
+            ]
+        )
+
+    headers = ["Mode", "Turns", "Tokens accounted", "Total ms", "ms per turn"]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
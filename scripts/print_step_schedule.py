@@ -0,0 +1,102 @@
+"""
+Print the dependency graph and critical path of the steps of every config.
+
+Each step is replaced by a stand-in with the same name and declared resources that
+sleeps for a nominal latency (`--llm-seconds` for steps calling the model,
+`--local-seconds` for the others), and the config is run through the step scheduler.
+The table compares the sequential latency with the scheduled wall time and the
+critical path the scheduler reports.
+
+Usage: python scripts/print_step_schedule.py --llm-seconds 0.2 --local-seconds 0.02
+"""
+import time
+
+from tabulate import tabulate
+from typer import run
+
+from gpt_engineer.core.db import DB, DBs
+from gpt_engineer.core.scheduler import CONSOLE, build_dag, run_dag
+from gpt_engineer.core.steps import STEP_IO, STEPS
+
+LLM_STEPS = {
+    "lite_gen",
+    "simple_gen",
+    "clarify",
+    "gen_clarified_code",
+    "gen_entrypoint",
+    "use_feedback",
+    "improve_existing_code",
+}
+
+
+def stand_in(step, seconds: float):
+    def sleep(ai, dbs):
+        time.sleep(seconds)
+        return []
+
+    sleep.__name__ = step.__name__
+    return sleep
+
+
+def make_dbs() -> DBs:
+    body: dict = {}
+    return DBs(
+        **{
+            name: DB(body, name)
+            for name in [
+                "memory",
+                "logs",
+                "preprompts",
+                "input",
+                "workspace",
+                "archive",
+                "project_metadata",
+            ]
+        }
+    )
+
+
+def main(llm_seconds: float = 0.2, local_seconds: float = 0.02):
+    rows = []
+    for config, steps in STEPS.items():
+        stand_ins = []
+        io = {}
+        for step in steps:
+            seconds = llm_seconds if step.__name__ in LLM_STEPS else local_seconds
+            stand_ins.append(stand_in(step, seconds))
+            if step in STEP_IO:
+                io[stand_ins[-1]] = STEP_IO[step]
+        deps = build_dag(stand_ins, io)
+        trace = run_dag(None, make_dbs(), stand_ins, io)
+        sequential = sum(timing.duration for timing in trace.steps)
+        rows.append(
+            [
+                config.value,
+                " ".join(
+                    f"{step.__name__}<{','.join(str(k) for k in sorted(dep))}>"
+                    if dep
+                    else step.__name__
+                    for step, dep in zip(steps, deps)
+                ),
+                sum(CONSOLE in io[step].writes for step in stand_ins if step in io),
+                f"{sequential:.2f}",
+                f"{trace.wall_seconds:.2f}",
+                " > ".join(trace.critical_path),
+                f"{trace.critical_path_seconds:.2f}",
+            ]
+        )
+
+    headers = [
+        "Config",
+        "Steps<deps>",
+        "Console steps",
+        "Sequential s",
+        "Scheduled s",
+        "Critical path",
+        "Critical path s",
+    ]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,185 @@
+"""
+A minimal local stand-in for the OpenAI HTTP API, used by the benchmark scripts.
+
+The server answers the model endpoints with a fixed catalog and counts every request
+per path, so benchmarks can assert how many network round trips gpt-engineer makes
+without touching the real API. Chat completions are answered by a `completion`
+function of the request's messages, streamed as server-sent events at
+`tokens_per_second` after `latency`, the time to the first token, like the real API
+does; the time the server spends answering is summed up in `busy_seconds`.
+"""
+import json
+import re
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+DEFAULT_MODELS = ["gpt-4", "gpt-3.5-turbo", "gpt-3.5-turbo-16k"]
+
+# Pieces of a completion streamed as one token each: a word and the space after it
+_TOKEN = re.compile(r"\S+\s*|\s+")
+
+
+def count_tokens(text: str) -> int:
+    return len(_TOKEN.findall(text))
+
+
+class StubOpenAIServer:
+    """Serve a fake OpenAI API on localhost until `stop` is called."""
+
+    def __init__(
+        self,
+        models: Optional[List[str]] = None,
+        latency: float = 0.0,
+        port: int = 0,
+        completion: Optional[Callable[[List[dict]], str]] = None,
+        tokens_per_second: float = 0.0,
+    ):
+        self.models = models or list(DEFAULT_MODELS)
+        self.latency = latency
+        self.completion = completion or (lambda messages: "Nothing to clarify")
+        self.tokens_per_second = tokens_per_second
+        self.calls: Counter = Counter()
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def count(self, path: str, seconds: float = 0.0) -> None:
+        with self._lock:
+            self.calls[path] += 1
+            self.busy_seconds += seconds
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = self.path.split("?")[0].rstrip("/")
+                if server.latency:
+                    time.sleep(server.latency)
+                if path == "/v1/models":
+                    server.count("models.list")
+                    data = [
+                        {"id": m, "object": "model", "owned_by": "stub"}
+                        for m in server.models
+                    ]
+                    self.send_json(200, {"object": "list", "data": data})
+                elif path.startswith("/v1/models/"):
+                    server.count("models.retrieve")
+                    model = path[len("/v1/models/") :]
+                    if model in server.models:
+                        self.send_json(200, {"id": model, "object": "model"})
+                    else:
+                        error = {"message": f"The model `{model}` does not exist"}
+                        self.send_json(404, {"error": {**error, "type": "invalid"}})
+                else:
+                    self.send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                # Also serves the deployments of the Azure API
+                if not self.path.split("?")[0].endswith("/chat/completions"):
+                    self.send_json(404, {"error": {"message": "not found"}})
+                    return
+                start = time.perf_counter()
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                messages = request["messages"]
+                text = server.completion(messages)
+                usage = {
+                    "prompt_tokens": sum(count_tokens(m["content"]) for m in messages),
+                    "completion_tokens": count_tokens(text),
+                }
+                usage["total_tokens"] = (
+                    usage["prompt_tokens"] + usage["completion_tokens"]
+                )
+                if server.latency:
+                    time.sleep(server.latency)
+                if request.get("stream"):
+                    self.stream(request, text, usage)
+                else:
+                    self.send_json(
+                        200,
+                        {
+                            "id": "chatcmpl-stub",
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": request["model"],
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "message": {"role": "assistant", "content": text},
+                                    "finish_reason": "stop",
+                                }
+                            ],
+                            "usage": usage,
+                        },
+                    )
+                server.count("chat.completions", time.perf_counter() - start)
+
+            def stream(self, request: dict, text: str, usage: dict) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+
+                def event(choices: list, **extra) -> None:
+                    chunk = {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request["model"],
+                        "choices": choices,
+                        **extra,
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                def delta(content: dict, finish_reason=None) -> list:
+                    return [
+                        {"index": 0, "delta": content, "finish_reason": finish_reason}
+                    ]
+
+                event(delta({"role": "assistant", "content": ""}))
+                for token in _TOKEN.findall(text):
+                    if server.tokens_per_second:
+                        time.sleep(1 / server.tokens_per_second)
+                    event(delta({"content": token}))
+                event(delta({}, "stop"))
+                if request.get("stream_options", {}).get("include_usage"):
+                    event([], usage=usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,92 @@
+"""
+Summarize where the time of traced runs went.
+
+Reads the spans written to GPTE_TRACE_FILE and prints, per operation, how often it
+ran, its total, mean and 95th percentile duration, and its self time: the time not
+spent in nested spans. Steps are grouped by step name and completions by model, so
+e.g. the network time of the completions of `gen_code` and the time spent writing
+the workspace show up as separate rows.
+
+Usage: python scripts/summarize_trace.py trace.jsonl --sort self
+"""
+import json
+
+from collections import defaultdict
+from typing import Dict, List
+
+from tabulate import tabulate
+from typer import run
+
+
+def operation(span: dict) -> str:
+    attributes = span["attributes"]
+    if span["name"] == "step":
+        return f"step {attributes.get('step.name')}"
+    if span["name"] in ("llm.chat", "llm.request") and "llm.model" in attributes:
+        return f"{span['name']} {attributes['llm.model']}"
+    return span["name"]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main(path: str, sort: str = "total"):
+    spans = [json.loads(line) for line in open(path, encoding="utf-8") if line.strip()]
+    children_ms: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        if span["parent_id"] is not None:
+            children_ms[span["parent_id"]] += span["duration_ms"]
+
+    durations: Dict[str, List[float]] = defaultdict(list)
+    self_ms: Dict[str, float] = defaultdict(float)
+    tokens: Dict[str, int] = defaultdict(int)
+    cost: Dict[str, float] = defaultdict(float)
+    db_ms: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        name = operation(span)
+        attributes = span["attributes"]
+        durations[name].append(span["duration_ms"])
+        self_ms[name] += max(0.0, span["duration_ms"] - children_ms[span["span_id"]])
+        if span["name"] == "llm.chat":
+            tokens[name] += attributes.get("llm.prompt_tokens", 0)
+            tokens[name] += attributes.get("llm.completion_tokens", 0)
+            cost[name] += attributes.get("llm.cost_usd", 0.0)
+        db_ms[name] += 1000 * (
+            attributes.get("db.read_seconds", 0.0)
+            + attributes.get("db.write_seconds", 0.0)
+        )
+
+    rows = [
+        [
+            name,
+            len(values),
+            f"{sum(values):.1f}",
+            f"{sum(values) / len(values):.1f}",
+            f"{percentile(values, 0.95):.1f}",
+            f"{self_ms[name]:.1f}",
+            f"{db_ms[name]:.1f}",
+            tokens[name] or "",
+            f"{cost[name]:.4f}" if cost[name] else "",
+        ]
+        for name, values in durations.items()
+    ]
+    column = {"total": 2, "mean": 3, "p95": 4, "self": 5, "db": 6}[sort]
+    rows.sort(key=lambda row: -float(row[column]))
+    headers = [
+        "Operation",
+        "Count",
+        "Total ms",
+        "Mean ms",
+        "p95 ms",
+        "Self ms",
+        "DB I/O ms",
+        "Tokens",
+        "Cost $",
+    ]
+    print(tabulate(rows, headers, tablefmt="pipe"))
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,59 @@
+from typing import Optional
+
+import pytest
+
+from gpt_engineer.core.ai import AI, TokenCounter
+from gpt_engineer.core.db import DB, DBs
+
+DB_NAMES = [
+    "memory",
+    "logs",
+    "preprompts",
+    "input",
+    "workspace",
+    "archive",
+    "project_metadata",
+]
+
+
+class WordTokenizer:
+    def encode(self, txt):
+        return txt.split()
+
+
+@pytest.fixture
+def make_dbs():
+    # In-memory DBs, all stored in `body`
+    def make(body: Optional[dict] = None, improve_mode: bool = False) -> DBs:
+        body = {} if body is None else body
+        dbs = {name: DB(body, name) for name in DB_NAMES}
+        if improve_mode:
+            # In improve mode, the input is the project being improved
+            dbs["input"] = DB(body, "workspace")
+        return DBs(**dbs)
+
+    return make
+
+
+@pytest.fixture
+def tokenizer():
+    # Counts words as tokens, without loading tiktoken
+    return WordTokenizer()
+
+
+@pytest.fixture
+def make_ai():
+    # An AI around `llm` that counts words as tokens, without API access
+    def make(
+        llm=None, model_name: str = "gpt-4", temperature: float = 0.1, azure_endpoint=""
+    ) -> AI:
+        ai = AI.__new__(AI)
+        ai.model_name = model_name
+        ai.temperature = temperature
+        ai.azure_endpoint = azure_endpoint
+        ai.llm = object() if llm is None else llm
+        ai.token_counter = TokenCounter(WordTokenizer())
+        ai.reset_token_usage()
+        return ai
+
+    return make
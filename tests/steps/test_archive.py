@@ -1,4 +1,5 @@
 import datetime
+import json
 import os
 
 from unittest.mock import MagicMock
@@ -59,3 +60,16 @@ def test_archive(tmp_path, monkeypatch):
     assert not os.path.exists(tmp_path / "workspace")
     assert os.path.isdir(tmp_path / "archive" / "20201225_170555")
     assert os.path.isdir(tmp_path / "archive" / "20220814_080512")
+
+
+def test_archive_snapshots_in_memory_dbs(monkeypatch, make_dbs):
+    body = {}
+    dbs = make_dbs(body)
+    dbs.workspace["main.py"] = "v1"
+    freeze_at(monkeypatch, datetime.datetime(2020, 12, 25, 17, 5, 55))
+    archive(dbs)
+    dbs.workspace["main.py"] = "v2"
+
+    assert body["archive"]["20201225_170555"]["workspace"] == {"main.py": "v1"}
+    assert body["workspace"] == {"main.py": "v2"}
+    json.dumps(body)
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import threading
+
+from langchain.schema import AIMessage
+
+from gpt_engineer.core.steps import STEP_IO, aimprove_existing_code, improve_existing_code
+
+
+class ImprovingChatModel:
+    # Answers with every file of the prompt, its first line replaced
+    def __init__(self, barrier=None):
+        self.barrier = barrier
+        self.requests = []
+
+    def answer(self, messages):
+        self.requests.append(list(messages))
+        files = []
+        for message in messages[1:]:
+            lines = [line.strip() for line in message.content.strip().splitlines()]
+            if "```" in lines:
+                start = lines.index("```")
+                name, body = lines[start - 1], "\n".join(lines[start + 1 : -1])
+                files.append(f"{name}\n```\n# improved {name}\n{body}\n```")
+        return AIMessage(content="\n\n".join(files))
+
+    def __call__(self, messages, callbacks=None):
+        if self.barrier is not None:
+            self.barrier.wait()
+        return self.answer(messages)
+
+    async def apredict_messages(self, messages, callbacks=None):
+        await asyncio.sleep(0.01)
+        return self.answer(messages)
+
+
+def make_project(make_dbs, n_files):
+    dbs = make_dbs(improve_mode=True)
+    dbs.preprompts["improve"] = "improve FILE_FORMAT"
+    dbs.preprompts["file_format"] = "format"
+    dbs.preprompts["philosophy"] = "philosophy"
+    dbs.input["prompt"] = "improve everything"
+    names = [f"file_{i}.py" for i in range(n_files)]
+    for name in names:
+        dbs.workspace[name] = f"first line\n{' '.join(['word'] * 50)}\n"
+    dbs.project_metadata["file_list.txt"] = "\n".join(names)
+    return dbs, names
+
+
+def test_large_selections_are_improved_in_concurrent_shards(
+    monkeypatch, make_ai, make_dbs
+):
+    monkeypatch.setenv("GPTE_IMPROVE_SHARD_TOKENS", "60")
+    dbs, names = make_project(make_dbs, 4)
+    # Every file makes a shard of its own, and all shards are in flight at once
+    llm = ImprovingChatModel(barrier=threading.Barrier(4, timeout=5))
+    ai = make_ai(llm)
+
+    messages = improve_existing_code(ai, dbs)
+
+    assert len(llm.requests) == 4
+    # Every shard is told which files the other shards improve
+    for request in llm.requests:
+        sent = request[1].content.strip().splitlines()[0]
+        others = request[-2].content.splitlines()[1:]
+        assert others == [name for name in names if name != sent]
+    assert len(messages) == sum(len(request) + 1 for request in llm.requests)
+    for name in names:
+        assert dbs.workspace[name].startswith(f"# improved {name}\n")
+    assert "improve_conflicts.json" not in dbs.memory
+    assert len(ai.token_usage_log) == 4
+
+
+def test_small_selections_make_a_single_request(monkeypatch, make_ai, make_dbs):
+    monkeypatch.setenv("GPTE_IMPROVE_SHARD_TOKENS", "10000")
+    dbs, names = make_project(make_dbs, 4)
+    llm = ImprovingChatModel()
+
+    asyncio.run(aimprove_existing_code(make_ai(llm), dbs))
+
+    [request] = llm.requests
+    assert [m.content for m in request[-1:]] == ["Request: improve everything"]
+    assert all(dbs.workspace[name].startswith("# improved") for name in names)
+
+
+def test_selections_that_fit_the_window_are_not_sharded(monkeypatch, make_ai, make_dbs):
+    monkeypatch.delenv("GPTE_IMPROVE_SHARD_TOKENS", raising=False)
+    dbs, names = make_project(make_dbs, 4)
+    llm = ImprovingChatModel()
+
+    improve_existing_code(make_ai(llm), dbs)
+
+    assert len(llm.requests) == 1
+    assert all(dbs.workspace[name].startswith("# improved") for name in names)
+
+
+def test_async_shards(monkeypatch, make_ai, make_dbs):
+    monkeypatch.setenv("GPTE_IMPROVE_SHARD_TOKENS", "60")
+    dbs, names = make_project(make_dbs, 3)
+    llm = ImprovingChatModel()
+
+    asyncio.run(aimprove_existing_code(make_ai(llm), dbs))
+
+    assert len(llm.requests) == 3
+    assert all(dbs.workspace[name].startswith("# improved") for name in names)
+
+
+def test_requests_over_the_context_budget_leave_trimmed_files_unchanged(
+    monkeypatch, make_ai, make_dbs
+):
+    monkeypatch.setenv("GPTE_IMPROVE_SHARD_TOKENS", "10000")
+    monkeypatch.setenv("GPTE_CONTEXT_TOKENS", "60")
+    dbs, names = make_project(make_dbs, 2)
+    dbs.workspace["file_0.py"] = "def snake():\n    return 'snake'\n"
+    dbs.input["prompt"] = "make the snake faster"
+    llm = ImprovingChatModel()
+
+    improve_existing_code(make_ai(llm), dbs)
+
+    [request] = llm.requests
+    assert "Excerpt of file_1.py" in request[-2].content
+    assert dbs.workspace["file_0.py"].startswith("# improved file_0.py\n")
+    # The model returned the excerpt, which must not overwrite the file
+    assert dbs.workspace["file_1.py"].startswith("first line\n")
+    assert json.loads(dbs.memory["improve_context.json"]) == {
+        "excerpts": ["file_1.py"],
+        "dropped": [],
+    }
+
+
+def test_shards_that_fit_the_window_are_sent_in_full(monkeypatch, make_ai, make_dbs):
+    monkeypatch.delenv("GPTE_IMPROVE_SHARD_TOKENS", raising=False)
+    monkeypatch.delenv("GPTE_CONTEXT_TOKENS", raising=False)
+    monkeypatch.setenv("GPTE_CONTEXT_WINDOW", "1000")
+    monkeypatch.setenv("GPTE_COMPLETION_TOKENS", "0")
+    dbs, names = make_project(make_dbs, 40)
+    llm = ImprovingChatModel()
+
+    improve_existing_code(make_ai(llm), dbs)
+
+    assert len(llm.requests) > 1
+    # Every file fits the window, so none is sent in part or left out
+    assert "improve_context.json" not in dbs.memory
+    assert all(dbs.workspace[name].startswith("# improved") for name in names)
+
+
+def test_shard_reports_are_declared_writes(monkeypatch, make_ai, make_dbs):
+    class OverreachingChatModel(ImprovingChatModel):
+        # Every shard also edits file_0.py, which only the first shard is sent
+        def answer(self, messages):
+            answer = super().answer(messages)
+            return AIMessage(content=answer.content + "\n\nfile_0.py\n```\nx = 1\n```")
+
+    monkeypatch.setenv("GPTE_IMPROVE_SHARD_TOKENS", "60")
+    dbs, names = make_project(make_dbs, 3)
+
+    improve_existing_code(make_ai(OverreachingChatModel()), dbs)
+
+    assert json.loads(dbs.memory["improve_dropped.json"]) == {"file_0.py": [1, 2]}
+    writes = STEP_IO[improve_existing_code].writes
+    assert all(f"memory/{name}" in writes for name in dbs.memory)
@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+from gpt_engineer.core.steps import setup_sys_prompt, setup_sys_prompt_existing_code
+
+
+def fake_dbs(**overrides):
+    preprompts = {
+        "roadmap": "roadmap\n",
+        "generate": "generate FILE_FORMAT\n",
+        "improve": "improve FILE_FORMAT\n",
+        "file_format": "format",
+        "philosophy": "philosophy",
+    }
+    preprompts.update(overrides)
+    return SimpleNamespace(preprompts=preprompts)
+
+
+def test_sys_prompt_is_shared_between_requests():
+    first = setup_sys_prompt(fake_dbs())
+    second = setup_sys_prompt(fake_dbs())
+
+    assert first == "roadmap\ngenerate format\n\nUseful to know:\nphilosophy"
+    assert first is second
+    assert setup_sys_prompt_existing_code(fake_dbs()) is setup_sys_prompt_existing_code(
+        fake_dbs()
+    )
+
+
+def test_sys_prompt_follows_preprompt_changes():
+    assert "new philosophy" in setup_sys_prompt(fake_dbs(philosophy="new philosophy"))
+    assert setup_sys_prompt_existing_code(fake_dbs(file_format="json")).startswith(
+        "improve json"
+    )
@@ -0,0 +1,116 @@
+import threading
+
+from gpt_engineer.core.ai import TokenUsage
+from gpt_engineer.core.ai_pool import AIPool
+
+
+def test_pool_reuses_templates(make_ai):
+    pool = AIPool(factory=make_ai)
+
+    first = pool.get("gpt-4", 0.1)
+    second = pool.get("gpt-4", 0.1)
+    other = pool.get("gpt-4", 0.0)
+
+    assert first is not second
+    assert first.llm is second.llm
+    assert first.llm is not other.llm
+    metrics = pool.metrics()
+    assert (metrics.size, metrics.hits, metrics.misses) == (2, 1, 2)
+
+
+def test_forks_have_isolated_token_usage(make_ai):
+    pool = AIPool(factory=make_ai)
+    first = pool.get()
+    second = pool.get()
+
+    first.cumulative_total_tokens = 10
+    first.token_usage_log.append(TokenUsage("step", 1, 2, 3, 1, 2, 3))
+
+    assert second.cumulative_total_tokens == 0
+    assert second.token_usage_log == []
+
+
+def test_pool_evicts_least_recently_used(make_ai):
+    pool = AIPool(max_size=2, factory=make_ai)
+    pool.get("a")
+    pool.get("b")
+    pool.get("a")
+    pool.get("c")
+
+    pool.get("a")
+    assert pool.metrics().misses == 3
+    pool.get("b")
+    assert pool.metrics().misses == 4
+
+
+def test_concurrent_gets_construct_once(make_ai):
+    constructed = []
+
+    def factory(**kwargs):
+        constructed.append(kwargs)
+        return make_ai(**kwargs)
+
+    pool = AIPool(factory=factory)
+    threads = [threading.Thread(target=pool.get) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(constructed) == 1
+    assert pool.metrics().hits == 19
+
+
+def test_miss_does_not_block_other_keys(make_ai):
+    started, release = threading.Event(), threading.Event()
+
+    def factory(**kwargs):
+        if kwargs["model_name"] == "slow":
+            started.set()
+            release.wait(5)
+        return make_ai(**kwargs)
+
+    pool = AIPool(factory=factory)
+    pool.get("fast")
+    slow = threading.Thread(target=pool.get, args=("slow",))
+    slow.start()
+    started.wait(5)
+
+    # A hit on another key while "slow" is being constructed
+    assert pool.get("fast").model_name == "fast"
+    release.set()
+    slow.join()
+    assert pool.metrics().misses == 2
+
+
+def test_failed_construction_is_retried(make_ai):
+    calls = []
+
+    def factory(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise RuntimeError("no models")
+        return make_ai(**kwargs)
+
+    pool = AIPool(factory=factory)
+    try:
+        pool.get()
+    except RuntimeError:
+        pass
+    assert pool.get().model_name == "gpt-4"
+    assert len(calls) == 2
+
+
+def test_endpoint_is_passed_through(make_ai):
+    constructed = []
+
+    def factory(**kwargs):
+        constructed.append(kwargs["azure_endpoint"])
+        return make_ai(**kwargs)
+
+    pool = AIPool(factory=factory)
+    pool.get("gpt-4", 0.1, azure_endpoint=None)
+    pool.get("gpt-4", 0.1, azure_endpoint="")
+
+    # None skips the model fallback that "" does, so they are different templates
+    assert constructed == [None, ""]
@@ -1,6 +1,13 @@
+import random
+import re
 import textwrap
 
-from gpt_engineer.core.chat_to_files import to_files
+from gpt_engineer.core.chat_to_files import (
+    ChatFileStream,
+    ChatParser,
+    parse_chat,
+    to_files,
+)
 
 
 def test_to_files():
@@ -198,3 +205,156 @@ def test_files_with_newline_between_header():
 
     for file_name, file_content in expected_files.items():
         assert workspace[file_name] == file_content
+
+
+STREAMED_CHAT = textwrap.dedent(
+    """
+    This is a sample program.
+
+    [file1.py]
+    ```python
+    print("Hello, World!")
+    ```
+
+    `file2.py`:
+    ```python
+    def add(a, b):
+        return a + b
+    ```
+    """
+)
+
+
+def test_stream_writes_files_as_their_blocks_close():
+    workspace = {}
+    files = ChatFileStream(workspace)
+    closing = STREAMED_CHAT.index("```\n\n") + 4
+
+    for char in STREAMED_CHAT[:closing]:
+        files.feed(char)
+
+    assert workspace == {"file1.py": 'print("Hello, World!")\n'}
+
+
+def test_stream_matches_to_files():
+    expected = {}
+    to_files(STREAMED_CHAT.strip(), expected)
+
+    rng = random.Random(0)
+    for _ in range(20):
+        workspace = {}
+        streamed = []
+        files = ChatFileStream(workspace, on_file=lambda name, _: streamed.append(name))
+        pos = 0
+        while pos < len(STREAMED_CHAT):
+            size = rng.randint(1, 8)
+            files.feed(STREAMED_CHAT[pos : pos + size])
+            pos += size
+        files.finish(STREAMED_CHAT.strip())
+
+        assert streamed == ["file1.py", "file2.py"]
+        assert workspace == expected
+
+
+def test_stream_finish_writes_files_that_were_not_streamed():
+    workspace = {}
+    ChatFileStream(workspace).finish(STREAMED_CHAT)
+
+    assert set(workspace) == {"all_output.txt", "file1.py", "file2.py", "README.md"}
+
+
+NESTED_CHAT = textwrap.dedent(
+    """
+    Files follow.
+
+    README.md
+    ```markdown
+    Run it with:
+    ```bash
+    python main.py
+    ```
+    ```
+
+    docs/guide.md
+    ````markdown
+    ```
+    quoted = "```"
+    ```
+    ````
+
+    main.py
+    ```python
+    print("``` is not a fence inside a line")
+    ```
+    ```text
+    no file name
+    ```
+    """
+)
+
+
+def test_nested_and_longer_fences():
+    files = dict(parse_chat(NESTED_CHAT)[:-1])
+
+    assert files == {
+        "README.md": "Run it with:\n```bash\npython main.py\n```\n",
+        "docs/guide.md": '```\nquoted = "```"\n```\n',
+        "main.py": 'print("``` is not a fence inside a line")\n',
+    }
+
+
+def test_parser_does_not_depend_on_how_the_chat_is_split():
+    expected = parse_chat(NESTED_CHAT)
+
+    rng = random.Random(0)
+    for _ in range(50):
+        parser = ChatParser()
+        files = []
+        pos = 0
+        while pos < len(NESTED_CHAT):
+            size = rng.randint(1, 6)
+            files += parser.feed(NESTED_CHAT[pos : pos + size])
+            pos += size
+        files += parser.close()
+
+        assert files + [("README.md", parser.readme)] == expected
+
+
+def test_readme_is_whole_chat_without_code_blocks():
+    assert parse_chat("Just some text.") == [("README.md", "Just some text.")]
+
+
+def regex_parse_chat(chat):
+    # The regex parse_chat used before ChatParser, for the chats both accept
+    files = [
+        (match.group(1), match.group(2))
+        for match in re.finditer(r"(\S+)\n\s*```[^\n]*\n(.+?)```", chat, re.DOTALL)
+    ]
+    return files + [("README.md", chat.split("```")[0])]
+
+
+FENCE_AT_LINE_END_CHATS = [
+    "main.py\n```\nx=1```",
+    "main.py\n```python\nx=1```\n\nutil.py\n```\ny=2\n```\n",
+    "Files:\n\nmain.py\n```\nimport util\nutil.run()```\n\nutil.py\n```\ndef run():\n"
+    "    pass\n```\n",
+]
+
+
+def test_fence_at_the_end_of_a_line_closes_the_block():
+    for chat in FENCE_AT_LINE_END_CHATS:
+        assert parse_chat(chat) == regex_parse_chat(chat)
+
+        parser = ChatParser()
+        files = [file for char in chat for file in parser.feed(char)] + parser.close()
+        assert files + [("README.md", parser.readme)] == regex_parse_chat(chat)
+
+
+def test_unclosed_block_ends_with_the_chat():
+    files = parse_chat("main.py\n```\nprint(1)\n```\n\nutil.py\n```\nx = 1\n")
+
+    assert files == [
+        ("main.py", "print(1)\n"),
+        ("util.py", "x = 1\n"),
+        ("README.md", "main.py\n"),
+    ]
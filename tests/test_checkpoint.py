@@ -0,0 +1,142 @@
+import asyncio
+import json
+
+import pytest
+
+from gpt_engineer.core.checkpoint import Checkpoints
+from gpt_engineer.core.db import content_digest
+from gpt_engineer.core.scheduler import StepIO, arun_dag, run_dag
+
+
+class Pipeline:
+    # gen -> entrypoint -> execute, counting how often each step ran
+    def __init__(self, make_dbs, fail_execute=False):
+        self.make_dbs = make_dbs
+        self.calls = {"gen": 0, "entrypoint": 0, "execute": 0}
+        self.fail_execute = fail_execute
+
+        def gen(ai, dbs):
+            self.calls["gen"] += 1
+            dbs.workspace["all_output.txt"] = "code for " + dbs.input["prompt"]
+            dbs.workspace["main.py"] = "print(1)"
+            return []
+
+        def entrypoint(ai, dbs):
+            self.calls["entrypoint"] += 1
+            dbs.workspace["run.sh"] = "python main.py"
+            return []
+
+        def execute(ai, dbs):
+            self.calls["execute"] += 1
+            if self.fail_execute:
+                raise RuntimeError("rate limited")
+            return []
+
+        self.steps = [gen, entrypoint, execute]
+        self.io = {
+            gen: StepIO(reads=("input/prompt",), writes=("workspace",)),
+            entrypoint: StepIO(
+                reads=("workspace/all_output.txt",), writes=("workspace/run.sh",)
+            ),
+            execute: StepIO(reads=("workspace",), writes=("console",)),
+        }
+
+    def run(self, body: dict, resume: bool):
+        dbs = self.make_dbs(body)
+        checkpoints = Checkpoints(dbs.memory, self.io, resume=resume)
+        return run_dag(None, dbs, self.steps, self.io, checkpoints=checkpoints)
+
+
+def test_resume_only_reruns_the_failed_step(make_dbs):
+    body: dict = {"input": {"prompt": "snake"}}
+    pipeline = Pipeline(make_dbs, fail_execute=True)
+    with pytest.raises(RuntimeError):
+        pipeline.run(body, resume=False)
+
+    pipeline.fail_execute = False
+    trace = pipeline.run(body, resume=True)
+
+    assert pipeline.calls == {"gen": 1, "entrypoint": 1, "execute": 2}
+    assert [timing.resumed for timing in trace.steps] == [True, True, False]
+    assert set(body["logs"]) == {"gen", "entrypoint", "execute"}
+    assert set(body["memory"]) == {
+        "checkpoints/gen.json",
+        "checkpoints/entrypoint.json",
+        "checkpoints/execute.json",
+    }
+
+
+def test_resume_reruns_steps_whose_outputs_are_gone(make_dbs):
+    body: dict = {"input": {"prompt": "snake"}}
+    pipeline = Pipeline(make_dbs)
+    pipeline.run(body, resume=False)
+    # A new run on a workspace that lost the generated files
+    body["workspace"] = {}
+
+    pipeline.run(body, resume=True)
+
+    # execute reads the same workspace as before once it is regenerated
+    assert pipeline.calls == {"gen": 2, "entrypoint": 2, "execute": 1}
+    assert body["workspace"] == {
+        "all_output.txt": "code for snake",
+        "main.py": "print(1)",
+        "run.sh": "python main.py",
+    }
+
+
+def test_changed_inputs_rerun_the_step_and_its_dependents(make_dbs):
+    body: dict = {"input": {"prompt": "snake"}}
+    pipeline = Pipeline(make_dbs)
+    pipeline.run(body, resume=False)
+    body["input"]["prompt"] = "tetris"
+
+    pipeline.run(body, resume=True)
+
+    assert pipeline.calls == {"gen": 2, "entrypoint": 2, "execute": 2}
+    assert body["workspace"]["all_output.txt"] == "code for tetris"
+
+
+def test_without_resume_every_step_runs(make_dbs):
+    body: dict = {"input": {"prompt": "snake"}}
+    pipeline = Pipeline(make_dbs)
+    pipeline.run(body, resume=False)
+    pipeline.run(body, resume=False)
+
+    assert pipeline.calls == {"gen": 2, "entrypoint": 2, "execute": 2}
+
+
+def test_checkpoints_only_hold_declared_writes(make_dbs):
+    body: dict = {"input": {"prompt": "snake"}}
+    pipeline = Pipeline(make_dbs)
+    pipeline.run(body, resume=False)
+
+    entrypoint = json.loads(body["memory"]["checkpoints/entrypoint.json"])
+    # Digests of the files, not copies
+    assert entrypoint["writes"] == {
+        "workspace": {"run.sh": content_digest("python main.py").hex()}
+    }
+    assert json.loads(body["memory"]["checkpoints/execute.json"])["writes"] == {}
+
+
+def test_async_runs_resume_async_steps(make_dbs):
+    body: dict = {"input": {"prompt": "snake"}}
+    pipeline = Pipeline(make_dbs)
+    gen = pipeline.steps[0]
+    awaited = []
+
+    async def agen(ai, dbs):
+        awaited.append(True)
+        return gen(ai, dbs)
+
+    async def run(resume):
+        dbs = make_dbs(body)
+        checkpoints = Checkpoints(dbs.memory, pipeline.io, resume=resume)
+        return await arun_dag(
+            None, dbs, pipeline.steps, pipeline.io, {gen: agen}, checkpoints=checkpoints
+        )
+
+    asyncio.run(run(False))
+    trace = asyncio.run(run(True))
+
+    assert awaited == [True]
+    assert all(timing.resumed for timing in trace.steps)
@@ -0,0 +1,106 @@
+import pytest
+
+from gpt_engineer.core.context_packing import (
+    context_window,
+    pack_context,
+    prompt_budget,
+    score_chunks,
+    split_chunks,
+)
+
+PARSER = """import re
+
+
+def parse_chat(chat):
+    return re.findall("```", chat)
+
+
+def clean_file_name(name):
+    return name.strip()
+"""
+
+LOGGER = """import logging
+
+
+def setup_logging(level):
+    logging.basicConfig(level=level)
+"""
+
+
+def count_words(name, text):
+    return len(name.split()) + len(text.split())
+
+
+def test_context_windows(monkeypatch):
+    monkeypatch.delenv("GPTE_CONTEXT_WINDOW", raising=False)
+    monkeypatch.delenv("GPTE_COMPLETION_TOKENS", raising=False)
+    monkeypatch.delenv("GPTE_CONTEXT_TOKENS", raising=False)
+
+    assert context_window("gpt-4") == 8192
+    assert context_window("gpt-4-0613") == 8192
+    assert context_window("gpt-4-32k-0613") == 32768
+    assert context_window("unknown-model") == 4096
+    assert prompt_budget("gpt-4") == 6144
+
+    monkeypatch.setenv("GPTE_CONTEXT_TOKENS", "2000")
+    assert prompt_budget("gpt-4") == 2000
+    assert prompt_budget("gpt-4", limited=False) == 6144
+    monkeypatch.setenv("GPTE_CONTEXT_WINDOW", "1000")
+    monkeypatch.setenv("GPTE_COMPLETION_TOKENS", "100")
+    assert prompt_budget("gpt-4") == 900
+
+
+def test_chunks_start_at_top_level_definitions():
+    chunks = split_chunks("parser.py", PARSER)
+
+    assert [(chunk.start, chunk.end) for chunk in chunks] == [(0, 3), (3, 7), (7, 9)]
+    assert "".join(chunk.text for chunk in chunks) == PARSER
+
+
+def test_chunks_matching_the_query_score_higher():
+    chunks = split_chunks("parser.py", PARSER) + split_chunks("log.py", LOGGER)
+
+    score_chunks(chunks, "Clean up file names in cleanFileName")
+
+    best = max(chunks, key=lambda chunk: chunk.score)
+    assert best.text.startswith("def clean_file_name")
+    assert all(chunk.score == 0 for chunk in chunks if chunk.file == "log.py")
+
+
+def test_everything_is_sent_when_it_fits():
+    files = {"parser.py": PARSER, "log.py": LOGGER}
+
+    packed = pack_context(files, "anything", 1000, count_words)
+
+    assert packed.files == files
+    assert not packed.trimmed
+
+
+def test_less_relevant_files_are_excerpted_or_dropped():
+    files = {"parser.py": PARSER, "log.py": LOGGER}
+    full = count_words("parser.py", PARSER)
+
+    packed = pack_context(files, "make parse_chat faster", full + 5, count_words)
+
+    assert packed.files == {"parser.py": PARSER}
+    assert packed.excerpts == {"log.py": "...\ndef setup_logging(level):\n...\n"}
+    assert packed.tokens == full + 5
+
+    packed = pack_context(files, "make parse_chat faster", full, count_words)
+
+    assert packed.dropped == ["log.py"]
+    assert packed.report() == {
+        "full": ["parser.py"],
+        "excerpts": [],
+        "dropped": ["log.py"],
+    }
+
+
+@pytest.mark.parametrize("budget", [8, 10])
+def test_excerpts_grow_with_relevant_chunks(budget):
+    packed = pack_context({"parser.py": PARSER}, "clean_file_name", budget, count_words)
+
+    excerpt = packed.excerpts["parser.py"]
+    assert "def parse_chat(chat):" in excerpt
+    assert ("return name.strip()" in excerpt) == (budget == 10)
+    assert count_words("parser.py", excerpt) <= budget
@@ -130,3 +130,86 @@ def test_DBs_dataclass_attributes(tmp_path):
     assert dbs_instance.workspace == dbs[4]
     assert dbs_instance.archive == dbs[5]
     assert dbs_instance.project_metadata == dbs[6]
+
+
+def test_snapshot_is_not_changed_by_later_writes():
+    body = {"workspace": {"main.py": "v1", "util.py": "u1"}}
+    db = DB(body, "workspace")
+
+    snapshot = db.snapshot()
+    db["main.py"] = "v2"
+
+    assert snapshot == {"main.py": "v1", "util.py": "u1"}
+    assert body["workspace"] == {"main.py": "v2", "util.py": "u1"}
+    assert body["workspace"]["util.py"] is snapshot["util.py"]
+
+
+def test_snapshot_is_shared_until_written():
+    db = DB({}, "workspace")
+    db["main.py"] = "v1"
+
+    first = db.snapshot()
+    assert db.snapshot() is first
+
+    db["main.py"] = "v2"
+    second = db.snapshot()
+    db["main.py"] = "v3"
+
+    assert (first["main.py"], second["main.py"], db["main.py"]) == ("v1", "v2", "v3")
+    # Another DB over the same body also leaves the snapshot alone
+    DB(db.backend.data, "workspace")["main.py"] = "v4"
+    assert second["main.py"] == "v2"
+
+
+def test_writes_track_changed_files():
+    body = {"workspace": {"main.py": "v1"}}
+    db = DB(body, "workspace")
+    db["main.py"] = "v1"
+    assert db.generation == 0
+    assert body["workspace"]["main.py"] == "v1"
+
+    db["main.py"] = "v2"
+    db["util.py"] = "u1"
+    generation = db.generation
+    db["util.py"] = "u2"
+    db["util.py"] = "u2"
+    db["main.py"] = "v3"
+
+    assert db.generation == generation + 2
+    assert db.changed_since(0) == ["util.py", "main.py"]
+    assert db.changed_since(generation) == ["util.py", "main.py"]
+    assert db.changed_since(db.generation - 1) == ["main.py"]
+    assert db.changed_since(db.generation) == []
+
+
+def test_writes_compare_with_the_current_content(tmp_path):
+    body = {"workspace": {}}
+    a = DB(body, "workspace")
+    b = DB(body, "workspace")
+    a["f"] = "v1"
+    b["f"] = "v2"
+    a["f"] = "v1"
+    assert body["workspace"]["f"] == "v1"
+
+    db = DB(tmp_path)
+    db["main.py"] = "v1"
+    (tmp_path / "main.py").write_text("edited")
+    assert db.digest("main.py") != DB({"w": {"f": "v1"}}, "w").digest("f")
+    db["main.py"] = "v1"
+    assert (tmp_path / "main.py").read_text() == "v1"
+
+
+def test_diff_of_changed_files():
+    db = DB({"workspace": {"main.py": "a\nb\n", "util.py": "u\n"}}, "workspace")
+    base = db.snapshot()
+    generation = db.generation
+    db["main.py"] = "a\nc\n"
+    db["new.py"] = "n\n"
+    db["util.py"] = "u\n"
+
+    diff = "".join(db.diff(base, since=generation))
+
+    assert "--- a/main.py\n+++ b/main.py\n" in diff
+    assert "-b\n+c\n" in diff
+    assert "+++ b/new.py\n@@ -0,0 +1 @@\n+n\n" in diff
+    assert "util.py" not in diff
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from gpt_engineer.core.db import DB, DBs, archive, backends_from_env
+from gpt_engineer.core.db_backends import (
+    DictBackend,
+    DirectoryBackend,
+    PackFileBackend,
+    SQLiteBackend,
+    open_backend,
+)
+
+BACKENDS = {
+    "dict": lambda tmp_path: DictBackend({}, "workspace"),
+    "directory": lambda tmp_path: DirectoryBackend(tmp_path / "workspace"),
+    "sqlite": lambda tmp_path: SQLiteBackend(tmp_path / "dbs.sqlite", "workspace"),
+    "pack": lambda tmp_path: PackFileBackend(tmp_path / "workspace.pack"),
+}
+
+
+@pytest.fixture(params=list(BACKENDS))
+def db(request, tmp_path):
+    db = DB(backend=BACKENDS[request.param](tmp_path))
+    yield db
+    db.backend.close()
+
+
+def test_read_write(db):
+    db["main.py"] = "print('hi')\n"
+    db["src/util.py"] = "ünïcode ✓"
+    db["main.py"] = "print('hello')\n"
+
+    assert db["main.py"] == "print('hello')\n"
+    assert db["src/util.py"] == "ünïcode ✓"
+    assert db.get("missing", "default") == "default"
+    assert "src/util.py" in db and "missing" not in db
+    assert sorted(db) == ["main.py", "src/util.py"]
+    assert dict(db.items()) == {
+        "main.py": "print('hello')\n",
+        "src/util.py": "ünïcode ✓",
+    }
+    with pytest.raises(KeyError):
+        db["missing"]
+
+
+def test_snapshot_does_not_change(db):
+    db["main.py"] = "v1"
+    snapshot = db.snapshot()
+    db["main.py"] = "v2"
+
+    assert snapshot == {"main.py": "v1"}
+
+
+@pytest.mark.parametrize("name", ["directory", "sqlite", "pack"])
+def test_persistent_backends_reopen(tmp_path, name):
+    backend = BACKENDS[name](tmp_path)
+    backend.write("a.py", "first")
+    backend.write("a.py", "second")
+    backend.write("b.py", "")
+    backend.close()
+
+    reopened = DB(backend=BACKENDS[name](tmp_path))
+    assert dict(reopened.items()) == {"a.py": "second", "b.py": ""}
+
+
+def test_pack_file_drops_torn_write_and_compacts(tmp_path):
+    backend = PackFileBackend(tmp_path / "workspace.pack")
+    backend.write("a.py", "a" * 100)
+    backend.write("a.py", "b" * 100)
+    backend.close()
+    with open(tmp_path / "workspace.pack", "ab") as f:
+        f.write(b"\x05\x00\x00")
+
+    backend = PackFileBackend(tmp_path / "workspace.pack")
+    assert backend.read("a.py") == "b" * 100
+    size = (tmp_path / "workspace.pack").stat().st_size
+    backend.compact()
+    assert (tmp_path / "workspace.pack").stat().st_size < size
+    assert backend.read("a.py") == "b" * 100
+    backend.write("c.py", "c")
+    assert dict(backend.items()) == {"a.py": "b" * 100, "c.py": "c"}
+    backend.close()
+
+
+def test_path_is_only_available_for_directories(tmp_path):
+    assert DB(tmp_path).path == tmp_path.absolute()
+    with pytest.raises(AttributeError):
+        DB({}, "workspace").path
+
+
+def test_archive_copies_into_non_directory_archive(tmp_path):
+    body = {}
+    dbs = DBs(
+        memory=DB(body, "memory"),
+        logs=DB(body, "logs"),
+        preprompts=DB(body, "preprompts"),
+        input=DB(body, "input"),
+        workspace=DB(backend=SQLiteBackend(tmp_path / "dbs.sqlite", "workspace")),
+        archive=DB(backend=SQLiteBackend(tmp_path / "dbs.sqlite", "archive")),
+        project_metadata=DB(body, "project_metadata"),
+    )
+    dbs.workspace["main.py"] = "v1"
+    dbs.workspace["util.py"] = "v1"
+    archive(dbs)
+    dbs.workspace["main.py"] = "v2"
+
+    (manifest,) = [key for key in dbs.archive if key.endswith("/workspace.json")]
+    digests = json.loads(dbs.archive[manifest])
+    assert digests["main.py"] == digests["util.py"]
+    assert dbs.archive[f"objects/{digests['main.py']}"] == "v1"
+    assert len([key for key in dbs.archive if key.startswith("objects/")]) == 1
+
+
+def test_backends_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv(
+        "GPTE_DB_BACKENDS",
+        f"workspace=directory:{tmp_path},*=sqlite:{tmp_path / 'dbs.sqlite'},input=dict",
+    )
+    backends = backends_from_env()
+
+    assert isinstance(backends["workspace"], DirectoryBackend)
+    assert backends["workspace"].path == tmp_path / "workspace"
+    assert isinstance(backends["memory"], SQLiteBackend)
+    assert backends["memory"].namespace == "memory"
+    assert "input" not in backends
+    with pytest.raises(ValueError):
+        open_backend("s3:bucket", "workspace")
@@ -0,0 +1,131 @@
+import os
+import time
+
+from pathlib import Path
+
+import pytest
+
+from evals.eval_tools import (
+    check_evaluation_component,
+    run_code_class_has_property,
+    run_evaluations,
+    run_sandboxed,
+)
+
+
+def write_and_read(eval_ob: dict) -> list[bool]:
+    # Evaluations of the same project would overwrite each other without isolation
+    project = Path(eval_ob["project_root"])
+    project.mkdir(parents=True, exist_ok=True)
+    (project / "name").write_text(eval_ob["name"])
+    time.sleep(0.2)
+    return [(project / "name").read_text() == eval_ob["name"], eval_ob["pass"]]
+
+
+def test_run_evaluations_in_order_and_isolated(tmp_path):
+    evals = [
+        {"name": f"eval_{i}", "project_root": "projects/same", "pass": i % 2 == 0}
+        for i in range(4)
+    ]
+    results = run_evaluations(
+        evals, write_and_read, workers=4, work_dir=str(tmp_path / "runs")
+    )
+
+    assert results == [[True, True], [True, False], [True, True], [True, False]]
+    assert (tmp_path / "runs" / "1_eval_1" / "projects" / "same" / "name").exists()
+    assert "eval_log.txt" in {
+        path.name for path in (tmp_path / "runs" / "0_eval_0").iterdir()
+    }
+
+
+def test_run_evaluations_serially():
+    evals = [{"name": "a", "pass": True}, {"name": "b", "pass": False}]
+    results = run_evaluations(evals, lambda eval_ob: [eval_ob["pass"]])
+    assert results == [[True], [False]]
+
+
+def test_executable_timeout(tmp_path):
+    (tmp_path / "workspace").mkdir()
+    test_case = {
+        "type": "check_executable_exits_normally",
+        "project_root": tmp_path,
+        "executable_name": "sleep",
+        "executable_arguments": "10",
+        "timeout": 0.2,
+    }
+    start = time.perf_counter()
+    assert not check_evaluation_component(test_case)
+    assert time.perf_counter() - start < 5
+
+
+def class_check(tmp_path: Path, init_body: str, **limits) -> dict:
+    (tmp_path / "main.py").write_text(
+        "class Grid:\n    def __init__(self):\n" + init_body + "\n"
+    )
+    return {
+        "type": "run_code_class_has_property",
+        "language": "python",
+        "project_root": tmp_path,
+        "source_file": "main.py",
+        "class_name": "Grid",
+        "property_name": "height",
+        **limits,
+    }
+
+
+def test_sandboxed_check_passes(tmp_path):
+    test_case = class_check(tmp_path, "        self.height = 1\n        os.chdir('/')")
+    (tmp_path / "main.py").write_text("import os\n" + (tmp_path / "main.py").read_text())
+    cwd = os.getcwd()
+
+    result = run_sandboxed(run_code_class_has_property, test_case)
+
+    assert (result.passed, result.status) == (True, "passed")
+    assert os.getcwd() == cwd
+    assert check_evaluation_component(test_case)
+
+
+def test_sandboxed_check_error(tmp_path):
+    test_case = class_check(tmp_path, "        raise ValueError('no grid')")
+    result = run_sandboxed(run_code_class_has_property, test_case)
+    assert (result.passed, result.status) == (False, "error")
+    assert "no grid" in result.detail
+
+
+def test_sandboxed_check_timeout(tmp_path):
+    test_case = class_check(tmp_path, "        import time\n        time.sleep(10)")
+    test_case["timeout"] = 0.2
+    start = time.perf_counter()
+    assert not check_evaluation_component(test_case)
+    assert time.perf_counter() - start < 5
+    assert run_sandboxed(run_code_class_has_property, test_case).status == "timeout"
+
+
+def test_sandboxed_check_cpu_limit(tmp_path):
+    test_case = class_check(
+        tmp_path, "        while True:\n            pass", cpu_seconds=1, timeout=20
+    )
+    result = run_sandboxed(run_code_class_has_property, test_case)
+    assert (result.passed, result.status) == (False, "cpu_limit")
+    assert result.seconds < 10
+
+
+def test_sandboxed_check_crash(tmp_path):
+    test_case = class_check(
+        tmp_path,
+        "        import os, signal\n        os.kill(os.getpid(), signal.SIGKILL)",
+    )
+    result = run_sandboxed(run_code_class_has_property, test_case)
+    assert (result.passed, result.status) == (False, "crashed")
+    assert result.detail == "killed by signal 9"
+
+
+@pytest.mark.skipif(
+    not Path("/proc/self/status").exists(), reason="needs the address space size"
+)
+def test_sandboxed_check_memory_limit(tmp_path):
+    test_case = class_check(
+        tmp_path, "        self.height = bytearray(2**31)", memory_mb=64
+    )
+    result = run_sandboxed(run_code_class_has_property, test_case)
+    assert (result.passed, result.status) == (False, "memory_limit")
@@ -0,0 +1,29 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_DEPENDENCIES = ["langchain", "openai", "tiktoken", "termcolor"]
+
+
+@pytest.mark.parametrize(
+    "module", ["gpt_engineer.core.chat_to_files", "gpt_engineer.core.db"]
+)
+def test_light_modules_do_not_import_heavy_dependencies(module):
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_DEPENDENCIES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == ""
+
+
+def test_core_submodules_are_loaded_on_access():
+    from gpt_engineer import core
+
+    assert core.db.__name__ == "gpt_engineer.core.db"
+    with pytest.raises(AttributeError):
+        core.not_a_module
@@ -0,0 +1,49 @@
+from langchain.schema import AIMessage
+
+from gpt_engineer.cli import main
+from gpt_engineer.cli.main import project_dbs, run_project
+from gpt_engineer.core.ai_pool import AIPool
+
+
+def test_project_dbs_layout(tmp_path):
+    dbs = project_dbs(tmp_path)
+
+    assert dbs.input.path == tmp_path
+    assert dbs.workspace.path == tmp_path / "workspace"
+    assert dbs.memory.path == tmp_path / ".gpteng" / "memory"
+    assert dbs.logs.path == tmp_path / ".gpteng" / "memory" / "logs"
+    assert dbs.archive.path == tmp_path / ".gpteng" / "archive"
+    assert dbs.project_metadata.path == tmp_path / ".gpteng"
+    assert "improve" in dbs.preprompts
+
+
+def test_improved_projects_are_their_own_workspace(tmp_path):
+    (tmp_path / "main.py").write_text("print(1)")
+
+    dbs = project_dbs(tmp_path, improve_mode=True)
+
+    assert dbs.workspace["main.py"] == "print(1)"
+
+
+def test_run_project_improves_the_project_in_place(tmp_path, monkeypatch, make_ai):
+    class ImprovingChatModel:
+        def __call__(self, messages, callbacks=None):
+            return AIMessage(content="main.py\n```\nprint(2)\n```")
+
+    (tmp_path / "main.py").write_text("print(1)")
+    (tmp_path / "prompt").write_text("print 2")
+    (tmp_path / ".gpteng").mkdir()
+    (tmp_path / ".gpteng" / "file_list.txt").write_text(str(tmp_path / "main.py"))
+    (tmp_path / ".gpteng" / "memory").mkdir()
+    (tmp_path / ".gpteng" / "memory" / "earlier_run").write_text("log")
+    pool = AIPool(factory=lambda **kwargs: make_ai(ImprovingChatModel()))
+    monkeypatch.setattr(main, "default_pool", lambda: pool)
+    monkeypatch.setattr("builtins.input", lambda *args: "")
+
+    run_project(tmp_path, improve_mode=True)
+
+    # The project stays where it is, while the memory of the earlier run is archived
+    assert (tmp_path / "main.py").read_text() == "print(2)\n"
+    [archived] = (tmp_path / ".gpteng" / "archive").iterdir()
+    assert (archived / "memory" / "earlier_run").read_text() == "log"
+    assert not (archived / "workspace").exists()
@@ -0,0 +1,109 @@
+import gc
+
+import pytest
+
+from gpt_engineer.core.db import DB
+from gpt_engineer.core.materialize import (
+    Materializer,
+    WriteBehindBackend,
+    stop_write_behind,
+    workspace_path,
+    write_behind_from_env,
+)
+
+
+def test_flush_writes_files_and_skips_unchanged(tmp_path):
+    db = DB({}, "workspace")
+    db["main.py"] = "print('hi')"
+    db["src/util.py"] = "x = 1"
+    materializer = Materializer(tmp_path / "out", batch_size=1)
+
+    stats = materializer.flush(db)
+    assert (stats.written, stats.unchanged) == (2, 0)
+    assert (tmp_path / "out" / "src" / "util.py").read_text() == "x = 1"
+
+    db["main.py"] = "print('hello')"
+    stats = materializer.flush(db)
+    assert (stats.written, stats.unchanged) == (1, 0)
+    assert (tmp_path / "out" / "main.py").read_text() == "print('hello')"
+
+
+def test_flush_skips_files_already_on_disk(tmp_path):
+    (tmp_path / "main.py").write_text("same")
+    (tmp_path / "run.sh").write_text("old")
+
+    stats = Materializer(tmp_path).flush([("main.py", "same"), ("run.sh", "new")])
+
+    assert (stats.written, stats.unchanged) == (1, 1)
+    assert (tmp_path / "run.sh").read_text() == "new"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["main.py", "run.sh"]
+
+
+def test_flush_rejects_paths_outside_of_target(tmp_path):
+    with pytest.raises(ValueError):
+        Materializer(tmp_path / "out").flush([("../escape.py", "x")])
+    assert not (tmp_path / "escape.py").exists()
+
+
+def test_write_behind_flushes_in_background(tmp_path):
+    db = DB({}, "workspace")
+    db.backend = WriteBehindBackend(db.backend, Materializer(tmp_path), delay=0)
+    for i in range(100):
+        db["main.py"] = f"v{i}"
+    db["run.sh"] = "python main.py"
+
+    db.flush()
+
+    assert (tmp_path / "main.py").read_text() == "v99"
+    assert (tmp_path / "run.sh").read_text() == "python main.py"
+    assert db["main.py"] == "v99"
+    assert workspace_path(db) == tmp_path
+    db.backend.close()
+
+
+def test_workspace_path_materializes_in_memory_workspaces(tmp_path):
+    db = DB({}, "workspace")
+    db["run.sh"] = "echo hi"
+
+    path = workspace_path(db)
+    db["run.sh"] = "echo hello"
+
+    assert workspace_path(db) == path
+    assert (path / "run.sh").read_text() == "echo hello"
+    assert workspace_path(DB(tmp_path)) == tmp_path
+
+
+def test_write_behind_from_env(tmp_path, monkeypatch):
+    assert not isinstance(
+        write_behind_from_env(DB({}, "workspace")).backend, WriteBehindBackend
+    )
+
+    monkeypatch.setenv("GPTE_WORKSPACE_DIR", str(tmp_path))
+    db = write_behind_from_env(DB({}, "workspace"))
+    other = write_behind_from_env(DB({}, "workspace"))
+    assert isinstance(db.backend, WriteBehindBackend)
+    # Every run flushes to a directory of its own
+    assert db.backend.path.parent == tmp_path
+    assert other.backend.path.parent == tmp_path
+    assert db.backend.path != other.backend.path
+    assert write_behind_from_env(DB(tmp_path / "dir")).backend.path == tmp_path / "dir"
+
+    db["main.py"] = "print(1)"
+    path, thread = db.backend.path, db.backend._thread
+    stop_write_behind(db)
+    assert (path / "main.py").read_text() == "print(1)"
+    assert not thread.is_alive()
+    assert not isinstance(db.backend, WriteBehindBackend)
+    assert db["main.py"] == "print(1)"
+    stop_write_behind(other)
+
+
+def test_materialized_workspaces_are_removed_with_their_backend():
+    db = DB({}, "workspace")
+    db["run.sh"] = "echo hi"
+    path = workspace_path(db)
+    assert path.exists()
+
+    del db
+    gc.collect()
+    assert not path.exists()
@@ -0,0 +1,94 @@
+import threading
+
+from gpt_engineer.core.model_catalog import ModelCatalog
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def counting_fetch(models):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return list(models)
+
+    return fetch, calls
+
+
+def test_models_are_cached():
+    fetch, calls = counting_fetch(["gpt-4"])
+    catalog = ModelCatalog(fetch=fetch, key=lambda: "account")
+
+    assert catalog.models() == ["gpt-4"]
+    assert catalog.is_available("gpt-4")
+    assert not catalog.is_available("gpt-5")
+    assert len(calls) == 1
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    fetch, calls = counting_fetch(["gpt-4"])
+    catalog = ModelCatalog(ttl=10, fetch=fetch, key=lambda: "account", clock=clock)
+
+    catalog.models()
+    clock.now += 9
+    catalog.models()
+    assert len(calls) == 1
+
+    clock.now += 1
+    catalog.models()
+    assert len(calls) == 2
+
+
+def test_catalog_is_keyed_per_account():
+    account = ["a"]
+    fetch, calls = counting_fetch(["gpt-4"])
+    catalog = ModelCatalog(fetch=fetch, key=lambda: account[0])
+
+    catalog.models()
+    account[0] = "b"
+    catalog.models()
+    assert len(calls) == 2
+
+
+def test_invalidate():
+    fetch, calls = counting_fetch(["gpt-4"])
+    catalog = ModelCatalog(fetch=fetch, key=lambda: "account")
+
+    catalog.models()
+    catalog.invalidate()
+    catalog.models()
+    assert len(calls) == 2
+
+
+def test_snapshot_is_shared_between_catalogs(tmp_path):
+    snapshot = tmp_path / "catalog.json"
+    fetch, calls = counting_fetch(["gpt-4", "gpt-3.5-turbo"])
+
+    ModelCatalog(snapshot_path=snapshot, fetch=fetch, key=lambda: "account").models()
+    second = ModelCatalog(snapshot_path=snapshot, fetch=fetch, key=lambda: "account")
+
+    assert second.models() == ["gpt-4", "gpt-3.5-turbo"]
+    assert len(calls) == 1
+
+    second.invalidate()
+    assert not snapshot.exists()
+
+
+def test_concurrent_lookups_fetch_once():
+    fetch, calls = counting_fetch(["gpt-4"])
+    catalog = ModelCatalog(fetch=fetch, key=lambda: "account")
+
+    threads = [threading.Thread(target=catalog.models) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
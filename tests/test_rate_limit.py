@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+from langchain.schema import AIMessage
+
+from gpt_engineer.core import rate_limit
+from gpt_engineer.core.rate_limit import TokenBucket, rate_limiter_from_env
+
+
+class FakeClock:
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(rate_limit.time, "time", lambda: self.now)
+
+
+def test_reservations_are_spaced_at_the_rate(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    bucket = TokenBucket(rate=2, capacity=2)
+
+    waits = [bucket.reserve() for _ in range(5)]
+
+    assert waits == [0, 0, 0.5, 1.0, 1.5]
+    clock.now += 10
+    # Refilled up to the capacity only
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0.5]
+
+
+def test_buckets_share_their_state_through_a_file(tmp_path, monkeypatch):
+    FakeClock(monkeypatch)
+    path = tmp_path / "bucket.json"
+    # As in two processes of a benchmark run
+    first, second = TokenBucket(1, path=path), TokenBucket(1, path=path)
+
+    assert [first.reserve(), second.reserve(), first.reserve()] == [0, 1, 2]
+    tokens, _ = json.loads(path.read_text())
+    assert tokens == -2
+
+
+def test_rate_limiter_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("GPTE_RATE_LIMIT", raising=False)
+    assert rate_limiter_from_env() is None
+
+    monkeypatch.setenv("GPTE_RATE_LIMIT", "120")
+    monkeypatch.setenv("GPTE_RATE_LIMIT_FILE", str(tmp_path / "bucket.json"))
+    bucket = rate_limiter_from_env()
+
+    assert bucket.rate == 2 and bucket.capacity == 1
+    assert bucket.path == tmp_path / "bucket.json"
+    assert rate_limiter_from_env() is bucket
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_requests_take_a_token(monkeypatch, make_ai):
+    class FakeChatModel:
+        def __call__(self, messages, callbacks=None):
+            return AIMessage(content="answer")
+
+        async def apredict_messages(self, messages, callbacks=None):
+            return AIMessage(content="answer")
+
+    ai = make_ai(FakeChatModel())
+    ai.rate_limiter = TokenBucket(rate=1000, capacity=1)
+    reserved = []
+    monkeypatch.setattr(
+        ai.rate_limiter, "reserve", lambda tokens: reserved.append(tokens) or 0.0
+    )
+
+    ai.start("system", "user", step_name="gen")
+    asyncio.run(ai.astart("system", "user", step_name="gen"))
+
+    assert reserved == [1, 1]
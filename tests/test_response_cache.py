@@ -0,0 +1,82 @@
+import os
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+from gpt_engineer.core.response_cache import ResponseCache
+
+from .test_ai import FakeChatModel
+
+
+def test_key_depends_on_endpoint_model_temperature_and_messages():
+    messages = [SystemMessage(content="system"), HumanMessage(content="user")]
+    key = ResponseCache.key("gpt-4", 0, messages)
+
+    assert key == ResponseCache.key("gpt-4", 0, list(messages))
+    assert key != ResponseCache.key("gpt-3.5-turbo", 0, messages)
+    assert key != ResponseCache.key("gpt-4", 0.1, messages)
+    assert key != ResponseCache.key("gpt-4", 0, messages[:1])
+    assert ResponseCache.key(
+        "gpt-4", 0, messages, "http://127.0.0.1:8000/v1"
+    ) != ResponseCache.key("gpt-4", 0, messages, "https://api.openai.com/v1")
+
+
+def test_put_and_get(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.put("key", AIMessage(content="answer"), (10, 2))
+
+    message, usage = cache.get("key")
+    assert message.content == "answer"
+    assert usage == (10, 2)
+    assert cache.get("missing") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=3000)
+    for i, key in enumerate(["old", "used", "new"]):
+        cache.put(key, AIMessage(content=key * 200))
+        os.utime(tmp_path / f"{key}.json", (i, i))
+    cache.get("old")
+
+    cache.put("newest", AIMessage(content="x" * 600))
+
+    assert cache.get("used") is None
+    assert cache.get("old") is not None
+    assert cache.get("newest") is not None
+
+
+def test_puts_under_the_limit_do_not_scan(tmp_path, monkeypatch):
+    cache = ResponseCache(tmp_path, max_bytes=3000)
+    scans = []
+    evict = cache._evict
+    monkeypatch.setattr(cache, "_evict", lambda: scans.append(1) or evict())
+
+    cache.put("first", AIMessage(content="a" * 100))
+    cache.put("second", AIMessage(content="b" * 100))
+    cache.put("first", AIMessage(content="a" * 100))
+    assert len(scans) == 1
+
+    cache.put("large", AIMessage(content="c" * 3000))
+    assert len(scans) == 2
+    assert cache.get("large") is None
+
+
+def test_ai_replays_cached_responses(tmp_path, make_ai):
+    class CountingChatModel(FakeChatModel):
+        calls = 0
+
+        def __call__(self, messages, callbacks=None):
+            self.calls += 1
+            return super().__call__(messages, callbacks)
+
+    ai = make_ai(CountingChatModel())
+    ai.response_cache = ResponseCache(tmp_path)
+
+    first = ai.start("system", "user", step_name="first")
+    second = ai.start("system", "user", step_name="second")
+
+    assert ai.llm.calls == 1
+    assert first[-1].content == second[-1].content
+    assert [log.in_step_total_tokens for log in ai.token_usage_log] == [
+        ai.token_usage_log[0].in_step_total_tokens
+    ] * 2
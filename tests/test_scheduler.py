@@ -0,0 +1,114 @@
+import asyncio
+import threading
+
+import pytest
+
+from gpt_engineer.core.scheduler import CONSOLE, StepIO, arun_dag, build_dag, run_dag
+from gpt_engineer.core.steps import STEP_IO, STEPS, Config
+
+
+def make_step(name, action=None):
+    def step(ai, dbs):
+        if action is not None:
+            action(dbs)
+        return []
+
+    step.__name__ = name
+    return step
+
+
+def test_build_dag_orders_conflicting_steps():
+    gen, entrypoint, readme, review = (
+        make_step(name) for name in ["gen", "entrypoint", "readme", "review"]
+    )
+    io = {
+        gen: StepIO(reads=("input/prompt",), writes=("workspace",)),
+        entrypoint: StepIO(
+            reads=("workspace/all_output.txt",), writes=("workspace/run.sh",)
+        ),
+        readme: StepIO(reads=("workspace/all_output.txt",), writes=("memory/readme",)),
+        review: StepIO(writes=("memory/review", CONSOLE)),
+    }
+
+    assert build_dag([gen, entrypoint, readme, review], io) == [set(), {0}, {0}, set()]
+    # Undeclared steps depend on everything before them
+    assert build_dag([gen, make_step("other"), review], io) == [set(), {0}, {1}]
+
+
+def test_default_config_keeps_its_order():
+    steps = STEPS[Config.DEFAULT]
+    assert build_dag(steps, STEP_IO) == [set(), {0}, {1}, {2}]
+
+
+def test_independent_steps_run_concurrently(make_dbs):
+    barrier = threading.Barrier(2, timeout=5)
+    gen = make_step("gen", lambda dbs: dbs.workspace.__setitem__("all_output.txt", "x"))
+    entrypoint = make_step("entrypoint", lambda dbs: barrier.wait())
+    readme = make_step("readme", lambda dbs: barrier.wait())
+    io = {
+        gen: StepIO(writes=("workspace",)),
+        entrypoint: StepIO(
+            reads=("workspace/all_output.txt",), writes=("workspace/run.sh",)
+        ),
+        readme: StepIO(reads=("workspace/all_output.txt",), writes=("memory/readme",)),
+    }
+    dbs = make_dbs()
+
+    trace = run_dag(None, dbs, [gen, entrypoint, readme], io)
+
+    assert [timing.name for timing in trace.steps] == ["gen", "entrypoint", "readme"]
+    assert trace.critical_path[0] == "gen" and len(trace.critical_path) == 2
+    assert trace.critical_path_seconds <= trace.wall_seconds + 1e-6
+    assert set(dbs.logs) == {"gen", "entrypoint", "readme"}
+
+
+def test_console_steps_run_on_the_calling_thread(make_dbs):
+    threads = []
+    background = make_step("background", lambda dbs: threads.append(None))
+    review = make_step("review", lambda dbs: threads.append(threading.current_thread()))
+    io = {background: StepIO(writes=("memory/a",)), review: StepIO(writes=(CONSOLE,))}
+
+    run_dag(None, make_dbs(), [background, review], io)
+
+    assert threading.main_thread() in threads
+
+
+def test_arun_dag_runs_console_steps_on_the_loop_thread(make_dbs):
+    threads = []
+    background = make_step("background", lambda dbs: threads.append(None))
+    review = make_step("review", lambda dbs: threads.append(threading.current_thread()))
+    io = {background: StepIO(writes=("memory/a",)), review: StepIO(writes=(CONSOLE,))}
+
+    asyncio.run(arun_dag(None, make_dbs(), [background, review], io, {}))
+
+    assert threading.main_thread() in threads
+
+
+def test_failing_step_stops_the_run(make_dbs):
+    def fail(dbs):
+        raise RuntimeError("boom")
+
+    first = make_step("first", fail)
+    second = make_step("second")
+    io = {first: StepIO(writes=("workspace",)), second: StepIO(reads=("workspace",))}
+    dbs = make_dbs()
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_dag(None, dbs, [first, second], io)
+    assert "second" not in dbs.logs
+
+
+def test_arun_dag_awaits_async_variants(make_dbs):
+    gen = make_step("gen")
+    entrypoint = make_step("entrypoint")
+    awaited = []
+
+    async def agen(ai, dbs):
+        awaited.append("gen")
+        return []
+
+    io = {gen: StepIO(writes=("workspace",)), entrypoint: StepIO(reads=("workspace",))}
+    trace = asyncio.run(arun_dag(None, make_dbs(), [gen, entrypoint], io, {gen: agen}))
+
+    assert awaited == ["gen"]
+    assert trace.critical_path == ["gen", "entrypoint"]
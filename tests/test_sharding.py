@@ -0,0 +1,67 @@
+from gpt_engineer.core.sharding import merge_edits, plan_shards, three_way_merge
+
+
+def test_plan_shards_packs_files_in_path_order():
+    tokens = {"pkg/b.py": 40, "pkg/a.py": 50, "main.py": 30, "big.py": 500}
+
+    shards = plan_shards(tokens, budget=100)
+
+    assert [shard.files for shard in shards] == [
+        ["big.py"],
+        ["main.py", "pkg/a.py"],
+        ["pkg/b.py"],
+    ]
+    assert [shard.tokens for shard in shards] == [500, 80, 40]
+    assert len(plan_shards(tokens, budget=1000)) == 1
+    assert [shard.files for shard in plan_shards({}, budget=100)] == [[]]
+
+
+def test_three_way_merge_combines_separate_edits():
+    base = "a\nb\nc\nd\ne\n"
+    ours = "A\nb\nc\nd\ne\n"
+    theirs = "a\nb\nc\nd\nE\nf\n"
+
+    assert three_way_merge(base, ours, theirs) == "A\nb\nc\nd\nE\nf\n"
+    assert three_way_merge(base, ours, base) == ours
+    assert three_way_merge(base, ours, ours) == ours
+
+
+def test_three_way_merge_detects_overlapping_edits():
+    base = "a\nb\nc\n"
+
+    assert three_way_merge(base, "a\nB\nc\n", "a\nX\nc\n") is None
+    # Edits of adjacent lines are not merged either
+    assert three_way_merge(base, "A\nb\nc\n", "a\nB\nc\n") is None
+    # Unless both sides made the same change along with others
+    assert three_way_merge(base, "A\nb\nc\n", "A\nb\nC\n") == "A\nb\nC\n"
+
+
+def test_merge_edits_drops_edits_of_files_other_shards_own():
+    base = {"a.py": "x = 1\n\n\ny = 2\n", "b.py": "z = 3\n"}
+    edits = [
+        [("a.py", "x = 10\n\n\ny = 2\n"), ("b.py", "z = 30\n"), ("README.md", "one")],
+        [("a.py", "x = 1\n\n\ny = 20\n"), ("b.py", "z = 300\n"), ("README.md", "two")],
+    ]
+
+    result = merge_edits(base, edits, owners=[{"a.py"}, {"b.py"}])
+
+    assert result.files == {
+        "a.py": "x = 10\n\n\ny = 2\n",
+        "b.py": "z = 300\n",
+        "README.md": "one\n\ntwo",
+    }
+    assert result.dropped == {"a.py": [1], "b.py": [0]}
+    assert result.conflicts == {}
+
+
+def test_merge_edits_merges_new_files_of_several_shards():
+    edits = [
+        [("util.py", "a = 1\n\n\nb = 2\n"), ("new.py", "x = 1\n")],
+        [("util.py", "a = 1\n\n\nb = 2\n"), ("new.py", "x = 2\n")],
+    ]
+
+    result = merge_edits({}, edits, owners=[set(), set()])
+
+    assert result.files == {"util.py": "a = 1\n\n\nb = 2\n", "new.py": "x = 1\n"}
+    assert result.conflicts == {"new.py": [0, 1]}
+    assert result.dropped == {}
@@ -0,0 +1,97 @@
+import copy
+import gc
+import json
+
+from gpt_engineer.core import spill
+from gpt_engineer.core.db import DB
+from gpt_engineer.core.spill import SpilledValue, SpillStore
+
+KB = 1 << 10
+
+
+def test_small_values_are_not_spilled():
+    store = SpillStore(budget=100 * KB, threshold=KB)
+
+    assert store.put("small") == "small"
+    assert isinstance(store.put("x" * KB), SpilledValue)
+
+
+def test_least_recently_used_values_are_spilled_and_loaded_back():
+    store = SpillStore(budget=32 * KB, threshold=KB)
+    values = [store.put(char * 10 * KB) for char in "abc"]
+    assert (store.spills, store.loads) == (0, 0)
+
+    assert values[0].load() == "a" * 10 * KB
+    d = store.put("d" * 10 * KB)
+
+    assert store.spills == 1
+    assert repr(values[1]).endswith("on disk>")
+    assert values[1].load() == "b" * 10 * KB
+    assert store.loads == 1
+    assert store.resident_bytes <= store.budget
+    assert [v.load()[0] for v in values + [d]] == ["a", "b", "c", "d"]
+
+
+def test_released_values_free_memory_and_disk():
+    store = SpillStore(budget=15 * KB, threshold=KB)
+    first = store.put("a" * 10 * KB)
+    second = store.put("b" * 10 * KB)
+    assert store.disk_bytes == 10 * KB
+
+    del first, second
+    gc.collect()
+
+    assert (store.resident_bytes, store.disk_bytes) == (0, 0)
+
+
+def test_file_is_compacted_when_mostly_garbage():
+    store = SpillStore(budget=0, threshold=KB)
+    kept = store.put("k" * 10 * KB)
+    for _ in range(2000):
+        store.put("x" * 10 * KB)
+
+    assert store._end < 17 << 20
+    assert kept.load() == "k" * 10 * KB
+
+
+def test_files_load_spilled_values(monkeypatch):
+    monkeypatch.setenv("GPTE_SPILL_BUDGET_MB", "0.01")
+    monkeypatch.setenv("GPTE_SPILL_THRESHOLD_KB", "1")
+    monkeypatch.setattr(spill, "_spill_store", None)
+    body = {}
+    db = DB(body, "workspace")
+    db["main.py"] = "m" * 10 * KB
+    db["big.py"] = "b" * 10 * KB
+    db["small.py"] = "s"
+
+    assert isinstance(dict.__getitem__(body["workspace"], "main.py"), SpilledValue)
+    assert spill.spill_store_from_env().spills >= 1
+    assert db["main.py"] == "m" * 10 * KB
+    assert body["workspace"]["main.py"] == "m" * 10 * KB
+    assert body["workspace"] == {
+        "main.py": "m" * 10 * KB,
+        "big.py": "b" * 10 * KB,
+        "small.py": "s",
+    }
+    assert json.loads(json.dumps(body)) == {
+        "workspace": {"main.py": "m" * 10 * KB, "big.py": "b" * 10 * KB, "small.py": "s"}
+    }
+
+
+def test_copies_of_files_hold_strings(monkeypatch):
+    monkeypatch.setenv("GPTE_SPILL_BUDGET_MB", "0.01")
+    monkeypatch.setenv("GPTE_SPILL_THRESHOLD_KB", "1")
+    monkeypatch.setattr(spill, "_spill_store", None)
+    body = {}
+    db = DB(body, "workspace")
+    db["main.py"] = "m" * 10 * KB
+    files = body["workspace"]
+
+    for copied in [dict(files), {**files}, files.copy(), files | {}, copy.copy(files)]:
+        assert type(copied["main.py"]) is str
+
+    # Copies on write keep the values spilled
+    db.snapshot()
+    db["small.py"] = "s"
+    assert isinstance(dict.__getitem__(body["workspace"], "main.py"), SpilledValue)
+    assert body["workspace"].pop("main.py") == "m" * 10 * KB
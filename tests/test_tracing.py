@@ -0,0 +1,174 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from langchain.schema import AIMessage
+
+from gpt_engineer.core import tracing
+from gpt_engineer.core.scheduler import StepIO, run_dag
+from gpt_engineer.core.tracing import (
+    JsonLinesExporter,
+    OTLPExporter,
+    SpanExporter,
+    Tracer,
+    span,
+)
+
+
+class ListExporter(SpanExporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+    def by_name(self, name):
+        return [s for s in self.spans if s.name == name]
+
+
+@pytest.fixture
+def exporter():
+    exporter = ListExporter()
+    previous = tracing.set_tracer(Tracer([exporter]))
+    yield exporter
+    tracing.set_tracer(previous)
+
+
+def test_spans_nest_and_record_errors(exporter):
+    with span("run") as run:
+        with span("step", **{"step.name": "gen"}) as step:
+            step.add("db.writes", 1)
+            step.add("db.writes", 2)
+        with pytest.raises(ValueError):
+            with span("step", **{"step.name": "broken"}):
+                raise ValueError("boom")
+
+    gen, broken, root = exporter.spans
+    assert root is run and root.parent_id is None
+    assert gen.parent_id == broken.parent_id == run.span_id
+    assert gen.trace_id == broken.trace_id == run.trace_id
+    assert gen.attributes == {"step.name": "gen", "db.writes": 3}
+    assert broken.error == "ValueError: boom" and gen.error is None
+    assert gen.end_ns >= gen.start_ns
+
+
+def test_exporters_must_implement_export():
+    class NoExport(SpanExporter):
+        pass
+
+    with pytest.raises(TypeError):
+        NoExport()
+
+
+def test_tracing_is_off_without_exporters():
+    tracer = Tracer()
+    with tracer.span("run") as run:
+        run.set_attribute("ignored", 1)
+
+    assert not run.recording
+    assert tracing.current_span() is tracing.NON_RECORDING_SPAN
+
+
+def test_json_lines_exporter(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer([JsonLinesExporter(path)])
+    with tracer.span("run"):
+        with tracer.span("llm.chat", **{"llm.model": "gpt-4"}) as chat:
+            chat.add_event("first_token")
+    tracer.close()
+
+    chat_line, run_line = [json.loads(line) for line in path.read_text().splitlines()]
+    assert chat_line["name"] == "llm.chat"
+    assert chat_line["parent_id"] == run_line["span_id"]
+    assert chat_line["attributes"] == {"llm.model": "gpt-4"}
+    assert chat_line["events"][0]["name"] == "first_token"
+    assert run_line["duration_ms"] >= chat_line["duration_ms"]
+
+
+def test_otlp_exporter_posts_to_the_collector():
+    received = []
+
+    class Collector(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append((self.path, json.loads(body)))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Collector)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        exporter = OTLPExporter(f"http://127.0.0.1:{server.server_port}")
+        tracer = Tracer([exporter])
+        with tracer.span("run"):
+            with tracer.span("llm.request", **{"span.kind": "client", "tries": 2}):
+                pass
+        tracer.close()
+    finally:
+        server.shutdown()
+
+    [(path, payload)] = received
+    assert path == "/v1/traces"
+    resource_spans = payload["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"] == [
+        {"key": "service.name", "value": {"stringValue": "gpt-engineer"}}
+    ]
+    request, run = resource_spans["scopeSpans"][0]["spans"]
+    assert request["kind"] == 3 and run["kind"] == 1
+    assert request["parentSpanId"] == run["spanId"] and "parentSpanId" not in run
+    assert request["attributes"] == [{"key": "tries", "value": {"intValue": "2"}}]
+    assert int(request["endTimeUnixNano"]) >= int(request["startTimeUnixNano"])
+    assert len(run["traceId"]) == 32 and len(run["spanId"]) == 16
+
+
+def test_steps_in_the_thread_pool_nest_under_the_run(exporter, make_dbs):
+    def make_step(name):
+        def step(ai, dbs):
+            dbs.workspace[name] = "content"
+            return []
+
+        step.__name__ = name
+        return step
+
+    steps = [make_step("a"), make_step("b")]
+    io = {step: StepIO(writes=(f"workspace/{step.__name__}",)) for step in steps}
+    with span("run") as run:
+        run_dag(None, make_dbs(), steps, io)
+
+    step_spans = exporter.by_name("step")
+    assert {s.attributes["step.name"] for s in step_spans} == {"a", "b"}
+    assert all(s.parent_id == run.span_id for s in step_spans)
+    # The writes of a step and of the runner's log are counted on the step span
+    assert all(s.attributes["db.writes"] == 2 for s in step_spans)
+
+
+def test_chat_completions_are_traced(exporter, make_ai):
+    class StreamingChatModel:
+        def __call__(self, messages, callbacks=None):
+            for callback in callbacks:
+                callback.on_llm_start({}, [], run_id=None)
+                callback.on_llm_new_token("an", run_id=None)
+                callback.on_llm_new_token("swer", run_id=None)
+            return AIMessage(content="answer")
+
+    ai = make_ai(StreamingChatModel())
+
+    ai.start("system prompt", "user prompt", step_name="gen")
+
+    [chat] = exporter.by_name("llm.chat")
+    [request] = exporter.by_name("llm.request")
+    assert request.parent_id == chat.span_id
+    assert chat.attributes["step.name"] == "gen"
+    usage = ai.token_usage_log[-1]
+    assert chat.attributes["llm.prompt_tokens"] == usage.in_step_prompt_tokens
+    assert chat.attributes["llm.completion_tokens"] == usage.in_step_completion_tokens
+    assert chat.attributes["llm.cost_usd"] > 0
+    assert chat.attributes["llm.time_to_first_token_ms"] >= 0
+    assert [event[1] for event in chat.events] == ["first_token"]